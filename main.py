@@ -6,9 +6,17 @@ Sistema Único de Propuesta - Multiagente para ARL Seguros Bolívar
 Este servicio orquesta múltiples agentes de IA para generar propuestas
 comerciales personalizadas de ARL.
 """
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, stream_with_context, url_for
 from datetime import datetime
+import io
+import json
 import os
+import queue
+import re
+import threading
+import unicodedata
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -24,7 +32,12 @@ except Exception as e:
 app = Flask(__name__)
 
 # Importar el orquestador después de cargar secrets
-from src.agents.orquestador import AgenteOrquestador
+from src.agents.orquestador import AgenteOrquestador, EjecucionCanceladaError
+from src.services.cola_trabajos import ColaTrabajos, ColaLlenaError
+from src.services.metricas import CONTENT_TYPE_LATEST, exportar_prometheus
+from src.services.pdf_generator import PDFGenerator
+from src.services.cache_pdf import CachePDF, clave_pdf
+from src.services.almacen_pdf import PDFNoEncontradoError, almacen_desde_entorno
 
 # Inicializar orquestador globalmente
 _orquestador = None
@@ -34,15 +47,112 @@ try:
 except Exception as e:
     print(f"[WARN] Error inicializando AgenteOrquestador: {e}")
 
+# Generador de PDF de /generar-pdf: el mismo del orquestador (un solo pool de procesos)
+_pdf_generator = None
+try:
+    _pdf_generator = _orquestador.pdf_generator if _orquestador else PDFGenerator()
+except Exception as e:
+    print(f"[WARN] Error inicializando PDFGenerator: {e}")
+_cache_pdf = CachePDF.desde_entorno()
+
+# Almacén de los PDF generados por el flujo (servidos desde /pdfs/<pdf_id>)
+_almacen_pdf = _orquestador.almacen_pdf if _orquestador else almacen_desde_entorno()
+
+
+def _agregar_url_pdf(resultado):
+    """Agrega la URL de descarga del PDF almacenado (requiere contexto de request)."""
+    pdf_id = resultado.get("pdf_id")
+    if pdf_id and _almacen_pdf is not None:
+        resultado["pdf_url"] = _almacen_pdf.url(pdf_id) or url_for("descargar_pdf", pdf_id=pdf_id)
+    return resultado
+
+
+def _ejecutar_trabajo(data):
+    """Procesa un trabajo de la cola: retorna el resultado (el PDF queda en el almacén, ver pdf_id)."""
+    start_time = datetime.now()
+    resultado = _orquestador.ejecutar(data)
+    if resultado.get("status") == "error":
+        raise RuntimeError(resultado.get("error", "Error generando la propuesta"))
+    
+    resultado["execution_time_seconds"] = (datetime.now() - start_time).total_seconds()
+    resultado["timestamp"] = datetime.now().isoformat()
+    return resultado
+
+
+# Inicializar la cola de trabajos asíncronos
+_cola_trabajos = None
+if _orquestador:
+    try:
+        _cola_trabajos = ColaTrabajos(_ejecutar_trabajo)
+    except Exception as e:
+        print(f"[WARN] Error inicializando ColaTrabajos: {e}")
+
+
+CAMPOS_REQUERIDOS = [
+    "nombre_empresa",
+    "numero_empleados",
+    "codigo_ciiu",
+    "aportes_mensuales",
+    "porcentaje_reinversion",
+    "enfoque_prioritario",
+    "correo_destinatario"
+]
+
+# Intervalo (segundos) de los comentarios keep-alive del stream SSE
+SSE_KEEPALIVE_SEGUNDOS = 15
+
+# Ejecuciones simultáneas de /run/stream (las demás reciben 429)
+STREAM_MAX_EJECUCIONES = int(os.environ.get("SPU_STREAM_MAX_EJECUCIONES", 8))
+_executor_stream = ThreadPoolExecutor(max_workers=STREAM_MAX_EJECUCIONES, thread_name_prefix="run-stream")
+_cupos_stream = threading.BoundedSemaphore(STREAM_MAX_EJECUCIONES)
+
+
+# Concurrencia por defecto y límites de /run/batch
+BATCH_CONCURRENCIA = int(os.environ.get("SPU_BATCH_CONCURRENCIA", 4))
+BATCH_CONCURRENCIA_MAX = int(os.environ.get("SPU_BATCH_CONCURRENCIA_MAX", 16))
+BATCH_MAX_ITEMS = int(os.environ.get("SPU_BATCH_MAX_ITEMS", 500))
+
+
+def _campos_faltantes(data):
+    """Retorna los campos requeridos ausentes o vacíos del body."""
+    if not isinstance(data, dict):
+        return list(CAMPOS_REQUERIDOS)
+    return [c for c in CAMPOS_REQUERIDOS if c not in data or not data[c]]
+
+
+def _evento_sse(evento, datos):
+    """Serializa un evento en formato Server-Sent Events."""
+    return f"event: {evento}\ndata: {json.dumps(datos, ensure_ascii=False, default=str)}\n\n"
+
 
 @app.route('/health', methods=['GET'])
 def health():
     """Endpoint de health check."""
-    return jsonify({
+    respuesta = {
         "status": "healthy",
         "service": "ms-cv-spu-multiagente",
         "timestamp": datetime.now().isoformat()
-    })
+    }
+    cache_llm = _orquestador.cache_llm if _orquestador else None
+    if cache_llm is not None:
+        respuesta["cache_llm"] = cache_llm.estadisticas()
+    cache_seleccion = _orquestador.cache_seleccion if _orquestador else None
+    if cache_seleccion is not None:
+        respuesta["cache_seleccion"] = cache_seleccion.estadisticas()
+    if _orquestador:
+        respuesta["circuitos_llm"] = _orquestador.circuitos_llm
+    if _cache_pdf is not None:
+        respuesta["cache_pdf"] = _cache_pdf.estadisticas()
+    return jsonify(respuesta)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas de latencia y tokens por paso en formato Prometheus."""
+    contenido = exportar_prometheus()
+    if contenido is None:
+        return jsonify({"error": "prometheus_client no está instalado"}), 501
+    return Response(contenido, mimetype=CONTENT_TYPE_LATEST)
 
 
 @app.route('/run', methods=['POST'])
@@ -68,17 +178,7 @@ def run():
         data = request.get_json()
         
         # Validar campos requeridos
-        campos_requeridos = [
-            "nombre_empresa",
-            "numero_empleados", 
-            "codigo_ciiu",
-            "aportes_mensuales",
-            "porcentaje_reinversion",
-            "enfoque_prioritario",
-            "correo_destinatario"
-        ]
-        
-        campos_faltantes = [c for c in campos_requeridos if c not in data or not data[c]]
+        campos_faltantes = _campos_faltantes(data)
         if campos_faltantes:
             return jsonify({
                 "error": "Campos requeridos faltantes",
@@ -93,7 +193,7 @@ def run():
         resultado["execution_time_seconds"] = execution_time
         resultado["timestamp"] = datetime.now().isoformat()
         
-        return jsonify(resultado)
+        return jsonify(_agregar_url_pdf(resultado))
     
     except Exception as e:
         print(f"[ERROR] Error en /run: {e}")
@@ -102,29 +202,399 @@ def run():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/run/stream', methods=['POST'])
+def run_stream():
+    """
+    Igual que /run, pero responde con Server-Sent Events a medida que
+    se completa cada paso del flujo.
+    
+    Eventos emitidos (data en JSON):
+        validacion, perfil_riesgo, presupuesto, productos, propuesta, pdf:
+            resultado parcial de cada paso
+        resultado: respuesta final (mismo formato de /run)
+        error: error inesperado del flujo
+    """
+    if not _orquestador:
+        return jsonify({"error": "Orquestador no disponible"}), 503
+    
+    data = request.get_json(silent=True)
+    campos_faltantes = _campos_faltantes(data)
+    if campos_faltantes:
+        return jsonify({
+            "error": "Campos requeridos faltantes",
+            "campos_faltantes": campos_faltantes
+        }), 400
+    
+    if not _cupos_stream.acquire(blocking=False):
+        return jsonify({"error": "Demasiadas ejecuciones en curso"}), 429, {"Retry-After": "30"}
+    
+    eventos = queue.Queue()
+    cancelado = threading.Event()
+    
+    def notificar(evento, datos):
+        # Si el cliente se desconectó, el flujo se detiene en el siguiente evento
+        if cancelado.is_set():
+            raise EjecucionCanceladaError()
+        eventos.put((evento, datos))
+    
+    def ejecutar():
+        start_time = datetime.now()
+        try:
+            resultado = _orquestador.ejecutar(data, notificar=notificar)
+            resultado["execution_time_seconds"] = (datetime.now() - start_time).total_seconds()
+            resultado["timestamp"] = datetime.now().isoformat()
+            eventos.put(("resultado", resultado))
+        except Exception as e:
+            print(f"[ERROR] Error en /run/stream: {e}")
+            eventos.put(("error", {"error": str(e)}))
+        finally:
+            _cupos_stream.release()
+            eventos.put(None)
+    
+    try:
+        _executor_stream.submit(ejecutar)
+    except Exception:
+        _cupos_stream.release()
+        raise
+    
+    def generar():
+        try:
+            while True:
+                try:
+                    item = eventos.get(timeout=SSE_KEEPALIVE_SEGUNDOS)
+                except queue.Empty:
+                    # Comentario SSE para que proxies y balanceadores no corten la conexión
+                    yield ": keep-alive\n\n"
+                    continue
+                if item is None:
+                    return
+                evento, datos = item
+                if evento in ("pdf", "resultado"):
+                    _agregar_url_pdf(datos)
+                yield _evento_sse(evento, datos)
+        except GeneratorExit:
+            # El cliente se desconectó: no seguir generando (ni consumiendo tokens)
+            cancelado.set()
+            print("[INFO] Cliente de /run/stream desconectado: se cancela la ejecución")
+            raise
+    
+    return Response(
+        stream_with_context(generar()),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+def _respuesta_trabajo(trabajo):
+    """Agrega al trabajo las URLs de consulta."""
+    trabajo["status_url"] = url_for("obtener_trabajo", job_id=trabajo["job_id"])
+    trabajo["pdf_url"] = url_for("obtener_pdf_trabajo", job_id=trabajo["job_id"])
+    return trabajo
+
+
+@app.route('/jobs', methods=['POST'])
+def crear_trabajo():
+    """
+    Encola la generación de una propuesta y retorna de inmediato el id del trabajo.
+    
+    Mismo body de /run. Reenviar el mismo payload (o el mismo header
+    Idempotency-Key) retorna el trabajo existente en lugar de crear otro.
+    """
+    if not _cola_trabajos:
+        return jsonify({"error": "Cola de trabajos no disponible"}), 503
+    
+    data = request.get_json(silent=True)
+    campos_faltantes = _campos_faltantes(data)
+    if campos_faltantes:
+        return jsonify({
+            "error": "Campos requeridos faltantes",
+            "campos_faltantes": campos_faltantes
+        }), 400
+    
+    try:
+        trabajo, creado = _cola_trabajos.encolar(data, request.headers.get("Idempotency-Key"))
+    except ColaLlenaError as e:
+        return jsonify({"error": "Cola de trabajos llena", "detalle": str(e)}), 429, {"Retry-After": "30"}
+    
+    respuesta = jsonify(_respuesta_trabajo(trabajo))
+    respuesta.status_code = 202 if creado else 200
+    respuesta.headers["Location"] = trabajo["status_url"]
+    return respuesta
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def obtener_trabajo(job_id):
+    """Estado del trabajo y, si terminó, su resultado (mismo formato de /run)."""
+    if not _cola_trabajos:
+        return jsonify({"error": "Cola de trabajos no disponible"}), 503
+    
+    trabajo = _cola_trabajos.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(_respuesta_trabajo(trabajo))
+
+
+@app.route('/jobs/<job_id>/pdf', methods=['GET'])
+def obtener_pdf_trabajo(job_id):
+    """Descarga el PDF de un trabajo completado (desde el almacén de PDF)."""
+    if not _cola_trabajos:
+        return jsonify({"error": "Cola de trabajos no disponible"}), 503
+    
+    trabajo = _cola_trabajos.obtener(job_id)
+    if trabajo is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    
+    pdf_id = _cola_trabajos.obtener_pdf_id(job_id)
+    try:
+        if pdf_id is None or _almacen_pdf is None:
+            raise PDFNoEncontradoError(job_id)
+        tamano = _almacen_pdf.tamano(pdf_id)
+    except PDFNoEncontradoError:
+        return jsonify({"error": "PDF no disponible", "estado": trabajo["estado"]}), 409
+    
+    propuesta = trabajo.get("resultado", {}).get("propuesta", {})
+    nombre_empresa = propuesta.get("propuesta_comercial", {}).get("informacion_cliente", {}).get("nombre_empresa", "ARL")
+    return Response(
+        _almacen_pdf.leer(pdf_id),
+        mimetype='application/pdf',
+        headers={
+            "Content-Length": str(tamano),
+            "Content-Disposition": f"attachment; filename={_nombre_pdf(nombre_empresa)}",
+        },
+        direct_passthrough=True
+    )
+
+
+def _leer_lote():
+    """
+    Lee los formularios del lote: arreglo JSON o NDJSON (un objeto por línea).
+    
+    Returns:
+        Lista de formularios; las líneas NDJSON inválidas quedan como None
+    """
+    texto = request.get_data(as_text=True).strip()
+    if texto.startswith("["):
+        data = json.loads(texto)
+        return [d if isinstance(d, dict) else None for d in data]
+    
+    formularios = []
+    for linea in texto.splitlines():
+        if not linea.strip():
+            continue
+        try:
+            d = json.loads(linea)
+            formularios.append(d if isinstance(d, dict) else None)
+        except ValueError:
+            formularios.append(None)
+    return formularios
+
+
+class _BufferZip(io.RawIOBase):
+    """Destino no seekable de zipfile: acumula los bytes escritos para hacer streaming."""
+    
+    def __init__(self):
+        super().__init__()
+        self._partes = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, b):
+        self._partes.append(bytes(b))
+        return len(b)
+    
+    def vaciar(self):
+        datos = b"".join(self._partes)
+        self._partes = []
+        return datos
+
+
+def _nombre_pdf(nombre_empresa):
+    """Nombre de archivo ASCII seguro (sin comillas, saltos de línea ni rutas) para el PDF de una empresa."""
+    nombre = unicodedata.normalize("NFKD", str(nombre_empresa or "ARL")).encode("ascii", "ignore").decode()
+    nombre = re.sub(r"[^\w.-]+", "_", nombre, flags=re.ASCII).strip("_.")
+    return f"Propuesta_{nombre or 'ARL'}.pdf"
+
+
+def _nombre_pdf_lote(indice, datos):
+    return f"{indice + 1:04d}_{_nombre_pdf(datos.get('nombre_empresa'))}"
+
+
+@app.route('/run/batch', methods=['POST'])
+def run_batch():
+    """
+    Genera propuestas para un lote de clientes.
+    
+    Body: arreglo JSON o NDJSON con formularios iguales al body de /run.
+    
+    Query params:
+        concurrencia: propuestas en paralelo (SPU_BATCH_CONCURRENCIA por defecto)
+        formato: "ndjson" (por defecto) o "zip"
+    
+    Responde en streaming a medida que termina cada cliente:
+        ndjson: una línea JSON por cliente con su "indice" en el lote
+        zip: un PDF por propuesta exitosa y resultados.ndjson al final
+    """
+    if not _orquestador:
+        return jsonify({"error": "Orquestador no disponible"}), 503
+    
+    try:
+        formularios = _leer_lote()
+    except ValueError as e:
+        return jsonify({"error": f"Lote inválido: {e}"}), 400
+    
+    if not formularios:
+        return jsonify({"error": "El lote está vacío"}), 400
+    if len(formularios) > BATCH_MAX_ITEMS:
+        return jsonify({"error": f"El lote supera el máximo de {BATCH_MAX_ITEMS} clientes"}), 413
+    
+    try:
+        concurrencia = int(request.args.get("concurrencia", BATCH_CONCURRENCIA))
+    except ValueError:
+        return jsonify({"error": "concurrencia debe ser un entero"}), 400
+    concurrencia = max(1, min(concurrencia, BATCH_CONCURRENCIA_MAX))
+    
+    formato = request.args.get("formato", "ndjson").lower()
+    if formato not in ("ndjson", "zip"):
+        return jsonify({"error": "formato debe ser 'ndjson' o 'zip'"}), 400
+    
+    # Los formularios inválidos se reportan sin ejecutar el flujo
+    invalidos = []
+    validos = []
+    for i, datos in enumerate(formularios):
+        faltantes = _campos_faltantes(datos)
+        if faltantes:
+            invalidos.append((i, {
+                "status": "error",
+                "error": "Campos requeridos faltantes",
+                "campos_faltantes": faltantes
+            }))
+        else:
+            validos.append(i)
+    
+    def resultados():
+        yield from invalidos
+        lote = [formularios[i] for i in validos]
+        for posicion, resultado in _orquestador.ejecutar_lote(lote, concurrencia, incluir_pdf=formato == "zip"):
+            yield validos[posicion], resultado
+    
+    def linea(indice, resultado):
+        datos = formularios[indice] or {}
+        registro = {"indice": indice, "nombre_empresa": datos.get("nombre_empresa"), **resultado}
+        return json.dumps(registro, ensure_ascii=False, default=str) + "\n"
+    
+    print(f"[INFO] Lote recibido: {len(formularios)} clientes, concurrencia {concurrencia}, formato {formato}")
+    
+    if formato == "ndjson":
+        return Response(
+            (linea(i, r) for i, r in resultados()),
+            mimetype='application/x-ndjson',
+            headers={"X-Accel-Buffering": "no"}
+        )
+    
+    def generar_zip():
+        buffer = _BufferZip()
+        lineas = []
+        with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED) as archivo:
+            for indice, resultado in resultados():
+                pdf_bytes = resultado.pop("pdf_bytes", None)
+                if pdf_bytes:
+                    nombre = _nombre_pdf_lote(indice, formularios[indice])
+                    archivo.writestr(nombre, pdf_bytes)
+                    resultado["archivo_pdf"] = nombre
+                lineas.append(linea(indice, resultado))
+                yield buffer.vaciar()
+            archivo.writestr("resultados.ndjson", "".join(lineas))
+        yield buffer.vaciar()
+    
+    return Response(
+        generar_zip(),
+        mimetype='application/zip',
+        headers={"Content-Disposition": "attachment; filename=propuestas.zip"}
+    )
+
+
+@app.route('/pdfs/<pdf_id>', methods=['GET'])
+def descargar_pdf(pdf_id):
+    """
+    Descarga un PDF generado por /run (id = hash de su contenido).
+    Soporta Range (descargas parciales y reanudables) e If-None-Match.
+    """
+    if _almacen_pdf is None:
+        return jsonify({"error": "Almacén de PDF no disponible"}), 503
+    try:
+        tamano = _almacen_pdf.tamano(pdf_id)
+    except PDFNoEncontradoError:
+        return jsonify({"error": "PDF no encontrado"}), 404
+    
+    # El contenido de un id nunca cambia
+    headers = {
+        "ETag": f'"{pdf_id}"',
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if request.if_none_match.contains(pdf_id):
+        return Response(status=304, headers=headers)
+    
+    inicio, fin, estado = 0, tamano, 200
+    rango = request.range
+    if rango is not None and request.if_range.etag in (None, pdf_id):
+        limites = rango.range_for_length(tamano)
+        if limites is None:
+            return Response(status=416, headers={**headers, "Content-Range": f"bytes */{tamano}"})
+        inicio, fin = limites
+        estado = 206
+        headers["Content-Range"] = f"bytes {inicio}-{fin - 1}/{tamano}"
+    
+    headers["Content-Length"] = str(fin - inicio)
+    headers["Content-Disposition"] = f"attachment; filename=Propuesta_{pdf_id[:12]}.pdf"
+    return Response(
+        _almacen_pdf.leer(pdf_id, inicio, fin),
+        status=estado,
+        mimetype='application/pdf',
+        headers=headers,
+        direct_passthrough=True
+    )
+
+
 @app.route('/generar-pdf', methods=['POST'])
 def generar_pdf():
     """
     Endpoint para generar solo el PDF sin ejecutar todo el flujo.
     Útil para regenerar PDFs de propuestas ya procesadas.
     """
+    if not _pdf_generator:
+        return jsonify({"error": "Generador de PDF no disponible"}), 503
+    
     try:
         data = request.get_json()
         
-        from src.services.pdf_generator import PDFGenerator
-        pdf_generator = PDFGenerator()
-        
-        pdf_bytes = pdf_generator.generar_pdf(data)
+        # El mismo JSON con el mismo template produce el mismo PDF
+        clave = clave_pdf(data, _pdf_generator.version_template)
+        if request.if_none_match.contains_weak(clave):
+            return Response(status=304, headers={"ETag": f'W/"{clave}"', "Cache-Control": "private, no-cache"})
         
-        from flask import send_file
-        import io
+        pdf_bytes = _cache_pdf.obtener(clave) if _cache_pdf is not None else None
+        estado_cache = "HIT" if pdf_bytes is not None else "MISS"
+        if pdf_bytes is None:
+            pdf_bytes = _pdf_generator.generar_pdf(data)
+            if _cache_pdf is not None:
+                _cache_pdf.guardar(clave, pdf_bytes)
         
-        return send_file(
+        respuesta = send_file(
             io.BytesIO(pdf_bytes),
             mimetype='application/pdf',
             as_attachment=True,
-            download_name=f"Propuesta_{data.get('nombre_empresa', 'ARL')}.pdf"
+            download_name=f"Propuesta_{data.get('nombre_empresa', 'ARL')}.pdf",
+            etag=False
         )
+        respuesta.set_etag(clave, weak=True)
+        respuesta.headers["Cache-Control"] = "private, no-cache"
+        respuesta.headers["X-Cache"] = estado_cache
+        return respuesta
     
     except Exception as e:
         print(f"[ERROR] Error generando PDF: {e}")
@@ -36,18 +36,22 @@ print("=" * 60)
 def test_catalogo():
     """Prueba la conexión al catálogo de Automy."""
     print("\n📦 Probando conexión al catálogo de productos...")
-    from src.services.catalogo_service import CatalogoService
+    from src.services.catalogo_service import CatalogoService, CatalogoNoDisponibleError
     
     catalogo = CatalogoService()
-    productos = catalogo.obtener_catalogo()
+    try:
+        productos = catalogo.obtener_catalogo()
+    except CatalogoNoDisponibleError as e:
+        print(f"   ❌ Error cargando catálogo: {e}")
+        return False
     
     if productos:
         print(f"   ✅ Catálogo cargado: {len(productos)} productos")
-        # Mostrar algunas categorías
-        categorias = set(p.get("categoria_de_programas", "Sin categoría") for p in productos)
+        # Mostrar algunas categorías (índice precalculado del catálogo)
+        categorias = catalogo.categorias()
         print(f"   📁 Categorías disponibles: {len(categorias)}")
-        for cat in list(categorias)[:5]:
-            print(f"      - {cat}")
+        for cat, cantidad in list(categorias.items())[:5]:
+            print(f"      - {cat or 'Sin categoría'} ({cantidad})")
         return True
     else:
         print("   ❌ Error cargando catálogo")
@@ -105,6 +109,7 @@ def test_flujo_completo():
             print("\n   ✅ Flujo completado exitosamente!")
             print(f"   📄 PDF generado: {resultado.get('pdf_generado')}")
             print(f"   📊 Tamaño PDF: {resultado.get('pdf_size_bytes', 0):,} bytes")
+            print(f"   🗂️  PDF almacenado: {resultado.get('pdf_id')}")
             
             # Guardar resultado JSON
             output_file = f"output/resultado_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
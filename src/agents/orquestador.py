@@ -1,17 +1,173 @@
 """
 Agente Orquestador - Coordina el flujo completo de generación de propuestas.
 """
-from typing import Dict, Any
+import os
+import time
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Callable, Iterator, Tuple
 from datetime import datetime
 
 from ..services.llm_service import LLMService
-from ..services.catalogo_service import CatalogoService
+from ..services.cache_llm import CacheLLM
+from ..services.catalogo_service import CatalogoService, CatalogoNoDisponibleError
+from ..services.tabla_catalogo import TablaCatalogo, id_producto
 from ..services.pdf_generator import PDFGenerator
+from ..services.almacen_pdf import AlmacenPDF, almacen_desde_entorno
+from ..services.cache_seleccion import CacheSeleccion
+from ..services.combinador_rankings import combinar_rankings
+from ..services.validador_datos import validar_datos_entrada
+from ..services.indice_ciiu import IndiceCIIU, perfil_desde_indice
+from ..services.obligaciones_sst import MotorObligaciones, tramo_trabajadores
+from ..services.optimizador_presupuesto import asignar_presupuesto, CAMPOS_TARIFA
+from ..services.ensamblador_propuesta import ensamblar_propuesta
+from ..services.memo_compartido import MemoCompartido
+from ..services.metricas import medir_ejecucion, registrar_paso
 
-from ..prompts.prompt_recolector import SYSTEM_PROMPT_RECOLECTOR, get_prompt_recolector
-from ..prompts.prompt_perfil_riesgo import SYSTEM_PROMPT_PERFIL_RIESGO, get_prompt_perfil_riesgo
-from ..prompts.prompt_selector_productos import SYSTEM_PROMPT_SELECTOR_PRODUCTOS, get_prompt_selector_productos
-from ..prompts.prompt_documentador import SYSTEM_PROMPT_DOCUMENTADOR, get_prompt_documentador
+from ..prompts.prompt_recolector import SYSTEM_PROMPT_RECOLECTOR, SCHEMA_RECOLECTOR, get_prompt_recolector
+from ..prompts.prompt_perfil_riesgo import SYSTEM_PROMPT_PERFIL_RIESGO, SCHEMA_PERFIL_RIESGO, get_prompt_perfil_riesgo
+from ..prompts.prompt_selector_productos import (
+    SYSTEM_PROMPTS_SELECTOR, SCHEMAS_SELECTOR, SECCIONES_SUBAGENTE, get_prompt_selector_productos
+)
+from ..prompts.prompt_documentador import SYSTEM_PROMPT_DOCUMENTADOR, SCHEMA_DOCUMENTADOR, get_prompt_documentador
+
+
+# Campos del catálogo que se conservan en cada producto de la propuesta
+CAMPOS_PRODUCTO = (
+    "categoria_de_programas",
+    "descripcion_programas_de_prevencion",
+    "subcategoria",
+    "tema",
+    "tipo",
+) + CAMPOS_TARIFA
+
+
+# Listas del ranking del selector, en el orden de la respuesta
+SECCIONES_RANKING = ("productos_obligatorios", "productos_prioritarios", "valores_agregados")
+
+
+# Número de candidatos por categoría que se envían al selector (top-k por relevancia)
+CUPOS_CANDIDATOS = {
+    "DIFERENCIAL": 30,
+    "Programa de Prevención": 6,
+    "Medicina Preventiva y del Trabajo": 4,
+    "Laboratorio Clínico": 4,
+    "HIGIENE": 4,
+    "Vacunación": 2,
+    "VALOR AGREGADO": 20,
+    "Profesionales": 4,
+    "Asesor de Gestión del Riesgo": 2,
+    "Administrativo": 1,
+}
+
+
+# Sub-agentes del selector (se ejecutan en paralelo) y las categorías de sus
+# candidatos; el orden define cómo se combinan sus rankings
+CATEGORIAS_SUBAGENTE = {
+    "obligatorios": ("DIFERENCIAL",),
+    "prioritarios": (
+        "Programa de Prevención",
+        "Medicina Preventiva y del Trabajo",
+        "Laboratorio Clínico",
+        "HIGIENE",
+        "Vacunación",
+    ),
+    "valores_agregados": ("VALOR AGREGADO",),
+    "profesionales": ("Profesionales", "Asesor de Gestión del Riesgo", "Administrativo"),
+}
+
+
+def _flag_entorno(nombre: str, default: bool = False) -> bool:
+    """Lee una variable de entorno booleana ("1", "true", "si")."""
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return default
+    return valor.strip().lower() in ("1", "true", "si", "sí", "yes")
+
+
+# Callback de progreso: notificar(evento, datos). Si lanza
+# EjecucionCanceladaError, la ejecución se detiene en ese punto.
+Notificador = Callable[[str, Dict[str, Any]], None]
+
+
+class EjecucionCanceladaError(Exception):
+    """El consumidor abandonó la ejecución (p. ej. el cliente SSE se desconectó)."""
+
+
+def _notificar(notificar: Optional[Notificador], evento: str, datos: Dict[str, Any]):
+    """Invoca el callback de progreso sin dejar que sus errores afecten el flujo (salvo la cancelación)."""
+    if notificar is None:
+        return
+    try:
+        notificar(evento, datos)
+    except EjecucionCanceladaError:
+        raise
+    except Exception as e:
+        print(f"[WARN] Error notificando evento '{evento}': {e}")
+
+
+class _RankingIncremental:
+    """Hidrata los productos del selector a medida que llegan en streaming."""
+    
+    def __init__(
+        self,
+        hidratar: Callable[[Any, set], Optional[Dict[str, Any]]],
+        notificar: Optional[Notificador],
+        secciones: Tuple[str, ...] = SECCIONES_RANKING,
+        subagente: Optional[str] = None
+    ):
+        self._hidratar = hidratar
+        self._notificar = notificar
+        self._subagente = subagente
+        self._recibidos = {seccion: 0 for seccion in secciones}
+        self._vistos = {seccion: set() for seccion in secciones}
+        self._secciones = {seccion: [] for seccion in secciones}
+    
+    def agregar(self, seccion: str, producto: Any):
+        """Callback del streaming: hidrata un producto (id u objeto) y lo notifica."""
+        if seccion not in self._secciones:
+            return
+        self._recibidos[seccion] += 1
+        registro = self._hidratar(producto, self._vistos[seccion])
+        if registro is None:
+            return
+        self._secciones[seccion].append(registro)
+        evento = {
+            "seccion": seccion,
+            "posicion": len(self._secciones[seccion]),
+            "producto": registro
+        }
+        if self._subagente is not None:
+            evento["subagente"] = self._subagente
+        _notificar(self._notificar, "producto", evento)
+    
+    def hidratados(self, ranking: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """Secciones hidratadas que coinciden con la respuesta final completa."""
+        return {
+            seccion: productos for seccion, productos in self._secciones.items()
+            if self._recibidos[seccion] == len(ranking.get(seccion) or [])
+        }
+
+
+@contextmanager
+def _medir(tiempos: Dict[str, float], paso: str):
+    """Registra en `tiempos` (y en las métricas) la duración en segundos de un paso."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        tiempos[paso] = round(duracion, 4)
+        registrar_paso(paso, duracion)
+
+
+async def _medir_async(tiempos: Dict[str, float], paso: str, awaitable) -> Any:
+    """Espera `awaitable` registrando su duración en `tiempos`."""
+    with _medir(tiempos, paso):
+        return await awaitable
 
 
 class AgenteOrquestador:
@@ -20,160 +176,890 @@ class AgenteOrquestador:
     Coordina los 4 sub-agentes para generar propuestas comerciales.
     """
     
-    def __init__(self):
+    def __init__(
+        self,
+        recolector_llm: Optional[bool] = None,
+        documentador_llm: Optional[bool] = None,
+        ejecucion_async: Optional[bool] = None,
+        streaming: Optional[bool] = None,
+        almacen_pdf: Optional[AlmacenPDF] = None,
+        cache_seleccion: Optional[CacheSeleccion] = None
+    ):
+        """
+        Args:
+            recolector_llm: Si True, valida los datos con el agente recolector (LLM)
+                en lugar del validador local. Por defecto lee SPU_RECOLECTOR_LLM.
+            documentador_llm: Si True, consolida la propuesta con el agente
+                documentador (LLM) en lugar del ensamblador local.
+                Por defecto lee SPU_DOCUMENTADOR_LLM.
+            ejecucion_async: Si True, ejecutar() corre el flujo con asyncio y ejecuta
+                en paralelo los pasos independientes. Por defecto lee SPU_EJECUCION_ASYNC.
+            streaming: Si True, el selector recibe la respuesta del LLM en streaming
+                y procesa cada producto apenas llega. Por defecto lee SPU_LLM_STREAMING
+                (activo).
+            almacen_pdf: Almacén donde se guardan los PDF generados. Por defecto
+                según SPU_PDF_ALMACEN (disco local).
+            cache_seleccion: Cache de rankings del selector por perfil de riesgo.
+                Por defecto según SPU_SELECCION_CACHE (activa).
+        """
+        # El pool de PDF se crea (fork) antes de que otros servicios inicien hilos
+        self._pdf_generator = PDFGenerator()
         self._llm = LLMService()
         self._catalogo = CatalogoService()
-        self._pdf_generator = PDFGenerator()
+        self._almacen_pdf = almacen_pdf if almacen_pdf is not None else almacen_desde_entorno()
+        self._cache_seleccion = cache_seleccion if cache_seleccion is not None else CacheSeleccion.desde_entorno()
+        self._indice_ciiu = IndiceCIIU()
+        self._obligaciones = MotorObligaciones()
+        
+        self._recolector_llm = (
+            recolector_llm if recolector_llm is not None
+            else _flag_entorno("SPU_RECOLECTOR_LLM")
+        )
+        self._documentador_llm = (
+            documentador_llm if documentador_llm is not None
+            else _flag_entorno("SPU_DOCUMENTADOR_LLM")
+        )
+        self._ejecucion_async = (
+            ejecucion_async if ejecucion_async is not None
+            else _flag_entorno("SPU_EJECUCION_ASYNC")
+        )
+        self._streaming = (
+            streaming if streaming is not None
+            else _flag_entorno("SPU_LLM_STREAMING", default=True)
+        )
+        
+        # Event loop dedicado para el modo asíncrono (el cliente aio se reutiliza entre requests)
+        self._loop = None
+        self._loop_lock = threading.Lock()
         
         print("[OK] AgenteOrquestador inicializado con todos los servicios")
     
-    def ejecutar(self, datos_entrada: Dict[str, Any]) -> Dict[str, Any]:
+    @property
+    def cache_llm(self) -> Optional[CacheLLM]:
+        """Cache de respuestas del LLM (None si está desactivada)."""
+        return getattr(self._llm, "cache", None)
+    
+    @property
+    def pdf_generator(self) -> PDFGenerator:
+        """Generador de PDF del flujo (compartido con /generar-pdf para usar un solo pool)."""
+        return self._pdf_generator
+    
+    @property
+    def almacen_pdf(self) -> Optional[AlmacenPDF]:
+        """Almacén de los PDF generados (None si no se guardan)."""
+        return self._almacen_pdf
+    
+    @property
+    def cache_seleccion(self) -> Optional[CacheSeleccion]:
+        """Cache de selecciones de productos (None si está desactivada)."""
+        return self._cache_seleccion
+    
+    @property
+    def circuitos_llm(self) -> Dict[str, str]:
+        """Estado del circuit breaker de cada modelo usado."""
+        resiliencia = getattr(self._llm, "resiliencia", None)
+        return resiliencia.estado() if resiliencia is not None else {}
+    
+    def ejecutar(
+        self,
+        datos_entrada: Dict[str, Any],
+        notificar: Optional[Notificador] = None,
+        incluir_pdf: bool = False,
+        memo_perfiles: Optional[MemoCompartido] = None
+    ) -> Dict[str, Any]:
         """
         Ejecuta el flujo completo de generación de propuesta.
         
         Args:
             datos_entrada: Datos del formulario inicial
+            notificar: Callback opcional notificar(evento, datos) que se invoca
+                al completar cada paso (validacion, perfil_riesgo, presupuesto,
+                productos, propuesta, pdf); si lanza EjecucionCanceladaError, la
+                ejecución se detiene con status "cancelado"
+            incluir_pdf: Si es True, el resultado incluye los bytes del PDF en "pdf_bytes"
+            memo_perfiles: Memo compartido entre ejecuciones de un lote; reutiliza
+                el perfil de riesgo por (CIIU, actividad, tramo de trabajadores)
             
         Returns:
-            Resultado con la propuesta comercial y PDF
+            Resultado con la propuesta comercial, PDF, tiempos por paso y
+            métricas de las llamadas al LLM
         """
-        print("\n" + "="*60)
-        print(">>> INICIANDO GENERACION DE PROPUESTA")
-        print("="*60)
-        print(f"   Empresa: {datos_entrada.get('nombre_empresa')}")
-        print(f"   Empleados: {datos_entrada.get('numero_empleados')}")
+        if self._ejecucion_async:
+            return self._ejecutar_en_loop(
+                self.ejecutar_async(datos_entrada, notificar, incluir_pdf, memo_perfiles)
+            )
+        
+        with medir_ejecucion() as metricas:
+            resultado = self._ejecutar_pasos(datos_entrada, notificar, incluir_pdf, memo_perfiles)
+        resultado["metricas"] = metricas.resumen()
+        return resultado
+    
+    def _ejecutar_pasos(
+        self,
+        datos_entrada: Dict[str, Any],
+        notificar: Optional[Notificador],
+        incluir_pdf: bool,
+        memo_perfiles: Optional[MemoCompartido]
+    ) -> Dict[str, Any]:
+        """Pasos del flujo síncrono (ver ejecutar)."""
+        self._imprimir_inicio(datos_entrada)
+        tiempos: Dict[str, float] = {}
         
         try:
             # PASO 1: Recolectar y validar datos
             print("\n[PASO 1] Validando datos del cliente...")
-            resultado_recolector = self._ejecutar_recolector(datos_entrada)
+            with _medir(tiempos, "validacion"):
+                resultado_recolector = self._ejecutar_recolector(datos_entrada)
             
-            if resultado_recolector.get("proximo_paso") == "solicitar_datos_faltantes":
-                return {
-                    "status": "error",
-                    "error": "Datos faltantes",
-                    "datos_faltantes": resultado_recolector.get("datos_faltantes"),
-                    "mensaje": resultado_recolector.get("mensaje")
-                }
+            _notificar(notificar, "validacion", resultado_recolector)
+            error = self._error_validacion(resultado_recolector)
+            if error:
+                return {**error, "tiempos_pasos": tiempos}
             
             print("   [OK] Datos validados correctamente")
             
             # PASO 2: Identificar perfil de riesgo
             print("\n[PASO 2] Identificando perfil de riesgo...")
-            resultado_perfil = self._ejecutar_perfil_riesgo(datos_entrada)
+            with _medir(tiempos, "perfil_riesgo"):
+                resultado_perfil = self._ejecutar_perfil_riesgo(datos_entrada, memo_perfiles)
             
-            if resultado_perfil.get("proximo_paso") == "Error_Perfilamiento":
-                return {
-                    "status": "error",
-                    "error": "No se pudo determinar el perfil de riesgo"
-                }
+            _notificar(notificar, "perfil_riesgo", resultado_perfil)
+            error = self._error_perfil(resultado_perfil)
+            if error:
+                return {**error, "tiempos_pasos": tiempos}
             
             print(f"   [OK] Clase de riesgo: {resultado_perfil.get('clase_riesgo')}")
             
             # PASO 3: Calcular presupuesto anual
-            print("\n[PASO 3] Calculando presupuesto...")
-            aportes = float(datos_entrada.get("aportes_mensuales", 0))
-            porcentaje = float(datos_entrada.get("porcentaje_reinversion", 0))
-            presupuesto_anual = aportes * 12 * (porcentaje / 100)
-            
-            print(f"   [OK] Presupuesto anual: ${presupuesto_anual:,.0f}")
-            
-            # Combinar datos para el siguiente paso
-            datos_combinados = {
-                **datos_entrada,
-                "presupuesto_anual": presupuesto_anual,
-                "clase_riesgo": resultado_perfil.get("clase_riesgo"),
-                "riesgos_generales": resultado_perfil.get("riesgos_generales", []),
-                "obligaciones_legales": resultado_perfil.get("Obligaciones_legales", [])
-            }
+            datos_combinados = self._combinar_perfil(datos_entrada, resultado_perfil)
+            _notificar(notificar, "presupuesto", {"presupuesto_anual": datos_combinados["presupuesto_anual"]})
+            
+            # Catálogo de productos (en memoria, snapshot o descarga)
+            error = self._error_catalogo(tiempos)
+            if error:
+                return {**error, "tiempos_pasos": tiempos}
             
             # PASO 4: Seleccionar productos
             print("\n[PASO 4] Seleccionando productos...")
-            resultado_productos = self._ejecutar_selector_productos(datos_combinados)
-            
-            print(f"   [OK] Productos obligatorios: {len(resultado_productos.get('productos_obligatorios', []))}")
-            print(f"   [OK] Productos prioritarios: {len(resultado_productos.get('productos_prioritarios', []))}")
-            print(f"   [OK] Valores agregados: {len(resultado_productos.get('valores_agregados', []))}")
-            
-            # Combinar con productos seleccionados
-            datos_finales = {
-                **datos_combinados,
-                "productos_obligatorios": resultado_productos.get("productos_obligatorios", []),
-                "productos_prioritarios": resultado_productos.get("productos_prioritarios", []),
-                "valores_agregados": resultado_productos.get("valores_agregados", []),
-                "resumen_presupuesto": resultado_productos.get("resumen_presupuesto", {})
-            }
+            with _medir(tiempos, "selector_productos"):
+                resultado_productos = self._ejecutar_selector_productos(datos_combinados, notificar)
+            
+            datos_finales = self._combinar_productos(datos_combinados, resultado_productos)
+            _notificar(notificar, "productos", resultado_productos)
             
             # PASO 5: Generar documento final
             print("\n[PASO 5] Generando propuesta consolidada...")
-            propuesta_final = self._ejecutar_documentador(datos_finales)
+            with _medir(tiempos, "documentador"):
+                propuesta_final = self._ejecutar_documentador(datos_finales)
             
             print("   [OK] Propuesta consolidada generada")
+            _notificar(notificar, "propuesta", propuesta_final)
             
             # PASO 6: Generar PDF
             print("\n[PASO 6] Generando PDF...")
-            pdf_bytes = self._pdf_generator.generar_pdf(propuesta_final)
+            with _medir(tiempos, "pdf"):
+                pdf_bytes = self._pdf_generator.generar_pdf(propuesta_final)
+            pdf_id = self._guardar_pdf(pdf_bytes)
             
-            print("   [OK] PDF generado exitosamente")
+            _notificar(notificar, "pdf", {"pdf_generado": True, "pdf_size_bytes": len(pdf_bytes), "pdf_id": pdf_id})
+            return self._resultado_exitoso(propuesta_final, pdf_bytes, tiempos, incluir_pdf, pdf_id)
             
-            print("\n" + "="*60)
-            print("[SUCCESS] PROPUESTA COMERCIAL GENERADA EXITOSAMENTE")
-            print("="*60 + "\n")
+        except EjecucionCanceladaError:
+            return self._resultado_cancelado(tiempos)
+        except Exception as e:
+            return self._resultado_error(e, tiempos)
+    
+    async def ejecutar_async(
+        self,
+        datos_entrada: Dict[str, Any],
+        notificar: Optional[Notificador] = None,
+        incluir_pdf: bool = False,
+        memo_perfiles: Optional[MemoCompartido] = None
+    ) -> Dict[str, Any]:
+        """
+        Ejecuta el flujo completo con asyncio.
+        
+        La validación, el perfil de riesgo y la carga del catálogo son
+        independientes y se ejecutan en paralelo; si la validación falla se
+        cancelan los demás pasos.
+        
+        Args:
+            datos_entrada: Datos del formulario inicial
+            notificar: Callback opcional notificar(evento, datos) por cada paso
+            incluir_pdf: Si es True, el resultado incluye los bytes del PDF en "pdf_bytes"
+            memo_perfiles: Memo compartido del perfil de riesgo (ver ejecutar)
             
-            return {
-                "status": "success",
-                "propuesta": propuesta_final,
-                "pdf_generado": True,
-                "pdf_size_bytes": len(pdf_bytes)
-            }
+        Returns:
+            Resultado con la propuesta comercial, PDF, tiempos por paso y
+            métricas de las llamadas al LLM
+        """
+        with medir_ejecucion() as metricas:
+            resultado = await self._ejecutar_pasos_async(datos_entrada, notificar, incluir_pdf, memo_perfiles)
+        resultado["metricas"] = metricas.resumen()
+        return resultado
+    
+    async def _ejecutar_pasos_async(
+        self,
+        datos_entrada: Dict[str, Any],
+        notificar: Optional[Notificador],
+        incluir_pdf: bool,
+        memo_perfiles: Optional[MemoCompartido]
+    ) -> Dict[str, Any]:
+        """Pasos del flujo asíncrono (ver ejecutar_async)."""
+        self._imprimir_inicio(datos_entrada)
+        tiempos: Dict[str, float] = {}
+        pendientes: List[asyncio.Task] = []
+        
+        try:
+            # PASOS 1 y 2 en paralelo, junto con la carga del catálogo
+            print("\n[PASOS 1-2] Validando datos e identificando perfil de riesgo en paralelo...")
+            tarea_validacion = asyncio.create_task(
+                _medir_async(tiempos, "validacion", self._ejecutar_recolector_async(datos_entrada))
+            )
+            tarea_perfil = asyncio.create_task(
+                _medir_async(tiempos, "perfil_riesgo", self._ejecutar_perfil_riesgo_async(datos_entrada, memo_perfiles))
+            )
+            tarea_catalogo = asyncio.create_task(
+                _medir_async(tiempos, "catalogo", asyncio.to_thread(self._catalogo.obtener_catalogo))
+            )
+            pendientes = [tarea_validacion, tarea_perfil, tarea_catalogo]
+            
+            resultado_recolector = await tarea_validacion
+            _notificar(notificar, "validacion", resultado_recolector)
+            error = self._error_validacion(resultado_recolector)
+            if error:
+                tarea_perfil.cancel()
+                tarea_catalogo.cancel()
+                return {**error, "tiempos_pasos": tiempos}
+            
+            print("   [OK] Datos validados correctamente")
             
+            resultado_perfil = await tarea_perfil
+            _notificar(notificar, "perfil_riesgo", resultado_perfil)
+            error = self._error_perfil(resultado_perfil)
+            if error:
+                tarea_catalogo.cancel()
+                return {**error, "tiempos_pasos": tiempos}
+            
+            print(f"   [OK] Clase de riesgo: {resultado_perfil.get('clase_riesgo')}")
+            
+            # PASO 3: Calcular presupuesto anual
+            datos_combinados = self._combinar_perfil(datos_entrada, resultado_perfil)
+            _notificar(notificar, "presupuesto", {"presupuesto_anual": datos_combinados["presupuesto_anual"]})
+            try:
+                await tarea_catalogo
+            except CatalogoNoDisponibleError as e:
+                return {**self._respuesta_error_catalogo(e), "tiempos_pasos": tiempos}
+            
+            # PASO 4: Seleccionar productos
+            print("\n[PASO 4] Seleccionando productos...")
+            resultado_productos = await _medir_async(
+                tiempos, "selector_productos", self._ejecutar_selector_productos_async(datos_combinados, notificar)
+            )
+            
+            datos_finales = self._combinar_productos(datos_combinados, resultado_productos)
+            _notificar(notificar, "productos", resultado_productos)
+            
+            # PASO 5: Generar documento final
+            print("\n[PASO 5] Generando propuesta consolidada...")
+            propuesta_final = await _medir_async(
+                tiempos, "documentador", self._ejecutar_documentador_async(datos_finales)
+            )
+            
+            print("   [OK] Propuesta consolidada generada")
+            _notificar(notificar, "propuesta", propuesta_final)
+            
+            # PASO 6: Generar PDF
+            print("\n[PASO 6] Generando PDF...")
+            pdf_bytes = await _medir_async(
+                tiempos, "pdf", self._pdf_generator.generar_pdf_async(propuesta_final)
+            )
+            pdf_id = await asyncio.to_thread(self._guardar_pdf, pdf_bytes)
+            
+            _notificar(notificar, "pdf", {"pdf_generado": True, "pdf_size_bytes": len(pdf_bytes), "pdf_id": pdf_id})
+            return self._resultado_exitoso(propuesta_final, pdf_bytes, tiempos, incluir_pdf, pdf_id)
+            
+        except EjecucionCanceladaError:
+            for tarea in pendientes:
+                tarea.cancel()
+            return self._resultado_cancelado(tiempos)
         except Exception as e:
-            print(f"\n[ERROR] Error en orquestador: {e}")
-            import traceback
-            traceback.print_exc()
+            for tarea in pendientes:
+                tarea.cancel()
+            return self._resultado_error(e, tiempos)
+    
+    def ejecutar_lote(
+        self,
+        lista_datos: List[Dict[str, Any]],
+        concurrencia: int = 4,
+        incluir_pdf: bool = False
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Ejecuta el flujo para varios clientes con concurrencia acotada.
+        
+        Las ejecuciones del lote comparten el perfil de riesgo: se calcula una
+        sola vez por (CIIU, actividad, tramo de trabajadores).
+        
+        Args:
+            lista_datos: Datos del formulario de cada cliente
+            concurrencia: Número máximo de propuestas en paralelo
+            incluir_pdf: Si es True, cada resultado incluye "pdf_bytes"
+            
+        Yields:
+            Tuplas (posición en lista_datos, resultado) a medida que terminan
+        """
+        memo_perfiles = MemoCompartido()
+        executor = ThreadPoolExecutor(max_workers=max(1, concurrencia), thread_name_prefix="lote")
+        try:
+            futuros = {
+                executor.submit(self.ejecutar, datos, None, incluir_pdf, memo_perfiles): i
+                for i, datos in enumerate(lista_datos)
+            }
+            for futuro in as_completed(futuros):
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    resultado = self._resultado_error(e, {})
+                yield futuros[futuro], resultado
+        finally:
+            # Si el consumidor abandona el lote, no se inician las ejecuciones pendientes
+            executor.shutdown(wait=False, cancel_futures=True)
+            print(f"[OK] Lote terminado: {len(lista_datos)} clientes, "
+                  f"{memo_perfiles.calculos} perfiles calculados, {memo_perfiles.aciertos} reutilizados")
+    
+    def _ejecutar_en_loop(self, coro) -> Any:
+        """Ejecuta una corrutina en el event loop dedicado del orquestador."""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    @staticmethod
+    def _imprimir_inicio(datos_entrada: Dict[str, Any]):
+        print("\n" + "="*60)
+        print(">>> INICIANDO GENERACION DE PROPUESTA")
+        print("="*60)
+        print(f"   Empresa: {datos_entrada.get('nombre_empresa')}")
+        print(f"   Empleados: {datos_entrada.get('numero_empleados')}")
+    
+    @staticmethod
+    def _error_validacion(resultado_recolector: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Respuesta de error si el recolector encontró datos faltantes o inválidos."""
+        if resultado_recolector.get("proximo_paso") == "solicitar_datos_faltantes":
+            datos_invalidos = resultado_recolector.get("datos_invalidos") or []
             return {
                 "status": "error",
-                "error": str(e)
+                "error": "Datos faltantes o inválidos" if datos_invalidos else "Datos faltantes",
+                "datos_faltantes": resultado_recolector.get("datos_faltantes"),
+                "datos_invalidos": datos_invalidos,
+                "mensaje": resultado_recolector.get("mensaje")
             }
+        return None
+    
+    @staticmethod
+    def _error_perfil(resultado_perfil: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Respuesta de error si no se pudo determinar el perfil de riesgo."""
+        if resultado_perfil.get("proximo_paso") == "Error_Perfilamiento":
+            return {
+                "status": "error",
+                "error": "No se pudo determinar el perfil de riesgo"
+            }
+        return None
+    
+    def _error_catalogo(self, tiempos: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        """Carga el catálogo midiendo el paso; respuesta de error si no está disponible."""
+        try:
+            with _medir(tiempos, "catalogo"):
+                self._catalogo.obtener_tabla()
+        except CatalogoNoDisponibleError as e:
+            return self._respuesta_error_catalogo(e)
+        return None
+    
+    @staticmethod
+    def _respuesta_error_catalogo(error: CatalogoNoDisponibleError) -> Dict[str, Any]:
+        """Respuesta de error cuando no hay catálogo de productos."""
+        print(f"   [ERROR] {error}")
+        return {
+            "status": "error",
+            "error": "Catálogo de productos no disponible",
+            "mensaje": str(error)
+        }
+    
+    @staticmethod
+    def _combinar_perfil(datos_entrada: Dict[str, Any], resultado_perfil: Dict[str, Any]) -> Dict[str, Any]:
+        """Calcula el presupuesto anual y combina los datos con el perfil de riesgo."""
+        print("\n[PASO 3] Calculando presupuesto...")
+        aportes = float(datos_entrada.get("aportes_mensuales", 0))
+        porcentaje = float(datos_entrada.get("porcentaje_reinversion", 0))
+        presupuesto_anual = aportes * 12 * (porcentaje / 100)
+        
+        print(f"   [OK] Presupuesto anual: ${presupuesto_anual:,.0f}")
+        
+        return {
+            **datos_entrada,
+            "presupuesto_anual": presupuesto_anual,
+            "clase_riesgo": resultado_perfil.get("clase_riesgo"),
+            "riesgos_generales": resultado_perfil.get("riesgos_generales", []),
+            "obligaciones_legales": resultado_perfil.get("Obligaciones_legales", [])
+        }
+    
+    @staticmethod
+    def _combinar_productos(datos_combinados: Dict[str, Any], resultado_productos: Dict[str, Any]) -> Dict[str, Any]:
+        """Combina los datos con los productos seleccionados."""
+        print(f"   [OK] Productos obligatorios: {len(resultado_productos.get('productos_obligatorios', []))}")
+        print(f"   [OK] Productos prioritarios: {len(resultado_productos.get('productos_prioritarios', []))}")
+        print(f"   [OK] Valores agregados: {len(resultado_productos.get('valores_agregados', []))}")
+        
+        return {
+            **datos_combinados,
+            "productos_obligatorios": resultado_productos.get("productos_obligatorios", []),
+            "productos_prioritarios": resultado_productos.get("productos_prioritarios", []),
+            "valores_agregados": resultado_productos.get("valores_agregados", []),
+            "resumen_presupuesto": resultado_productos.get("resumen_presupuesto", {})
+        }
+    
+    def _guardar_pdf(self, pdf_bytes: bytes) -> Optional[str]:
+        """Guarda el PDF en el almacén; retorna su id (None si no se pudo guardar)."""
+        if self._almacen_pdf is None:
+            return None
+        try:
+            return self._almacen_pdf.guardar(pdf_bytes)
+        except Exception as e:
+            print(f"[WARN] No se pudo guardar el PDF en el almacén: {e}")
+            return None
+    
+    @staticmethod
+    def _resultado_exitoso(
+        propuesta_final: Dict[str, Any],
+        pdf_bytes: bytes,
+        tiempos: Dict[str, float],
+        incluir_pdf: bool = False,
+        pdf_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        print("   [OK] PDF generado exitosamente")
+        
+        print("\n" + "="*60)
+        print("[SUCCESS] PROPUESTA COMERCIAL GENERADA EXITOSAMENTE")
+        print("="*60 + "\n")
+        
+        resultado = {
+            "status": "success",
+            "propuesta": propuesta_final,
+            "pdf_generado": True,
+            "pdf_size_bytes": len(pdf_bytes),
+            "pdf_id": pdf_id,
+            "tiempos_pasos": tiempos
+        }
+        if incluir_pdf:
+            resultado["pdf_bytes"] = pdf_bytes
+        return resultado
+    
+    @staticmethod
+    def _resultado_cancelado(tiempos: Dict[str, float]) -> Dict[str, Any]:
+        print("\n[INFO] Ejecución cancelada por el consumidor")
+        return {
+            "status": "cancelado",
+            "error": "Ejecución cancelada",
+            "tiempos_pasos": tiempos
+        }
+    
+    @staticmethod
+    def _resultado_error(e: Exception, tiempos: Dict[str, float]) -> Dict[str, Any]:
+        print(f"\n[ERROR] Error en orquestador: {e}")
+        import traceback
+        traceback.print_exc()
+        return {
+            "status": "error",
+            "error": str(e),
+            "tiempos_pasos": tiempos
+        }
     
     def _ejecutar_recolector(self, datos: Dict[str, Any]) -> Dict[str, Any]:
-        """Ejecuta el agente recolector de datos."""
+        """
+        Ejecuta el agente recolector de datos.
+        Usa el validador local salvo que se haya habilitado el recolector LLM.
+        """
+        if not self._recolector_llm:
+            return validar_datos_entrada(datos)
+        
         return self._llm.generar_json(
             system_prompt=SYSTEM_PROMPT_RECOLECTOR,
-            user_prompt=get_prompt_recolector(datos)
+            user_prompt=get_prompt_recolector(datos),
+            paso="recolector",
+            response_schema=SCHEMA_RECOLECTOR
         )
     
-    def _ejecutar_perfil_riesgo(self, datos: Dict[str, Any]) -> Dict[str, Any]:
-        """Ejecuta el agente de perfil de riesgo."""
-        return self._llm.generar_json(
-            system_prompt=SYSTEM_PROMPT_PERFIL_RIESGO,
-            user_prompt=get_prompt_perfil_riesgo(datos)
+    async def _ejecutar_recolector_async(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """Versión asíncrona de _ejecutar_recolector."""
+        if not self._recolector_llm:
+            return validar_datos_entrada(datos)
+        
+        return await self._llm.generar_json_async(
+            system_prompt=SYSTEM_PROMPT_RECOLECTOR,
+            user_prompt=get_prompt_recolector(datos),
+            paso="recolector",
+            response_schema=SCHEMA_RECOLECTOR
         )
     
-    def _ejecutar_selector_productos(self, datos: Dict[str, Any]) -> Dict[str, Any]:
-        """Ejecuta el agente selector de productos."""
-        # Obtener catálogo de productos
-        catalogo = self._catalogo.obtener_catalogo()
+    def _ejecutar_perfil_riesgo(
+        self,
+        datos: Dict[str, Any],
+        memo_perfiles: Optional[MemoCompartido] = None
+    ) -> Dict[str, Any]:
+        """
+        Ejecuta el agente de perfil de riesgo.
+        Resuelve localmente con el índice CIIU; solo llama al LLM si el código
+        no existe en el índice o es ambiguo. Las obligaciones legales siempre
+        se calculan con el motor de reglas de la Resolución 0312.
+        """
+        if memo_perfiles is not None:
+            return memo_perfiles.obtener(
+                self._clave_perfil(datos), lambda: self._ejecutar_perfil_riesgo(datos)
+            )
         
-        # Limitar catálogo (formato compacto permite más productos)
-        catalogo_limitado = catalogo[:80] if len(catalogo) > 80 else catalogo
-        print(f"   [INFO] Usando {len(catalogo_limitado)} productos del catalogo")
+        resultado = self._perfil_local(datos)
+        if resultado is None:
+            resultado = self._llm.generar_json(
+                system_prompt=SYSTEM_PROMPT_PERFIL_RIESGO,
+                user_prompt=get_prompt_perfil_riesgo(datos),
+                paso="perfil_riesgo",
+                response_schema=SCHEMA_PERFIL_RIESGO
+            )
+        return self._agregar_obligaciones(resultado, datos)
+    
+    async def _ejecutar_perfil_riesgo_async(
+        self,
+        datos: Dict[str, Any],
+        memo_perfiles: Optional[MemoCompartido] = None
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de _ejecutar_perfil_riesgo."""
+        if memo_perfiles is not None:
+            return await memo_perfiles.obtener_async(
+                self._clave_perfil(datos), lambda: self._ejecutar_perfil_riesgo_async(datos)
+            )
         
-        resultado = self._llm.generar_json(
-            system_prompt=SYSTEM_PROMPT_SELECTOR_PRODUCTOS,
-            user_prompt=get_prompt_selector_productos(datos, catalogo_limitado),
-            temperature=0.5  # Un poco más de creatividad para selección
+        resultado = self._perfil_local(datos)
+        if resultado is None:
+            resultado = await self._llm.generar_json_async(
+                system_prompt=SYSTEM_PROMPT_PERFIL_RIESGO,
+                user_prompt=get_prompt_perfil_riesgo(datos),
+                paso="perfil_riesgo",
+                response_schema=SCHEMA_PERFIL_RIESGO
+            )
+        return self._agregar_obligaciones(resultado, datos)
+    
+    def _clave_perfil(self, datos: Dict[str, Any]) -> tuple:
+        """Datos de los que depende el perfil: CIIU, actividad y tramo de trabajadores."""
+        codigo = str(datos.get("codigo_ciiu") or "").strip()
+        return (
+            self._indice_ciiu.normalizar_codigo(codigo) or codigo,
+            str(datos.get("actividad_principal") or "").strip().lower(),
+            tramo_trabajadores(datos.get("numero_empleados"))
         )
+    
+    def _perfil_local(self, datos: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Perfil desde el índice CIIU, o None si hay que consultar al LLM."""
+        entrada = self._indice_ciiu.buscar(datos.get("codigo_ciiu"))
+        if entrada and not entrada.ambiguo:
+            print(f"   [INFO] CIIU {entrada.codigo} resuelto con indice local")
+            return perfil_desde_indice(entrada)
+        
+        motivo = "ambiguo" if entrada else "no encontrado"
+        print(f"   [INFO] CIIU {datos.get('codigo_ciiu')} {motivo} en indice, usando LLM")
+        return None
+    
+    def _agregar_obligaciones(self, resultado: Dict[str, Any], datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Agrega las obligaciones legales calculadas con el motor de reglas. Si
+        la clase de riesgo o el número de trabajadores no se pueden
+        interpretar, usa las obligaciones base de la Resolución 0312.
+        """
+        obligaciones = self._obligaciones.obtener(
+            resultado.get("clase_riesgo"), datos.get("numero_empleados")
+        )
+        if obligaciones is None:
+            print(
+                f"   [WARN] Clase de riesgo ({resultado.get('clase_riesgo')!r}) o número de trabajadores "
+                f"({datos.get('numero_empleados')!r}) no válidos; se usan las obligaciones base de la Res. 0312"
+            )
+            obligaciones = self._obligaciones.base()
+        resultado["Obligaciones_legales"] = obligaciones
         
         return resultado
     
+    def _ejecutar_selector_productos(
+        self,
+        datos: Dict[str, Any],
+        notificar: Optional[Notificador] = None
+    ) -> Dict[str, Any]:
+        """
+        Ejecuta el selector de productos: un sub-agente por sección en
+        paralelo y un merge determinístico que aplica el presupuesto.
+        Si un perfil igual o parecido ya se seleccionó, reutiliza su ranking
+        y solo recalcula la asignación del presupuesto.
+        """
+        secciones = self._seleccion_cacheada(datos)
+        if secciones is not None:
+            return self._valorizar_secciones(secciones, datos)
+        
+        tareas = [(nombre, self._parametros_subagente(nombre, datos)) for nombre in CATEGORIAS_SUBAGENTE]
+        with ThreadPoolExecutor(max_workers=len(tareas), thread_name_prefix="selector") as executor:
+            futuros = [
+                # Cada hilo conserva el contexto (métricas de la ejecución)
+                executor.submit(contextvars.copy_context().run, self._ejecutar_subagente_selector, nombre, parametros, notificar)
+                for nombre, parametros in tareas
+            ]
+            parciales = [futuro.result() for futuro in futuros]
+        return self._valorizar_secciones(self._combinar_rankings(parciales, datos), datos)
+    
+    async def _ejecutar_selector_productos_async(
+        self,
+        datos: Dict[str, Any],
+        notificar: Optional[Notificador] = None
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de _ejecutar_selector_productos."""
+        secciones = self._seleccion_cacheada(datos)
+        if secciones is not None:
+            return self._valorizar_secciones(secciones, datos)
+        
+        parciales = await asyncio.gather(*(
+            self._ejecutar_subagente_selector_async(nombre, self._parametros_subagente(nombre, datos), notificar)
+            for nombre in CATEGORIAS_SUBAGENTE
+        ))
+        return self._valorizar_secciones(self._combinar_rankings(list(parciales), datos), datos)
+    
+    def _parametros_subagente(self, nombre: str, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Prompts y esquema de un sub-agente, con los candidatos de sus categorías.
+        Candidatos, ids y versión salen de la misma versión del catálogo.
+        """
+        tabla = self._catalogo.obtener_tabla()
+        candidatos = self._seleccionar_candidatos(tabla, datos, CATEGORIAS_SUBAGENTE[nombre])
+        print(f"   [INFO] Sub-agente {nombre}: {len(candidatos)} productos candidatos")
+        return dict(
+            system_prompt=SYSTEM_PROMPTS_SELECTOR[nombre],
+            user_prompt=get_prompt_selector_productos(
+                datos, candidatos, tabla.version, [tabla.id_de(p) for p in candidatos]
+            ),
+            paso="selector_productos",  # Modelo, temperatura y thinking según RUTAS_POR_PASO
+            response_schema=SCHEMAS_SELECTOR[nombre]
+        )
+    
+    def _ejecutar_subagente_selector(
+        self,
+        nombre: str,
+        parametros: Dict[str, Any],
+        notificar: Optional[Notificador] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Secciones hidratadas del ranking de un sub-agente del selector."""
+        secciones = SECCIONES_SUBAGENTE[nombre]
+        if not self._streaming:
+            return self._hidratar_ranking(self._llm.generar_json(**parametros), secciones)
+        
+        # Cada producto se hidrata (y se notifica) apenas el modelo lo termina de escribir
+        incremental = _RankingIncremental(self._hidratar_producto, notificar, secciones, nombre)
+        ranking = self._llm.generar_json_stream(
+            claves_listas=secciones, al_elemento=incremental.agregar, **parametros
+        )
+        return self._hidratar_ranking(ranking, secciones, incremental.hidratados(ranking))
+    
+    async def _ejecutar_subagente_selector_async(
+        self,
+        nombre: str,
+        parametros: Dict[str, Any],
+        notificar: Optional[Notificador] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Versión asíncrona de _ejecutar_subagente_selector."""
+        secciones = SECCIONES_SUBAGENTE[nombre]
+        if not self._streaming:
+            return self._hidratar_ranking(await self._llm.generar_json_async(**parametros), secciones)
+        
+        incremental = _RankingIncremental(self._hidratar_producto, notificar, secciones, nombre)
+        ranking = await self._llm.generar_json_stream_async(
+            claves_listas=secciones, al_elemento=incremental.agregar, **parametros
+        )
+        return self._hidratar_ranking(ranking, secciones, incremental.hidratados(ranking))
+    
+    def _hidratar_ranking(
+        self,
+        ranking: Dict[str, Any],
+        secciones: Tuple[str, ...],
+        hidratados: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Args:
+            ranking: Respuesta de un sub-agente del selector
+            secciones: Secciones que responde el sub-agente
+            hidratados: Secciones ya hidratadas durante el streaming; las que
+                falten se hidratan desde el ranking
+        """
+        hidratados = hidratados or {}
+        return {
+            seccion: hidratados[seccion] if seccion in hidratados
+            else self._hidratar_productos(ranking.get(seccion, []))
+            for seccion in secciones
+        }
+    
+    def _seleccion_cacheada(self, datos: Dict[str, Any]) -> Optional[Dict[str, List[Dict[str, Any]]]]:
+        """Secciones hidratadas desde la cache de selecciones, o None si no hay una vigente."""
+        if self._cache_seleccion is None:
+            return None
+        ids = self._cache_seleccion.obtener(datos, self._catalogo.version)
+        if ids is None:
+            return None
+        print("   [INFO] Seleccion de productos reutilizada desde la cache (sin LLM)")
+        return {seccion: self._hidratar_productos(ids.get(seccion, [])) for seccion in SECCIONES_RANKING}
+    
+    def _combinar_rankings(
+        self,
+        parciales: List[Dict[str, List[Dict[str, Any]]]],
+        datos: Dict[str, Any]
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Merge determinístico de los sub-agentes (ver combinar_rankings): las
+        secciones intercalan los rankings y reservan cupos antes del tope del
+        optimizador. El resultado (como ids) se guarda en la cache de
+        selecciones del perfil.
+        
+        Args:
+            parciales: Secciones hidratadas de cada sub-agente, en el orden de CATEGORIAS_SUBAGENTE
+            datos: Datos combinados del cliente y su perfil
+        """
+        secciones = combinar_rankings(dict(zip(CATEGORIAS_SUBAGENTE, parciales)), SECCIONES_RANKING)
+        
+        if self._cache_seleccion is not None:
+            self._cache_seleccion.guardar(datos, self._catalogo.version, {
+                seccion: [producto["id"] for producto in productos]
+                for seccion, productos in secciones.items()
+            })
+        return secciones
+    
+    def _valorizar_secciones(
+        self,
+        secciones: Dict[str, List[Dict[str, Any]]],
+        datos: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        El LLM solo rankea; tarifas, horas y resumen se calculan localmente
+        con el presupuesto compartido.
+        
+        Args:
+            secciones: Productos hidratados y rankeados por sección
+            datos: Datos combinados (presupuesto_anual)
+        """
+        resultado = asignar_presupuesto(
+            productos_obligatorios=secciones["productos_obligatorios"],
+            productos_prioritarios=secciones["productos_prioritarios"],
+            valores_agregados=secciones["valores_agregados"],
+            presupuesto_anual=datos.get("presupuesto_anual", 0),
+            tarifas_de=self._catalogo.tarifas_de
+        )
+        resultado["proximo_paso"] = "generar_propuesta_final"
+        
+        return resultado
+    
+    def _seleccionar_candidatos(
+        self,
+        tabla: TablaCatalogo,
+        datos: Dict[str, Any],
+        categorias: Optional[Tuple[str, ...]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Selecciona los top-k productos de cada categoría con el índice BM25.
+        Los productos DIFERENCIAL se buscan por obligaciones legales y riesgos;
+        el resto por enfoque prioritario y riesgos.
+        
+        Args:
+            tabla: Versión del catálogo en la que se busca
+            datos: Datos combinados del cliente y su perfil
+            categorias: Categorías a incluir (por defecto, todas las de CUPOS_CANDIDATOS)
+        """
+        riesgos = [str(r) for r in datos.get("riesgos_generales") or []]
+        obligaciones = [str(o) for o in datos.get("obligaciones_legales") or []]
+        enfoque = str(datos.get("enfoque_prioritario") or "")
+        
+        consulta_obligaciones = obligaciones + riesgos + [enfoque]
+        consulta_enfoque = [enfoque, enfoque] + riesgos
+        
+        candidatos = []
+        for categoria in categorias or CUPOS_CANDIDATOS:
+            k = CUPOS_CANDIDATOS.get(categoria, 0)
+            consulta = consulta_obligaciones if categoria == "DIFERENCIAL" else consulta_enfoque
+            candidatos.extend(tabla.buscar_relevantes(consulta, [categoria], k))
+        return candidatos
+    
+    def _hidratar_productos(self, productos: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Reemplaza los ids (o productos) retornados por el LLM con su registro del catálogo.
+        Descarta duplicados y conserva el orden del ranking.
+        """
+        hidratados = []
+        vistos = set()
+        for producto in productos or []:
+            registro = self._hidratar_producto(producto, vistos)
+            if registro is not None:
+                hidratados.append(registro)
+        return hidratados
+    
+    def _hidratar_producto(self, producto: Any, vistos: set) -> Optional[Dict[str, Any]]:
+        """
+        Registro del catálogo de un producto del ranking, o None si es
+        inválido o ya está en `vistos` (que se actualiza).
+        
+        El selector retorna ids del catálogo; también se aceptan objetos con
+        "id" o con categoría y descripción (formato anterior). El registro
+        conserva el "id" de su fila, que identifica al producto en el resto
+        del flujo (duplicados, cache de selecciones y tarifas).
+        """
+        tabla = self._catalogo.obtener_tabla()
+        if isinstance(producto, dict) and producto.get("id"):
+            producto = str(producto["id"])
+        if isinstance(producto, str):
+            original = tabla.por_id(producto)
+            if original is None:
+                print(f"[WARN] Id de producto desconocido en el ranking: {producto}")
+                return None
+            id_ = producto.strip().lower()
+        elif isinstance(producto, dict):
+            original = tabla.por_clave(producto)
+            id_ = tabla.id_de(original) if original is not None else id_producto(producto)
+            original = original or producto
+        else:
+            return None
+        if id_ in vistos:
+            return None
+        vistos.add(id_)
+        return {"id": id_, **{campo: original.get(campo) for campo in CAMPOS_PRODUCTO}}
+    
     def _ejecutar_documentador(self, datos: Dict[str, Any]) -> Dict[str, Any]:
-        """Ejecuta el agente documentador."""
+        """
+        Ejecuta el agente documentador.
+        Usa el ensamblador local salvo que se haya habilitado el documentador LLM.
+        """
         # Agregar fecha de generación
         datos["fecha_generacion"] = datetime.now().strftime("%Y-%m-%d")
         
+        if not self._documentador_llm:
+            return ensamblar_propuesta(datos, fecha_generacion=datos["fecha_generacion"])
+        
         return self._llm.generar_json(
             system_prompt=SYSTEM_PROMPT_DOCUMENTADOR,
-            user_prompt=get_prompt_documentador(datos)
+            user_prompt=get_prompt_documentador(datos),
+            paso="documentador",
+            response_schema=SCHEMA_DOCUMENTADOR
+        )
+    
+    async def _ejecutar_documentador_async(self, datos: Dict[str, Any]) -> Dict[str, Any]:
+        """Versión asíncrona de _ejecutar_documentador."""
+        datos["fecha_generacion"] = datetime.now().strftime("%Y-%m-%d")
+        
+        if not self._documentador_llm:
+            return ensamblar_propuesta(datos, fecha_generacion=datos["fecha_generacion"])
+        
+        return await self._llm.generar_json_async(
+            system_prompt=SYSTEM_PROMPT_DOCUMENTADOR,
+            user_prompt=get_prompt_documentador(datos),
+            paso="documentador",
+            response_schema=SCHEMA_DOCUMENTADOR
         )
-
@@ -0,0 +1,164 @@
+"""
+Codificación compacta y columnar del catálogo para los prompts.
+
+En lugar de una lista JSON de objetos (que repite las claves en cada fila),
+el catálogo se envía como diccionarios de categorías y subcategorías
+referenciados por enteros, una fila de encabezado y filas separadas por "|".
+Los campos vacíos se omiten y las descripciones repetidas se reemplazan por
+una referencia al id de la fila anterior.
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..services.optimizador_presupuesto import a_numero
+from ..services.tabla_catalogo import id_producto
+
+
+SEPARADOR = "|"
+
+# Columnas de cada fila; las tarifas (a menudo vacías) van al final para recortarlas
+COLUMNAS = ("id", "cat", "sub", "tipo", "tema", "desc", "h_eq", "h_bas", "h_esp")
+
+LEYENDA = (
+    f'columnas separadas por "{SEPARADOR}": id, cat=código de categoría, sub=código de subcategoría, '
+    "tipo, tema, desc=descripción (^id = misma descripción que ese producto), "
+    "h_eq=hora_equipos, h_bas=hora_aliado_basico, h_esp=hora_aliado_especializado; "
+    "un campo vacío significa sin valor"
+)
+
+# Versiones del catálogo y listas de candidatos codificadas que se conservan en memoria
+_MAX_VERSIONES = 2
+_MAX_TEXTOS_POR_VERSION = 64
+
+
+def _valor(valor: Any) -> str:
+    """Texto de un campo en una sola línea y sin el separador."""
+    if valor is None:
+        return ""
+    return " ".join(str(valor).replace(SEPARADOR, "/").split())
+
+
+def _tarifa(valor: Any) -> str:
+    """Tarifa normalizada en pesos enteros ("95.000" → 95000); vacía si no hay tarifa."""
+    tarifa = round(a_numero(valor))
+    return str(tarifa) if tarifa > 0 else ""
+
+
+class _CodificacionVersion:
+    """Campos y códigos de una versión del catálogo, calculados una sola vez por producto."""
+
+    def __init__(self):
+        self._categorias: Dict[str, int] = {}
+        self._subcategorias: Dict[str, int] = {}
+        self._campos: Dict[str, Tuple[str, ...]] = {}
+        self._textos: "OrderedDict[Tuple[str, ...], str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _codigo(diccionario: Dict[str, int], valor: str) -> str:
+        if not valor:
+            return ""
+        return str(diccionario.setdefault(valor, len(diccionario)))
+
+    def _campos_producto(self, producto: Dict[str, Any], id_: str) -> Tuple[str, ...]:
+        """(id, categoría, subcategoría, columnas de la fila...) de un producto."""
+        campos = self._campos.get(id_)
+        if campos is None:
+            categoria = _valor(producto.get("categoria_de_programas"))
+            subcategoria = _valor(producto.get("subcategoria"))
+            campos = (
+                id_,
+                categoria,
+                subcategoria,
+                self._codigo(self._categorias, categoria),
+                self._codigo(self._subcategorias, subcategoria),
+                _valor(producto.get("tipo")),
+                _valor(producto.get("tema")),
+                _valor(producto.get("descripcion_programas_de_prevencion")),
+                _tarifa(producto.get("valor_de_la_hora_equipos")),
+                _tarifa(producto.get("valor_hora_aliado_basico")),
+                _tarifa(producto.get("valor_hora_aliado_especializado")),
+            )
+            self._campos[id_] = campos
+        return campos
+
+    def codificar(self, productos: List[Dict[str, Any]], ids: List[str]) -> str:
+        with self._lock:
+            filas_campos = [self._campos_producto(p, id_) for p, id_ in zip(productos, ids)]
+            clave = tuple(campos[0] for campos in filas_campos)
+            texto = self._textos.get(clave)
+            if texto is not None:
+                self._textos.move_to_end(clave)
+                return texto
+
+            categorias: Dict[str, str] = {}
+            subcategorias: Dict[str, str] = {}
+            descripciones: Dict[str, str] = {}
+            filas = [SEPARADOR.join(COLUMNAS)]
+            vistos = set()
+            for id_, categoria, subcategoria, cod_cat, cod_sub, *columnas in filas_campos:
+                if id_ in vistos:
+                    continue
+                vistos.add(id_)
+                if cod_cat:
+                    categorias[cod_cat] = categoria
+                if cod_sub:
+                    subcategorias[cod_sub] = subcategoria
+                descripcion = columnas[2]
+                if descripcion:
+                    anterior = descripciones.setdefault(descripcion, id_)
+                    if anterior != id_:
+                        columnas[2] = f"^{anterior}"
+                filas.append(SEPARADOR.join([id_, cod_cat, cod_sub, *columnas]).rstrip(SEPARADOR))
+
+            texto = "\n".join([
+                "Categorías: " + "; ".join(f"{c}={v}" for c, v in categorias.items()),
+                "Subcategorías: " + "; ".join(f"{c}={v}" for c, v in subcategorias.items()),
+                *filas,
+            ])
+            self._textos[clave] = texto
+            while len(self._textos) > _MAX_TEXTOS_POR_VERSION:
+                self._textos.popitem(last=False)
+            return texto
+
+
+_tablas: "OrderedDict[str, _CodificacionVersion]" = OrderedDict()
+_tablas_lock = threading.Lock()
+
+
+def codificar_catalogo(
+    productos: List[Dict[str, Any]],
+    version: Optional[str] = None,
+    ids: Optional[List[Optional[str]]] = None
+) -> str:
+    """
+    Codifica productos del catálogo en el formato compacto del prompt.
+
+    Args:
+        productos: Productos a incluir, en orden
+        version: Versión del catálogo (CatalogoService.version). Con versión,
+            los códigos y filas se calculan una vez y el texto se memoiza por
+            lista de productos; sin versión se codifica de nuevo cada vez.
+        ids: Ids de las filas del catálogo (TablaCatalogo.ids), alineados con
+            `productos`; los que falten se calculan con id_producto
+
+    Returns:
+        Diccionarios de códigos, encabezado y una fila por producto
+    """
+    ids = [
+        id_ or id_producto(producto)
+        for producto, id_ in zip(productos, ids if ids is not None else [None] * len(productos))
+    ]
+    if not version:
+        return _CodificacionVersion().codificar(productos, ids)
+
+    with _tablas_lock:
+        tabla = _tablas.get(version)
+        if tabla is None:
+            tabla = _tablas[version] = _CodificacionVersion()
+            while len(_tablas) > _MAX_VERSIONES:
+                _tablas.popitem(last=False)
+        else:
+            _tablas.move_to_end(version)
+    return tabla.codificar(productos, ids)
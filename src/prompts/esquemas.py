@@ -0,0 +1,27 @@
+"""
+Constructores de esquemas de respuesta (structured output de Gemini).
+Cada prompt define el esquema de la misma estructura JSON que describe al modelo.
+"""
+from typing import Dict, Any
+
+TEXTO = {"type": "STRING"}
+NUMERO = {"type": "NUMBER"}
+ENTERO = {"type": "INTEGER"}
+
+
+def lista(items: Dict[str, Any]) -> Dict[str, Any]:
+    """Esquema de un arreglo."""
+    return {"type": "ARRAY", "items": items}
+
+
+def objeto(opcionales: tuple = (), **propiedades: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Esquema de un objeto. Todas las propiedades son requeridas salvo las
+    indicadas en `opcionales`; el orden de las propiedades se conserva.
+    """
+    return {
+        "type": "OBJECT",
+        "properties": propiedades,
+        "required": [nombre for nombre in propiedades if nombre not in opcionales],
+        "propertyOrdering": list(propiedades),
+    }
@@ -1,6 +1,7 @@
 """
 Prompt del Agente Documentador
 """
+from .esquemas import NUMERO, TEXTO, lista, objeto
 
 SYSTEM_PROMPT_DOCUMENTADOR = """Eres un agente especializado en consolidación de información comercial. Tu tarea es generar la salida final de la Propuesta Comercial ARL, integrando todos los datos provenientes de los tools anteriores.
 
@@ -76,6 +77,58 @@ OBJETIVO FINAL
 Transformar la información entregada en el User Prompt en un JSON perfectamente estructurado, válido y completo, siguiendo estrictamente el formato definido arriba.
 """
 
+# Esquema de la respuesta (misma estructura del prompt)
+_CAMPOS_PRODUCTO = dict(
+    categoria_de_programas=TEXTO,
+    descripcion_programas_de_prevencion=TEXTO,
+    subcategoria=TEXTO,
+    tema=TEXTO,
+    tipo=TEXTO,
+)
+
+SCHEMA_DOCUMENTADOR = objeto(
+    propuesta_comercial=objeto(
+        informacion_cliente=objeto(
+            nombre_empresa=TEXTO,
+            numero_empleados=NUMERO,
+            codigo_ciiu=TEXTO,
+            aportes_mensuales=NUMERO,
+            porcentaje_reinversion=NUMERO,
+            enfoque_prioritario=TEXTO,
+            correo_destinatario=TEXTO,
+        ),
+        perfil_riesgo=objeto(
+            clase_riesgo=TEXTO,
+            riesgos_generales=lista(TEXTO),
+            obligaciones_legales=lista(TEXTO),
+        ),
+        presupuesto=objeto(
+            aportes_mensuales=NUMERO,
+            porcentaje_reinversion=NUMERO,
+            presupuesto_anual=NUMERO,
+            total_productos=NUMERO,
+            total_productos_obligatorios=NUMERO,
+            total_productos_prioritarios=NUMERO,
+            saldo_restante=NUMERO,
+            porcentaje_utilizado=NUMERO,
+        ),
+        productos_obligatorios=lista(objeto(
+            **_CAMPOS_PRODUCTO,
+            tipo_tarifa_usada=TEXTO, tarifa_hora=NUMERO, horas_asignadas=NUMERO, subtotal=NUMERO
+        )),
+        productos_prioritarios=lista(objeto(
+            **_CAMPOS_PRODUCTO,
+            tipo_tarifa_usada=TEXTO, tarifa_hora=NUMERO, horas_asignadas=NUMERO, subtotal=NUMERO
+        )),
+        valores_agregados=lista(objeto(**_CAMPOS_PRODUCTO, tarifa_referencia=NUMERO)),
+    ),
+    metadatos=objeto(
+        fecha_generacion=TEXTO,
+        version=TEXTO,
+        estado=TEXTO,
+    ),
+)
+
 
 def get_prompt_documentador(datos: dict) -> str:
     """Genera el prompt del usuario para el documentador."""
@@ -1,6 +1,7 @@
 """
 Prompt del Agente de Perfil de Riesgo
 """
+from .esquemas import TEXTO, lista, objeto
 
 SYSTEM_PROMPT_PERFIL_RIESGO = """Eres un asistente especializado en Seguridad y Salud en el Trabajo (SST) en Colombia.
 Tu tarea es identificar el perfil de riesgo de una empresa con base en la información recibida.
@@ -20,14 +21,6 @@ Ejemplo: "Clase de Riesgo 3, la Actividad Economica es Manufactura"
 3. 'riesgos_generales': Identifica los principales riesgos asociados a esa actividad determinada en el paso 2 y retorna una lista de strings.
 Ejemplo: ["físicos", "químicos", "biomecánicos", "mecánicos", "psicosociales", "locativos"]
 
-4. 'Obligaciones_legales': Define las obligaciones legales según la Resolución 0312 de 2019, considerando "clase de riesgo" y "numeroTrabajadores". Genera una lista de strings con las obligaciones legales definidas.
-Ejemplo: 
-[
-- "Implementar el Sistema de Gestión en SST con estándares mínimos", 
-- "Reportar anualmente la autoevaluación de estándares mínimos", 
-- "Diseñar e implementar un plan de capacitación en SST"
-]
-
 4. 'proximo_paso': Si no lograste identificar la 'clase_riesgo' en el paso 2 genera un string con la palabra "Error_Perfilamiento" y si no retorna un string "seleccion_productos"
 
 
@@ -36,11 +29,17 @@ Retorna un JSON:
 {
 "clase_riesgo":"",
 "riesgos_generales":[],
-"Obligaciones_legales":[],
 "proximo_paso":""
 }
 """
 
+# Esquema de la respuesta (misma estructura del prompt)
+SCHEMA_PERFIL_RIESGO = objeto(
+    clase_riesgo=TEXTO,
+    riesgos_generales=lista(TEXTO),
+    proximo_paso={**TEXTO, "enum": ["seleccion_productos", "Error_Perfilamiento"]},
+)
+
 
 def get_prompt_perfil_riesgo(datos: dict) -> str:
     """Genera el prompt del usuario para el perfil de riesgo."""
@@ -48,6 +47,5 @@ def get_prompt_perfil_riesgo(datos: dict) -> str:
 
 Código CIIU (puede tener más de 4 dígitos, usa únicamente las primeras 4 cifras): {datos.get('codigo_ciiu', '')}
 Actividad principal (solo si el CIIU no está disponible o es ambiguo): {datos.get('actividad_principal', 'No especificada')}
-numeroTrabajadores: {datos.get('numero_empleados', '')}
 """
 
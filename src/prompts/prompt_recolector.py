@@ -1,6 +1,7 @@
 """
 Prompt del Agente Recolector de Datos
 """
+from .esquemas import TEXTO, lista, objeto
 
 SYSTEM_PROMPT_RECOLECTOR = """Eres un asistente especializado en validar datos de entrada provenientes de un formulario.
 
@@ -36,6 +37,13 @@ Retorna únicamente un JSON con esta estructura exacta:
   "mensaje": ""
 }"""
 
+# Esquema de la respuesta (misma estructura del prompt)
+SCHEMA_RECOLECTOR = objeto(
+    datos_faltantes=lista(TEXTO),
+    proximo_paso={**TEXTO, "enum": ["solicitar_datos_faltantes", "perfilamiento_cliente"]},
+    mensaje=TEXTO,
+)
+
 
 def get_prompt_recolector(datos: dict) -> str:
     """Genera el prompt del usuario para el recolector."""
@@ -1,23 +1,21 @@
 """
-Prompt del Agente Selector de Productos
+Prompts de los sub-agentes del Selector de Productos.
+
+La selección se divide en un sub-agente por sección (obligatorios,
+prioritarios, valores agregados y profesionales); cada uno recibe solo los
+candidatos de sus categorías y responde únicamente con su parte del ranking.
 """
+from typing import Dict, List, Optional, Tuple
+
+from .esquemas import TEXTO, lista, objeto
+from .catalogo_compacto import LEYENDA, codificar_catalogo
 
-SYSTEM_PROMPT_SELECTOR_PRODUCTOS = """Eres un asistente especializado en diseño de propuestas comerciales para la ARL Seguros Bolívar.
-Tu tarea es seleccionar productos y asignar horas basándote en el perfil de riesgo del cliente y el catálogo disponible.
-
-# Categorías disponibles en el catálogo **Programas** en el campo ("categoria_de_programas"):
-- **DIFERENCIAL** (160 registros): Programas especializados personalizados
-- **VALOR AGREGADO** (66 registros): Servicios complementarios sin costo
-- **Profesionales** (18 registros): Servicios de profesionales especializados
-- **Programa de Prevención** (41 registros): Programas estructurados de prevención
-- **HIGIENE** (21 registros): Servicios de higiene industrial
-- **Vacunación** (9 registros): Programas de vacunación
-- **Medicina Preventiva y del Trabajo** (8 registros): Servicios médicos preventivos
-- **Laboratorio Clínico** (21 registros): Exámenes y análisis clínicos
-- **Administrativo** (1 registro): Servicios administrativos
-- **Asesor de Gestión del Riesgo** (2 registros): Asesoría especializada
+_ENCABEZADO = """Eres un asistente especializado en diseño de propuestas comerciales para la ARL Seguros Bolívar.
+Tu tarea es seleccionar y ordenar por relevancia productos basándote en el perfil de riesgo del cliente y el catálogo disponible.
+Otros asistentes seleccionan en paralelo las demás secciones de la propuesta: ocúpate solo de la tuya.
 
 # Campos disponibles en cada producto:
+- id (identificador corto del producto)
 - categoria_de_programas
 - descripcion_programas_de_prevencion
 - subcategoria
@@ -28,126 +26,92 @@ Tu tarea es seleccionar productos y asignar horas basándote en el perfil de rie
 - tipo
 
 # Instrucciones:
+"""
+
+_REGLAS_RANKING = """
+## ORDENAR POR RELEVANCIA
+- Ordena cada lista de la más relevante a la menos relevante para el cliente.
+- NO asignes horas, NO elijas tarifas y NO calcules subtotales ni totales: un optimizador local asigna las horas según el ranking y el "presupuestoAnual".
+- Los productos del final del ranking pueden quedar fuera si el presupuesto no alcanza, así que prioriza bien los primeros.
+- Identifica cada producto solo por su "id", copiado exactamente del catálogo. No copies descripciones ni otros campos: se completan localmente.
+- No inventes ids ni repitas un producto en la misma lista.
+
+
+# Respuesta o Salida
+Retorna únicamente un JSON con esta estructura exacta:
+
+"""
 
-## 1. SELECCIONAR PRODUCTOS OBLIGATORIOS
-- **Categoría principal**: "DIFERENCIAL"
+_INSTRUCCIONES = {
+    "obligatorios": """
+## SELECCIONAR PRODUCTOS OBLIGATORIOS
+- **Categoría**: "DIFERENCIAL" (programas especializados personalizados)
 - Revisa las **Obligaciones_legales** del perfilamiento.
 - Busca en los productos de categoría "DIFERENCIAL" aquellos cuya descripción, subcategoría o tema respondan directamente a esas obligaciones o esten muy relacionadas.
 - **Límite**: Máximo 30 productos obligatorios
-- La cantidad exacta dependerá del precio (tarifa/hora) y las horas asignadas a cada uno para no exceder el "presupuestoAnual".
-
-## 2. SELECCIONAR PRODUCTOS PRIORITARIOS
-- **Categorías principales**: "Programa de Prevención", "Medicina Preventiva y del Trabajo", "Laboratorio Clínico", "HIGIENE", "Vacunación".
+""",
+    "prioritarios": """
+## SELECCIONAR PRODUCTOS PRIORITARIOS
+- **Categorías**: "Programa de Prevención", "Medicina Preventiva y del Trabajo", "Laboratorio Clínico", "HIGIENE", "Vacunación".
 - Revisa el **enfoquesPrioritarios** y los **riesgos_generales** del perfilamiento
 - Busca en estas categorías productos que se alineen con esos enfoques y riesgos identificados
-- Selecciona productos que complementen los obligatorios y refuercen la prevención.
-
-## 3. SELECCIONAR VALORES AGREGADOS
-- **Categoría**: "VALOR AGREGADO"
-- Filtra productos de esta categoría
+- Selecciona productos que refuercen la prevención.
+- **Límite**: Máximo 30 productos prioritarios
+""",
+    "valores_agregados": """
+## SELECCIONAR VALORES AGREGADOS
+- **Categoría**: "VALOR AGREGADO" (servicios complementarios sin costo)
 - Selecciona aproximadamente **18 valores agregados** que sean relevantes para el perfil del cliente
 - **IMPORTANTE**: Los valores agregados NO consumen presupuesto (son sin costo para el cliente)
-- Incluye su tarifa de referencia solo como información del valor añadido que recibe
-
-## 4. INCLUIR PROFESIONALES Y ASESORES
+""",
+    "profesionales": """
+## INCLUIR PROFESIONALES Y ASESORES
 - **Categorías**: "Profesionales", "Asesor de Gestión del Riesgo", "Administrativo"
 - Estos se ofrecen como parte de la propuesta comercial.
 - Selecciona los más relevantes según el perfil y tamaño de la empresa.
-- Pueden clasificarse como obligatorios o prioritarios según su función.
-
-## 5. DETERMINAR TARIFA APLICABLE
-Para cada producto seleccionado:
-- Revisa qué campos de valor están disponibles: valor_de_la_hora_equipos, valor_hora_aliado_basico, valor_hora_aliado_especializado
-- Si UN SOLO campo tiene valor (no es null/0/vacío), usa ese.
-- Si HAY MÚLTIPLES campos con valor, selecciona el más apropiado según tu criterio.
-- Registra en "tipo_tarifa_usada" el nombre exacto del campo que utilizaste (ejemplo: "valor_hora_aliado_basico")
-
-## 6. ASIGNAR HORAS Y CALCULAR SUBTOTALES
-- Para cada producto obligatorio y prioritario, asigna un número de horas razonable.
-- Calcula: subtotal = tarifa_hora × horas_asignadas
-- Suma todos los subtotales: total_productos = Σ subtotales de todos los productos.
-- **RESTRICCIÓN CRÍTICA**: total_productos NO PUEDE EXCEDER el Presupuesto Anual Calculado pero si inviertelo todo, que el saldo sea casi que nulo.
-- Si excede, reduce las horas asignadas iterativamente (empezando por prioritarios) hasta que total_productos ≤ presupuesto_anual.
-- Balancea la distribución considerando que puedes tener hasta 30 productos obligatorios.
-
-## 7. CALCULAR RESUMEN
-- total_productos_obligatorios = Σ subtotales de productos obligatorios.
-- total_productos_prioritarios = Σ subtotales de productos prioritarios.
-- total_productos = total_productos_obligatorios + total_productos_prioritarios.
-- saldo_restante = presupuesto_anual - total_productos.
-- porcentaje_utilizado = (total_productos / presupuesto_anual) × 100
-
+- Clasifícalos como obligatorios (si responden a las **Obligaciones_legales**) o prioritarios según su función.
+""",
+}
+
+# Secciones del ranking que responde cada sub-agente
+SECCIONES_SUBAGENTE: Dict[str, Tuple[str, ...]] = {
+    "obligatorios": ("productos_obligatorios",),
+    "prioritarios": ("productos_prioritarios",),
+    "valores_agregados": ("valores_agregados",),
+    "profesionales": ("productos_obligatorios", "productos_prioritarios"),
+}
+
+
+def _formato_salida(secciones: Tuple[str, ...]) -> str:
+    lineas = ",\n".join(f'  "{seccion}": ["id", "id"]' for seccion in secciones)
+    return "{\n" + lineas + "\n}"
+
+
+# Prompt del sistema y esquema de la respuesta (misma estructura) de cada sub-agente: solo ids, en orden de relevancia
+SYSTEM_PROMPTS_SELECTOR: Dict[str, str] = {
+    nombre: _ENCABEZADO + _INSTRUCCIONES[nombre] + _REGLAS_RANKING + _formato_salida(secciones)
+    for nombre, secciones in SECCIONES_SUBAGENTE.items()
+}
+
+SCHEMAS_SELECTOR: Dict[str, dict] = {
+    nombre: objeto(**{seccion: lista(TEXTO) for seccion in secciones})
+    for nombre, secciones in SECCIONES_SUBAGENTE.items()
+}
+
+
+def get_prompt_selector_productos(
+    datos: dict,
+    catalogo_productos: list,
+    version_catalogo: Optional[str] = None,
+    ids_productos: Optional[List[Optional[str]]] = None
+) -> str:
+    """
+    Genera el prompt del usuario para un sub-agente del selector de productos.
+    El catálogo va en formato columnar compacto, memoizado por versión del
+    catálogo, con los ids de fila del catálogo (`ids_productos`) si se conocen.
+    """
+    catalogo_compacto = codificar_catalogo(catalogo_productos, version_catalogo, ids_productos)
 
-# Respuesta o Salida
-Retorna únicamente un JSON con esta estructura exacta:
-
-{
-  "productos_obligatorios": [
-    {
-      "categoria_de_programas": "",
-      "descripcion_programas_de_prevencion": "",
-      "subcategoria": "",
-      "tema": "",
-      "tipo": "",
-      "tipo_tarifa_usada": "",
-      "tarifa_hora": 0,
-      "horas_asignadas": 0,
-      "subtotal": 0
-    }
-  ],
-  "productos_prioritarios": [
-    {
-      "categoria_de_programas": "",
-      "descripcion_programas_de_prevencion": "",
-      "subcategoria": "",
-      "tema": "",
-      "tipo": "",
-      "tipo_tarifa_usada": "",
-      "tarifa_hora": 0,
-      "horas_asignadas": 0,
-      "subtotal": 0
-    }
-  ],
-  "valores_agregados": [
-    {
-      "categoria_de_programas": "VALOR AGREGADO",
-      "descripcion_programas_de_prevencion": "",
-      "subcategoria": "",
-      "tema": "",
-      "tipo": "",
-      "tarifa_referencia": 0
-    }
-  ],
-  "resumen_presupuesto": {
-    "presupuesto_anual": 0,
-    "total_productos_obligatorios": 0,
-    "total_productos_prioritarios": 0,
-    "total_productos": 0,
-    "saldo_restante": 0,
-    "porcentaje_utilizado": 0
-  },
-  "proximo_paso": "generar_propuesta_final"
-}"""
-
-
-def get_prompt_selector_productos(datos: dict, catalogo_productos: list) -> str:
-    """Genera el prompt del usuario para el selector de productos."""
-    import json
-    
-    # Crear versión compacta del catálogo (solo campos esenciales)
-    catalogo_compacto = []
-    for p in catalogo_productos:
-        catalogo_compacto.append({
-            "cat": p.get("categoria_de_programas", ""),
-            "desc": p.get("descripcion_programas_de_prevencion", ""),
-            "sub": p.get("subcategoria", ""),
-            "tema": p.get("tema", ""),
-            "tipo": p.get("tipo", ""),
-            "h_eq": p.get("valor_de_la_hora_equipos"),
-            "h_bas": p.get("valor_hora_aliado_basico"),
-            "h_esp": p.get("valor_hora_aliado_especializado")
-        })
-    
     return f"""**Perfil del Cliente**
 - numeroTrabajadores: {datos.get('numero_empleados', '')}
 - presupuestoAnual: {datos.get('presupuesto_anual', '')}
@@ -156,7 +120,6 @@ def get_prompt_selector_productos(datos: dict, catalogo_productos: list) -> str:
 - riesgos_generales: {datos.get('riesgos_generales', [])}
 - Obligaciones_legales: {datos.get('obligaciones_legales', [])}
 
-**Programas** (campos: cat=categoria, desc=descripcion, sub=subcategoria, tema, tipo, h_eq=hora_equipos, h_bas=hora_aliado_basico, h_esp=hora_aliado_especializado)
-{json.dumps(catalogo_compacto, ensure_ascii=False)}
+**Programas** ({LEYENDA})
+{catalogo_compacto}
 """
-
@@ -0,0 +1,246 @@
+"""
+Almacén de PDFs generados, direccionado por el hash de su contenido.
+
+AlmacenLocal guarda los archivos en disco (por defecto); AlmacenGCS usa un
+bucket de Cloud Storage con la misma interfaz.
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from datetime import timedelta
+from typing import Optional, Iterator
+
+try:
+    from google.cloud import storage
+    from google.api_core.exceptions import NotFound
+    GCS_AVAILABLE = True
+except ImportError:
+    GCS_AVAILABLE = False
+    storage = None
+    NotFound = None
+
+
+DIRECTORIO_DEFAULT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "pdfs"
+)
+
+TAMANO_BLOQUE = 64 * 1024
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{64}$")
+
+
+class PDFNoEncontradoError(KeyError):
+    """El id no corresponde a un PDF almacenado."""
+
+
+def id_pdf(pdf_bytes: bytes) -> str:
+    """Id del PDF: SHA-256 de su contenido."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def validar_id(pdf_id: str) -> str:
+    """
+    Raises:
+        PDFNoEncontradoError: Si el id no tiene el formato de un hash SHA-256
+    """
+    if not _ID_VALIDO.match(pdf_id or ""):
+        raise PDFNoEncontradoError(pdf_id)
+    return pdf_id
+
+
+class AlmacenPDF(ABC):
+    """Interfaz de los almacenes de PDF."""
+
+    @abstractmethod
+    def guardar(self, pdf_bytes: bytes) -> str:
+        """Guarda el PDF (si no existe) y retorna su id."""
+
+    @abstractmethod
+    def tamano(self, pdf_id: str) -> int:
+        """
+        Tamaño en bytes del PDF.
+
+        Raises:
+            PDFNoEncontradoError: Si el PDF no existe
+        """
+
+    @abstractmethod
+    def leer(self, pdf_id: str, inicio: int = 0, fin: Optional[int] = None) -> Iterator[bytes]:
+        """Bloques del PDF entre `inicio` (incluido) y `fin` (excluido; None = hasta el final)."""
+
+    def url(self, pdf_id: str) -> Optional[str]:
+        """URL de descarga directa, o None si el PDF se sirve desde /pdfs/<id>."""
+        return None
+
+
+class AlmacenLocal(AlmacenPDF):
+    """PDFs en el sistema de archivos (dir/ab/abcdef....pdf)."""
+
+    def __init__(self, directorio: Optional[str] = None, retencion_segundos: Optional[int] = None):
+        """
+        Args:
+            directorio: Directorio de los PDF (SPU_PDF_DIR)
+            retencion_segundos: Vigencia de los PDF (SPU_PDF_RETENCION, 7 días por defecto; 0 = sin límite)
+        """
+        self._directorio = directorio or os.environ.get("SPU_PDF_DIR", DIRECTORIO_DEFAULT)
+        self._retencion = (
+            retencion_segundos if retencion_segundos is not None
+            else int(os.environ.get("SPU_PDF_RETENCION", 7 * 86400))
+        )
+        self._ultima_limpieza = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(self._directorio, exist_ok=True)
+        print(f"[OK] AlmacenLocal de PDF inicializado ({self._directorio})")
+
+    def _ruta(self, pdf_id: str) -> str:
+        validar_id(pdf_id)
+        return os.path.join(self._directorio, pdf_id[:2], f"{pdf_id}.pdf")
+
+    def guardar(self, pdf_bytes: bytes) -> str:
+        pdf_id = id_pdf(pdf_bytes)
+        ruta = self._ruta(pdf_id)
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            # Escritura atómica: un lector nunca ve un PDF a medio escribir
+            descriptor, temporal = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "wb") as f:
+                    f.write(pdf_bytes)
+                os.replace(temporal, ruta)
+            except BaseException:
+                os.unlink(temporal)
+                raise
+        self._limpiar_vencidos()
+        return pdf_id
+
+    def tamano(self, pdf_id: str) -> int:
+        try:
+            return os.path.getsize(self._ruta(pdf_id))
+        except OSError:
+            raise PDFNoEncontradoError(pdf_id)
+
+    def leer(self, pdf_id: str, inicio: int = 0, fin: Optional[int] = None) -> Iterator[bytes]:
+        ruta = self._ruta(pdf_id)
+        try:
+            archivo = open(ruta, "rb")
+        except OSError:
+            raise PDFNoEncontradoError(pdf_id)
+        with archivo:
+            archivo.seek(inicio)
+            restante = (fin - inicio) if fin is not None else None
+            while restante is None or restante > 0:
+                bloque = archivo.read(TAMANO_BLOQUE if restante is None else min(TAMANO_BLOQUE, restante))
+                if not bloque:
+                    return
+                if restante is not None:
+                    restante -= len(bloque)
+                yield bloque
+
+    def _limpiar_vencidos(self):
+        """Elimina los PDF más antiguos que la retención (como máximo cada 10 minutos)."""
+        if self._retencion <= 0:
+            return
+        ahora = time.time()
+        with self._lock:
+            if ahora - self._ultima_limpieza < 600:
+                return
+            self._ultima_limpieza = ahora
+
+        limite = ahora - self._retencion
+        for raiz, _, archivos in os.walk(self._directorio):
+            for nombre in archivos:
+                ruta = os.path.join(raiz, nombre)
+                try:
+                    if os.path.getmtime(ruta) < limite:
+                        os.unlink(ruta)
+                except OSError:
+                    pass
+
+
+class AlmacenGCS(AlmacenPDF):
+    """
+    PDFs en un bucket de Cloud Storage (gs://bucket/prefijo/<id>.pdf).
+    La retención se configura con una regla de ciclo de vida del bucket.
+    """
+
+    def __init__(self, bucket: Optional[str] = None, prefijo: Optional[str] = None, urls_firmadas: bool = True):
+        """
+        Args:
+            bucket: Nombre del bucket (SPU_PDF_BUCKET)
+            prefijo: Prefijo de los objetos (SPU_PDF_PREFIJO, "propuestas/" por defecto)
+            urls_firmadas: Si True, url() retorna una URL firmada de 15 minutos
+        """
+        if not GCS_AVAILABLE:
+            raise ImportError("google-cloud-storage no está instalado. Ejecuta: pip install google-cloud-storage")
+        nombre_bucket = bucket or os.environ.get("SPU_PDF_BUCKET")
+        if not nombre_bucket:
+            raise EnvironmentError("SPU_PDF_BUCKET no está configurado")
+
+        self._bucket = storage.Client().bucket(nombre_bucket)
+        self._prefijo = prefijo if prefijo is not None else os.environ.get("SPU_PDF_PREFIJO", "propuestas/")
+        self._urls_firmadas = urls_firmadas
+        print(f"[OK] AlmacenGCS de PDF inicializado (gs://{nombre_bucket}/{self._prefijo})")
+
+    def _blob(self, pdf_id: str):
+        return self._bucket.blob(f"{self._prefijo}{validar_id(pdf_id)}.pdf")
+
+    def guardar(self, pdf_bytes: bytes) -> str:
+        pdf_id = id_pdf(pdf_bytes)
+        blob = self._blob(pdf_id)
+        if not blob.exists():
+            blob.upload_from_string(pdf_bytes, content_type="application/pdf")
+        return pdf_id
+
+    def tamano(self, pdf_id: str) -> int:
+        blob = self._bucket.get_blob(self._blob(pdf_id).name)
+        if blob is None:
+            raise PDFNoEncontradoError(pdf_id)
+        return blob.size
+
+    def leer(self, pdf_id: str, inicio: int = 0, fin: Optional[int] = None) -> Iterator[bytes]:
+        # Una sola descarga en streaming (el lector pide bloques grandes, no uno por TAMANO_BLOQUE)
+        try:
+            with self._blob(pdf_id).open("rb") as archivo:
+                archivo.seek(inicio)
+                restante = (fin - inicio) if fin is not None else None
+                while restante is None or restante > 0:
+                    bloque = archivo.read(TAMANO_BLOQUE if restante is None else min(TAMANO_BLOQUE, restante))
+                    if not bloque:
+                        return
+                    if restante is not None:
+                        restante -= len(bloque)
+                    yield bloque
+        except NotFound:
+            raise PDFNoEncontradoError(pdf_id)
+
+    def url(self, pdf_id: str) -> Optional[str]:
+        if not self._urls_firmadas:
+            return None
+        try:
+            return self._blob(pdf_id).generate_signed_url(expiration=timedelta(minutes=15), version="v4")
+        except Exception as e:
+            # Sin credenciales con clave privada no se puede firmar; se sirve desde /pdfs/<id>
+            print(f"[WARN] No se pudo firmar la URL del PDF: {e}")
+            self._urls_firmadas = False
+            return None
+
+
+def almacen_desde_entorno() -> Optional[AlmacenPDF]:
+    """
+    Almacén según SPU_PDF_ALMACEN: "local" (por defecto), "gcs", o "none"
+    para no guardar los PDF.
+    """
+    tipo = os.environ.get("SPU_PDF_ALMACEN", "local").strip().lower()
+    if tipo in ("none", "false", "0", "no"):
+        return None
+    try:
+        if tipo == "gcs":
+            return AlmacenGCS()
+        return AlmacenLocal()
+    except Exception as e:
+        print(f"[WARN] No se pudo inicializar el almacén de PDF ({tipo}): {e}")
+        return None
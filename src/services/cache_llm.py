@@ -0,0 +1,198 @@
+"""
+Cache de respuestas del LLM direccionada por contenido.
+
+Nivel 1: LRU en memoria por proceso. Nivel 2 (opcional): SQLite en disco,
+compartido entre los workers de gunicorn de una instancia.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+
+# TTL (segundos) por paso del flujo; 0 desactiva la cache para ese paso.
+# El selector no se cachea: muestrea con temperatura > 0, y la reutilización
+# de sus rankings por perfil la hace CacheSeleccion.
+TTL_POR_PASO = {
+    "recolector": 86400,
+    "perfil_riesgo": 7 * 86400,
+    "selector_productos": 0,
+    "documentador": 86400,
+}
+TTL_DEFAULT = 3600
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cache_llm (
+    clave TEXT PRIMARY KEY,
+    valor TEXT NOT NULL,
+    expira_en REAL NOT NULL
+);
+"""
+
+
+def clave_solicitud(**solicitud: Any) -> str:
+    """Hash SHA-256 de la solicitud completa (modelo, prompts y parámetros)."""
+    canonico = json.dumps(solicitud, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class CacheLLM:
+    """
+    Cache de dos niveles para respuestas JSON del LLM.
+
+    Los valores se guardan serializados: cada lectura retorna un objeto nuevo
+    que el llamador puede modificar sin afectar la cache.
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = 256,
+        ruta_db: Optional[str] = None,
+        ttl_por_paso: Optional[Dict[str, int]] = None,
+        ttl_default: int = TTL_DEFAULT
+    ):
+        """
+        Args:
+            max_entradas: Tamaño máximo del nivel en memoria
+            ruta_db: Archivo SQLite del nivel en disco (None lo desactiva)
+            ttl_por_paso: TTL por paso; se combina con TTL_POR_PASO
+            ttl_default: TTL de las solicitudes sin paso o de pasos no configurados
+        """
+        self._max_entradas = max_entradas
+        self._ruta_db = ruta_db
+        self._ttl_por_paso = {**TTL_POR_PASO, **(ttl_por_paso or {})}
+        self._ttl_default = ttl_default
+
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self._contadores = {"aciertos_memoria": 0, "aciertos_disco": 0, "fallos": 0, "escrituras": 0}
+
+        if self._ruta_db:
+            os.makedirs(os.path.dirname(self._ruta_db) or ".", exist_ok=True)
+            self._conexion().executescript(_ESQUEMA)
+
+        nivel_disco = f", disco: {self._ruta_db}" if self._ruta_db else ""
+        print(f"[OK] CacheLLM inicializada (memoria: {max_entradas} entradas{nivel_disco})")
+
+    @classmethod
+    def desde_entorno(cls) -> Optional["CacheLLM"]:
+        """
+        Construye la cache según las variables de entorno, o None si está desactivada.
+
+        SPU_LLM_CACHE (true por defecto), SPU_LLM_CACHE_MAX, SPU_LLM_CACHE_DB y
+        SPU_LLM_CACHE_TTL (JSON con TTL por paso, p. ej. {"documentador": 0}).
+        """
+        if os.environ.get("SPU_LLM_CACHE", "true").strip().lower() in ("0", "false", "no"):
+            return None
+
+        ttl_por_paso = None
+        if os.environ.get("SPU_LLM_CACHE_TTL"):
+            try:
+                ttl_por_paso = {k: int(v) for k, v in json.loads(os.environ["SPU_LLM_CACHE_TTL"]).items()}
+            except (ValueError, AttributeError) as e:
+                print(f"[WARN] SPU_LLM_CACHE_TTL inválido, se usan los TTL por defecto: {e}")
+
+        return cls(
+            max_entradas=int(os.environ.get("SPU_LLM_CACHE_MAX", 256)),
+            ruta_db=os.environ.get("SPU_LLM_CACHE_DB") or None,
+            ttl_por_paso=ttl_por_paso
+        )
+
+    def ttl(self, paso: Optional[str]) -> int:
+        """TTL en segundos para un paso (0 = no se cachea)."""
+        if paso is None:
+            return self._ttl_default
+        return self._ttl_por_paso.get(paso, self._ttl_default)
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Conexión SQLite propia de cada hilo."""
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self._ruta_db, timeout=5, isolation_level=None)
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def obtener(self, clave: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca una respuesta en memoria y luego en disco.
+
+        Returns:
+            Respuesta cacheada, o None si no existe o venció
+        """
+        ahora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(clave)
+            if entrada is not None:
+                valor, expira_en = entrada
+                if expira_en > ahora:
+                    self._memoria.move_to_end(clave)
+                    self._contadores["aciertos_memoria"] += 1
+                    return json.loads(valor)
+                del self._memoria[clave]
+
+        if self._ruta_db:
+            try:
+                fila = self._conexion().execute(
+                    "SELECT valor, expira_en FROM cache_llm WHERE clave = ? AND expira_en > ?",
+                    (clave, ahora)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"[WARN] Error leyendo cache LLM en disco: {e}")
+                fila = None
+            if fila is not None:
+                self._guardar_en_memoria(clave, fila[0], fila[1])
+                with self._lock:
+                    self._contadores["aciertos_disco"] += 1
+                return json.loads(fila[0])
+
+        with self._lock:
+            self._contadores["fallos"] += 1
+        return None
+
+    def guardar(self, clave: str, valor: Dict[str, Any], paso: Optional[str] = None):
+        """Guarda una respuesta con el TTL del paso (no guarda respuestas vacías)."""
+        ttl = self.ttl(paso)
+        if ttl <= 0 or not valor:
+            return
+
+        serializado = json.dumps(valor, ensure_ascii=False)
+        expira_en = time.time() + ttl
+        self._guardar_en_memoria(clave, serializado, expira_en)
+
+        if self._ruta_db:
+            try:
+                conexion = self._conexion()
+                conexion.execute(
+                    "INSERT OR REPLACE INTO cache_llm (clave, valor, expira_en) VALUES (?, ?, ?)",
+                    (clave, serializado, expira_en)
+                )
+                conexion.execute("DELETE FROM cache_llm WHERE expira_en <= ?", (time.time(),))
+            except sqlite3.Error as e:
+                print(f"[WARN] Error guardando cache LLM en disco: {e}")
+
+        with self._lock:
+            self._contadores["escrituras"] += 1
+
+    def _guardar_en_memoria(self, clave: str, serializado: str, expira_en: float):
+        with self._lock:
+            self._memoria[clave] = (serializado, expira_en)
+            self._memoria.move_to_end(clave)
+            while len(self._memoria) > self._max_entradas:
+                self._memoria.popitem(last=False)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de aciertos y fallos, y tamaño del nivel en memoria."""
+        with self._lock:
+            estadisticas = dict(self._contadores)
+            estadisticas["entradas_memoria"] = len(self._memoria)
+        consultas = estadisticas["aciertos_memoria"] + estadisticas["aciertos_disco"] + estadisticas["fallos"]
+        aciertos = estadisticas["aciertos_memoria"] + estadisticas["aciertos_disco"]
+        estadisticas["tasa_aciertos"] = round(aciertos / consultas, 4) if consultas else 0.0
+        return estadisticas
@@ -0,0 +1,84 @@
+"""
+Cache en memoria de PDFs generados, direccionada por el contenido de la
+propuesta y la versión del template.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+
+def clave_pdf(data: Dict[str, Any], version_template: str) -> str:
+    """Hash SHA-256 del JSON canónico de la propuesta y la versión del template."""
+    canonico = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{version_template}\n{canonico}".encode("utf-8")).hexdigest()
+
+
+class CachePDF:
+    """LRU de PDFs acotada por cantidad de entradas y por tamaño total en bytes."""
+
+    def __init__(self, max_entradas: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            max_entradas: Máximo de PDFs en memoria
+            max_bytes: Tamaño total máximo; un PDF más grande que este límite no se guarda
+        """
+        self._max_entradas = max_entradas
+        self._max_bytes = max_bytes
+        self._entradas: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._contadores = {"aciertos": 0, "fallos": 0, "escrituras": 0}
+
+        print(f"[OK] CachePDF inicializada ({max_entradas} entradas, {max_bytes // (1024 * 1024)} MB)")
+
+    @classmethod
+    def desde_entorno(cls) -> Optional["CachePDF"]:
+        """
+        Construye la cache según SPU_PDF_CACHE (true por defecto),
+        SPU_PDF_CACHE_MAX (64 entradas) y SPU_PDF_CACHE_MB (64), o None si está desactivada.
+        """
+        if os.environ.get("SPU_PDF_CACHE", "true").strip().lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_entradas=int(os.environ.get("SPU_PDF_CACHE_MAX", 64)),
+            max_bytes=int(os.environ.get("SPU_PDF_CACHE_MB", 64)) * 1024 * 1024
+        )
+
+    def obtener(self, clave: str) -> Optional[bytes]:
+        """PDF cacheado, o None si no existe."""
+        with self._lock:
+            pdf = self._entradas.get(clave)
+            if pdf is None:
+                self._contadores["fallos"] += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self._contadores["aciertos"] += 1
+            return pdf
+
+    def guardar(self, clave: str, pdf: bytes):
+        """Guarda un PDF y descarta los menos usados hasta respetar los límites."""
+        if not pdf or len(pdf) > self._max_bytes:
+            return
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior)
+            self._entradas[clave] = pdf
+            self._bytes += len(pdf)
+            while len(self._entradas) > self._max_entradas or self._bytes > self._max_bytes:
+                _, descartado = self._entradas.popitem(last=False)
+                self._bytes -= len(descartado)
+            self._contadores["escrituras"] += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        """Contadores de aciertos y fallos, entradas y bytes en memoria."""
+        with self._lock:
+            estadisticas = dict(self._contadores)
+            estadisticas["entradas"] = len(self._entradas)
+            estadisticas["bytes"] = self._bytes
+        consultas = estadisticas["aciertos"] + estadisticas["fallos"]
+        estadisticas["tasa_aciertos"] = round(estadisticas["aciertos"] / consultas, 4) if consultas else 0.0
+        return estadisticas
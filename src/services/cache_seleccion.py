@@ -0,0 +1,221 @@
+"""
+Cache semántica de selecciones de productos.
+
+Clientes con la misma clase de riesgo, el mismo enfoque prioritario y
+riesgos generales parecidos reciben casi el mismo ranking de productos; el
+presupuesto solo cambia la asignación de horas, que se recalcula localmente.
+La cache guarda los ids rankeados por perfil normalizado y versión del
+catálogo para saltarse el selector LLM en perfiles repetidos.
+"""
+import os
+import time
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, List, Optional
+
+from .indice_relevancia import normalizar_categoria, tokenizar
+from .obligaciones_sst import extraer_clase_riesgo, tramo_trabajadores
+
+
+def _riesgos(datos: Dict[str, Any]) -> FrozenSet[str]:
+    """Riesgos generales normalizados (sin tildes ni plurales, sin orden)."""
+    return frozenset(
+        " ".join(tokenizar(riesgo)) or normalizar_categoria(riesgo)
+        for riesgo in datos.get("riesgos_generales") or []
+        if str(riesgo).strip()
+    )
+
+
+def clave_grupo(datos: Dict[str, Any], version_catalogo: str) -> str:
+    """
+    Clave del grupo de perfiles que comparten selección: clase de riesgo,
+    enfoque prioritario, obligaciones legales, tramo de trabajadores y
+    versión del catálogo (todo normalizado). Los riesgos generales se
+    comparan aparte, por similitud.
+    """
+    perfil = {
+        "clase": extraer_clase_riesgo(datos.get("clase_riesgo")) or normalizar_categoria(datos.get("clase_riesgo")),
+        "enfoque": sorted(set(tokenizar(datos.get("enfoque_prioritario")))),
+        "obligaciones": sorted({normalizar_categoria(o) for o in datos.get("obligaciones_legales") or []}),
+        "tramo": tramo_trabajadores(datos.get("numero_empleados")),
+        "catalogo": version_catalogo,
+    }
+    canonico = json.dumps(perfil, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:24]
+
+
+def _similitud(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Índice de Jaccard entre dos conjuntos de riesgos (1.0 si ambos están vacíos)."""
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entrada:
+    """Selección guardada para un perfil y sus estadísticas de uso."""
+    __slots__ = ("riesgos", "ids", "creada_en", "usos", "ultimo_uso")
+
+    def __init__(self, riesgos: FrozenSet[str], ids: Dict[str, List[str]]):
+        self.riesgos = riesgos
+        self.ids = ids
+        self.creada_en = time.time()
+        self.usos = 0
+        self.ultimo_uso = None
+
+
+class CacheSeleccion:
+    """
+    LRU en memoria de rankings de productos (ids por sección).
+
+    Política de frescura: una entrada vence a los `ttl_segundos` o después
+    de `max_usos` reutilizaciones (0 = sin límite); al vencer, el siguiente
+    perfil igual vuelve a consultar al selector y renueva la entrada.
+    """
+
+    def __init__(
+        self,
+        max_entradas: int = 512,
+        ttl_segundos: int = 86400,
+        max_usos: int = 0,
+        similitud_minima: float = 0.8
+    ):
+        """
+        Args:
+            max_entradas: Máximo de perfiles guardados
+            ttl_segundos: Vigencia de una selección
+            max_usos: Reutilizaciones antes de renovar la selección (0 = sin límite)
+            similitud_minima: Jaccard mínimo entre los riesgos generales para
+                reutilizar una selección del mismo grupo (1.0 = riesgos idénticos)
+        """
+        self._max_entradas = max_entradas
+        self._ttl = ttl_segundos
+        self._max_usos = max_usos
+        self._similitud_minima = similitud_minima
+
+        # grupo -> entradas del grupo (una por conjunto de riesgos)
+        self._grupos: "OrderedDict[str, Dict[FrozenSet[str], _Entrada]]" = OrderedDict()
+        self._entradas = 0
+        self._lock = threading.Lock()
+        self._contadores = {"aciertos": 0, "aciertos_similares": 0, "fallos": 0, "vencidas": 0, "escrituras": 0}
+
+        print(f"[OK] CacheSeleccion inicializada ({max_entradas} entradas, TTL {ttl_segundos} s)")
+
+    @classmethod
+    def desde_entorno(cls) -> Optional["CacheSeleccion"]:
+        """
+        Construye la cache según SPU_SELECCION_CACHE (true por defecto),
+        SPU_SELECCION_CACHE_MAX (512), SPU_SELECCION_CACHE_TTL (86400 s),
+        SPU_SELECCION_CACHE_MAX_USOS (0 = sin límite) y
+        SPU_SELECCION_CACHE_SIMILITUD (0.8), o None si está desactivada.
+        """
+        if os.environ.get("SPU_SELECCION_CACHE", "true").strip().lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            max_entradas=int(os.environ.get("SPU_SELECCION_CACHE_MAX", 512)),
+            ttl_segundos=int(os.environ.get("SPU_SELECCION_CACHE_TTL", 86400)),
+            max_usos=int(os.environ.get("SPU_SELECCION_CACHE_MAX_USOS", 0)),
+            similitud_minima=float(os.environ.get("SPU_SELECCION_CACHE_SIMILITUD", 0.8))
+        )
+
+    def _vencida(self, entrada: _Entrada, ahora: float) -> bool:
+        return (
+            ahora - entrada.creada_en > self._ttl
+            or (self._max_usos > 0 and entrada.usos >= self._max_usos)
+        )
+
+    def obtener(self, datos: Dict[str, Any], version_catalogo: str) -> Optional[Dict[str, List[str]]]:
+        """
+        Busca la selección de un perfil igual o parecido.
+
+        Args:
+            datos: Datos combinados del cliente y su perfil de riesgo
+            version_catalogo: Versión del catálogo (CatalogoService.version)
+
+        Returns:
+            Ids rankeados por sección, o None si no hay una selección vigente
+        """
+        grupo = clave_grupo(datos, version_catalogo)
+        riesgos = _riesgos(datos)
+        ahora = time.time()
+        with self._lock:
+            entradas = self._grupos.get(grupo)
+            if entradas is None:
+                self._contadores["fallos"] += 1
+                return None
+            self._grupos.move_to_end(grupo)
+
+            for clave in [c for c, e in entradas.items() if self._vencida(e, ahora)]:
+                del entradas[clave]
+                self._entradas -= 1
+                self._contadores["vencidas"] += 1
+
+            entrada = entradas.get(riesgos)
+            exacta = entrada is not None
+            if not exacta and entradas:
+                similitud, entrada = max(
+                    ((_similitud(riesgos, e.riesgos), e) for e in entradas.values()),
+                    key=lambda par: par[0]
+                )
+                if similitud < self._similitud_minima:
+                    entrada = None
+            if not entradas:
+                del self._grupos[grupo]
+
+            if entrada is None:
+                self._contadores["fallos"] += 1
+                return None
+            entrada.usos += 1
+            entrada.ultimo_uso = ahora
+            self._contadores["aciertos" if exacta else "aciertos_similares"] += 1
+            return {seccion: list(ids) for seccion, ids in entrada.ids.items()}
+
+    def guardar(self, datos: Dict[str, Any], version_catalogo: str, ids: Dict[str, List[str]]):
+        """Guarda los ids rankeados por sección de un perfil (no guarda selecciones vacías)."""
+        if not any(ids.values()):
+            return
+        grupo = clave_grupo(datos, version_catalogo)
+        riesgos = _riesgos(datos)
+        with self._lock:
+            entradas = self._grupos.setdefault(grupo, {})
+            self._grupos.move_to_end(grupo)
+            if riesgos not in entradas:
+                self._entradas += 1
+            entradas[riesgos] = _Entrada(riesgos, {seccion: list(lista) for seccion, lista in ids.items()})
+            # Descarta los grupos menos usados hasta respetar el límite
+            while self._entradas > self._max_entradas and len(self._grupos) > 1:
+                _, descartadas = self._grupos.popitem(last=False)
+                self._entradas -= len(descartadas)
+            self._contadores["escrituras"] += 1
+
+    def estadisticas(self, max_claves: int = 10) -> Dict[str, Any]:
+        """
+        Contadores globales y, para las claves más reutilizadas, sus aciertos,
+        antigüedad y último uso.
+        """
+        ahora = time.time()
+        with self._lock:
+            estadisticas = dict(self._contadores)
+            estadisticas["entradas"] = self._entradas
+            claves = [
+                (grupo, entrada) for grupo, entradas in self._grupos.items()
+                for entrada in entradas.values()
+            ]
+        claves.sort(key=lambda par: par[1].usos, reverse=True)
+        estadisticas["claves"] = [
+            {
+                "grupo": grupo,
+                "riesgos": sorted(entrada.riesgos),
+                "aciertos": entrada.usos,
+                "edad_segundos": round(ahora - entrada.creada_en, 1),
+                "ultimo_uso_hace_segundos": (
+                    round(ahora - entrada.ultimo_uso, 1) if entrada.ultimo_uso is not None else None
+                ),
+            }
+            for grupo, entrada in claves[:max_claves]
+        ]
+        aciertos = estadisticas["aciertos"] + estadisticas["aciertos_similares"]
+        consultas = aciertos + estadisticas["fallos"]
+        estadisticas["tasa_aciertos"] = round(aciertos / consultas, 4) if consultas else 0.0
+        return estadisticas
@@ -1,74 +1,404 @@
 """
 Servicio para obtener el catálogo de productos desde la API de Automy.
 """
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+
+import numpy as np
 import requests
-from typing import List, Dict, Any
+
+from .metricas import registrar_paso
+from .tabla_catalogo import TablaCatalogo
+
+
+RUTA_SNAPSHOT_DEFAULT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "catalogo_snapshot.json"
+)
+
+# Claves con las que Automy puede reportar el total de registros o de páginas
+_CLAVES_TOTAL = ("total", "totalItems", "totalCount", "totalRecords", "count")
+_CLAVES_PAGINAS = ("totalPages", "pages", "pageCount")
+
+
+class CatalogoNoDisponibleError(RuntimeError):
+    """No hay catálogo en memoria ni snapshot local y Automy no respondió."""
 
 
 class CatalogoService:
-    """Servicio para interactuar con el catálogo de productos ARL."""
-    
+    """
+    Servicio para interactuar con el catálogo de productos ARL.
+
+    El catálogo se sirve desde memoria y se revalida en segundo plano cuando
+    vence el TTL (ETag / If-Modified-Since). Cada carga exitosa se guarda en
+    un snapshot local que se usa al arrancar y cuando Automy falla.
+    """
+
     AUTOMY_URL = "https://apis.automy.global/entity/external/read/ZjlmNjY2N2ItNDc2YS00ZThmLTgxNzctNjdiNmJlNTFiMDQ3"
-    
-    def __init__(self):
-        self._catalogo_cache = None
-        print("[OK] CatalogoService inicializado")
-    
-    def obtener_catalogo(self, page: int = 1, page_size: int = 400) -> List[Dict[str, Any]]:
+
+    def __init__(
+        self,
+        ttl_segundos: Optional[int] = None,
+        ruta_snapshot: Optional[str] = None,
+        page_size: int = 400,
+        max_workers: int = 4,
+        max_paginas: Optional[int] = None
+    ):
         """
-        Obtiene el catálogo de productos desde Automy.
-        
         Args:
-            page: Número de página
-            page_size: Cantidad de registros por página
-            
+            ttl_segundos: Vigencia del catálogo en memoria (SPU_CATALOGO_TTL, 3600 por defecto)
+            ruta_snapshot: Archivo del snapshot local (SPU_CATALOGO_SNAPSHOT)
+            page_size: Cantidad de registros por página en Automy
+            max_workers: Páginas que se descargan en paralelo
+            max_paginas: Máximo de páginas por descarga (SPU_CATALOGO_MAX_PAGINAS, 50 por defecto)
+        """
+        self._ttl = ttl_segundos if ttl_segundos is not None else int(os.environ.get("SPU_CATALOGO_TTL", 3600))
+        self._ruta_snapshot = ruta_snapshot or os.environ.get("SPU_CATALOGO_SNAPSHOT", RUTA_SNAPSHOT_DEFAULT)
+        self._page_size = page_size
+        self._max_workers = max_workers
+        self._max_paginas = max_paginas if max_paginas is not None else int(os.environ.get("SPU_CATALOGO_MAX_PAGINAS", 50))
+
+        self._obtenido_en = 0.0
+        self._etag = None
+        self._last_modified = None
+        # Catálogo materializado (productos, versión e índices) o None si todavía
+        # no hay catálogo. Es inmutable y se publica con una sola asignación: los
+        # lectores toman una referencia y nunca mezclan datos de dos versiones
+        self._tabla: Optional[TablaCatalogo] = None
+
+        self._lock = threading.Lock()
+        # Activo cuando no hay un refresco en curso; quien necesita el catálogo espera en él
+        self._sin_refresco = threading.Event()
+        self._sin_refresco.set()
+
+        self._cargar_snapshot()
+        if self._tabla is None or self._vencido():
+            self._refrescar_en_segundo_plano()
+
+        print("[OK] CatalogoService inicializado")
+
+    @property
+    def version(self) -> str:
+        """Hash del contenido del catálogo cargado (vacío si no hay catálogo)."""
+        tabla = self._tabla
+        return tabla.version if tabla is not None else ""
+
+    def obtener_catalogo(self) -> List[Dict[str, Any]]:
+        """
+        Obtiene el catálogo de productos.
+
+        Retorna la copia en memoria (aunque esté vencida, disparando una
+        revalidación en segundo plano). Solo descarga de forma síncrona si
+        todavía no hay ningún catálogo cargado.
+
         Returns:
             Lista de productos del catálogo
+
+        Raises:
+            CatalogoNoDisponibleError: Si no hay catálogo en memoria ni
+                snapshot y la descarga falla
         """
-        # Usar cache si está disponible
-        if self._catalogo_cache:
-            return self._catalogo_cache
-        
+        return self.obtener_tabla().productos
+
+    def _vencido(self) -> bool:
+        return time.time() - self._obtenido_en > self._ttl
+
+    def _refrescar_en_segundo_plano(self):
+        """Lanza una revalidación en un hilo si no hay otra en curso."""
+        with self._lock:
+            if not self._sin_refresco.is_set():
+                return
+            self._sin_refresco.clear()
+        threading.Thread(target=self._refrescar, kwargs={"reservado": True}, daemon=True).start()
+
+    def _refrescar(self, reservado: bool = False):
+        """
+        Descarga el catálogo (o lo revalida) y actualiza la cache.
+        Si Automy falla se conserva el catálogo anterior (stale-while-error).
+        """
+        if not reservado:
+            # Esperar (bloqueado, sin sondeo) a un refresco en curso en lugar de duplicar la descarga
+            while True:
+                with self._lock:
+                    if self._sin_refresco.is_set():
+                        self._sin_refresco.clear()
+                        break
+                self._sin_refresco.wait()
+            if self._tabla is not None and not self._vencido():
+                self._sin_refresco.set()
+                return
+
         try:
-            url = f"{self.AUTOMY_URL}?page={page}&pageSize={page_size}"
-            
-            headers = {
-                "Content-Type": "application/json"
-            }
-            
-            response = requests.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            
-            # Extraer items del catálogo
-            if isinstance(data, dict) and "items" in data:
-                self._catalogo_cache = data["items"]
-            elif isinstance(data, list):
-                self._catalogo_cache = data
+            inicio = time.perf_counter()
+            items, etag, last_modified = self._descargar()
+            registrar_paso("catalogo_descarga", time.perf_counter() - inicio)
+            if items is None:
+                print("[OK] Catalogo sin cambios (304), se extiende la vigencia")
+                self._obtenido_en = time.time()
             else:
-                self._catalogo_cache = []
-            
-            print(f"[OK] Catalogo cargado: {len(self._catalogo_cache)} productos")
-            return self._catalogo_cache
-            
+                self._etag, self._last_modified = etag, last_modified
+                self._actualizar_cache(items, time.time())
+                self._guardar_snapshot()
+        except Exception as e:
+            if self._tabla is not None:
+                print(f"[WARN] Error revalidando catalogo, se usa la copia existente: {e}")
+            else:
+                print(f"[ERROR] Error obteniendo catalogo: {e}")
+        finally:
+            self._sin_refresco.set()
+
+    def _descargar(self) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str], Optional[str]]:
+        """
+        Descarga todas las páginas del catálogo.
+
+        Returns:
+            Tupla (items, etag, last_modified). items es None si Automy
+            respondió 304 (el catálogo no cambió).
+        """
+        headers = {"Content-Type": "application/json"}
+        if self._tabla is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+        response = requests.get(self._url_pagina(1), headers=headers, timeout=30)
+        if response.status_code == 304:
+            return None, self._etag, self._last_modified
+        response.raise_for_status()
+
+        data = response.json()
+        items = self._extraer_items(data)
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if len(items) < self._page_size:
+            return items, etag, last_modified
+
+        total_paginas = self._total_paginas(data)
+        if total_paginas and total_paginas > self._max_paginas:
+            print(f"[WARN] Automy reporta {total_paginas} paginas; se descargan solo {self._max_paginas}")
+            total_paginas = self._max_paginas
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            if total_paginas:
+                # Total conocido: descargar el resto de páginas en paralelo
+                for pagina in executor.map(self._descargar_pagina, range(2, total_paginas + 1)):
+                    items.extend(pagina)
+            else:
+                # Total desconocido: lotes paralelos hasta una página incompleta, vacía o
+                # repetida (si Automy ignora el parámetro page), con un máximo de páginas
+                siguiente = 2
+                primero_anterior = items[0]
+                completo = False
+                while not completo and siguiente <= self._max_paginas:
+                    lote = range(siguiente, min(siguiente + self._max_workers, self._max_paginas + 1))
+                    for pagina in executor.map(self._descargar_pagina, lote):
+                        if not pagina or pagina[0] == primero_anterior:
+                            completo = True
+                            break
+                        items.extend(pagina)
+                        primero_anterior = pagina[0]
+                        if len(pagina) < self._page_size:
+                            completo = True
+                            break
+                    siguiente += len(lote)
+                if not completo:
+                    print(f"[WARN] Descarga del catalogo detenida en el maximo de {self._max_paginas} paginas")
+
+        return items, etag, last_modified
+
+    def _descargar_pagina(self, page: int) -> List[Dict[str, Any]]:
+        response = requests.get(
+            self._url_pagina(page),
+            headers={"Content-Type": "application/json"},
+            timeout=30
+        )
+        response.raise_for_status()
+        return self._extraer_items(response.json())
+
+    def _url_pagina(self, page: int) -> str:
+        return f"{self.AUTOMY_URL}?page={page}&pageSize={self._page_size}"
+
+    @staticmethod
+    def _extraer_items(data: Any) -> List[Dict[str, Any]]:
+        """Extrae items del catálogo de la respuesta de Automy."""
+        if isinstance(data, dict) and "items" in data:
+            return list(data["items"] or [])
+        if isinstance(data, list):
+            return data
+        return []
+
+    def _total_paginas(self, data: Any) -> Optional[int]:
+        """Número total de páginas según la respuesta, si Automy lo reporta."""
+        if not isinstance(data, dict):
+            return None
+        for clave in _CLAVES_PAGINAS:
+            if isinstance(data.get(clave), int):
+                return data[clave]
+        for clave in _CLAVES_TOTAL:
+            if isinstance(data.get(clave), int):
+                return -(-data[clave] // self._page_size)
+        return None
+
+    def _actualizar_cache(self, items: List[Dict[str, Any]], obtenido_en: float):
+        """Reemplaza el catálogo en memoria y reconstruye sus índices si cambió."""
+        version = hashlib.sha1(
+            json.dumps(items, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()[:12]
+
+        tabla = self._tabla
+        if tabla is None or version != tabla.version:
+            self._tabla = TablaCatalogo(items, version)
+            print(f"[OK] Catalogo cargado: {len(items)} productos (version {version})")
+
+        self._obtenido_en = obtenido_en
+
+    def _cargar_snapshot(self):
+        """Carga el snapshot local, si existe, para servir el catálogo de inmediato."""
+        if not self._ruta_snapshot or not os.path.exists(self._ruta_snapshot):
+            return
+        try:
+            with open(self._ruta_snapshot, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self._etag = snapshot.get("etag")
+            self._last_modified = snapshot.get("last_modified")
+            self._actualizar_cache(snapshot.get("items", []), float(snapshot.get("obtenido_en", 0)))
+            print(f"[OK] Snapshot de catalogo cargado desde {self._ruta_snapshot}")
+        except Exception as e:
+            print(f"[WARN] No se pudo cargar el snapshot del catalogo: {e}")
+
+    def _guardar_snapshot(self):
+        """Guarda el catálogo actual en disco (escritura atómica)."""
+        tabla = self._tabla
+        if not self._ruta_snapshot or tabla is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self._ruta_snapshot) or ".", exist_ok=True)
+            temporal = f"{self._ruta_snapshot}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({
+                    "guardado_en": datetime.now().isoformat(),
+                    "obtenido_en": self._obtenido_en,
+                    "etag": self._etag,
+                    "last_modified": self._last_modified,
+                    "items": tabla.productos,
+                }, f, ensure_ascii=False)
+            os.replace(temporal, self._ruta_snapshot)
         except Exception as e:
-            print(f"[ERROR] Error obteniendo catalogo: {e}")
-            return []
-    
+            print(f"[WARN] No se pudo guardar el snapshot del catalogo: {e}")
+
+    def obtener_tabla(self) -> TablaCatalogo:
+        """
+        Catálogo materializado (columnas e índices) de la versión actual.
+
+        Retorna la versión en memoria (aunque esté vencida, disparando una
+        revalidación en segundo plano). Solo descarga de forma síncrona si
+        todavía no hay ningún catálogo cargado.
+
+        Returns:
+            TablaCatalogo; los llamadores que hacen varias consultas deben
+            usar esta misma referencia para no mezclar versiones
+
+        Raises:
+            CatalogoNoDisponibleError: Si no hay catálogo en memoria ni
+                snapshot y la descarga falla
+        """
+        tabla = self._tabla
+        if tabla is not None:
+            if self._vencido():
+                self._refrescar_en_segundo_plano()
+            return tabla
+
+        self._refrescar()
+        tabla = self._tabla
+        if tabla is None:
+            raise CatalogoNoDisponibleError(
+                "No se pudo descargar el catálogo de Automy y no hay snapshot local"
+            )
+        return tabla
+
+    def categorias(self) -> Dict[str, int]:
+        """Categorías del catálogo y su cantidad de productos."""
+        return self.obtener_tabla().nombres_categorias()
+
     def filtrar_por_categoria(self, categoria: str) -> List[Dict[str, Any]]:
         """
         Filtra productos por categoría.
-        
+
         Args:
             categoria: Nombre de la categoría a filtrar
-            
+
         Returns:
             Lista de productos de esa categoría
         """
-        catalogo = self.obtener_catalogo()
-        return [
-            p for p in catalogo 
-            if p.get("categoria_de_programas", "").upper() == categoria.upper()
-        ]
+        return self.obtener_tabla().por_categoria(categoria)
+
+    def buscar_producto(self, producto: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Busca en el catálogo el registro original de un producto seleccionado.
+
+        Args:
+            producto: Producto con al menos categoría y descripción
+
+        Returns:
+            Producto del catálogo, o None si no se encuentra
+        """
+        return self.obtener_tabla().por_clave(producto)
+
+    def buscar_por_id(self, id_: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca un producto por su id corto (ver tabla_catalogo.id_producto).
+
+        Args:
+            id_: Id retornado por el selector
+
+        Returns:
+            Producto del catálogo, o None si el id no existe
+        """
+        return self.obtener_tabla().por_id(id_)
+
+    def tarifas_de(self, productos: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Tarifas normalizadas de los productos (matriz NumPy, una columna por
+        campo de tarifa), tomadas de la fila del catálogo de cada producto
+        (la de su "id" en los registros hidratados).
+        """
+        return self.obtener_tabla().tarifas_de(productos)
+
+    def buscar_relevantes(
+        self,
+        consulta: Iterable[str],
+        categorias: Optional[Iterable[str]] = None,
+        k: int = 10
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca los productos más relevantes para una consulta (BM25).
+
+        Args:
+            consulta: Textos de la consulta (obligaciones, riesgos, enfoque)
+            categorias: Categorías a las que se restringe la búsqueda
+            k: Número máximo de productos
+
+        Returns:
+            Productos del catálogo ordenados por relevancia
+        """
+        return self.obtener_tabla().buscar_relevantes(consulta, categorias, k)
+
+
+if __name__ == "__main__":
+    # Precarga del snapshot local (se ejecuta al construir la imagen para que
+    # el primer arranque no dependa de Automy):
+    #   python -m src.services.catalogo_service
+    import sys
 
+    try:
+        tabla = CatalogoService().obtener_tabla()
+    except CatalogoNoDisponibleError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    print(f"[OK] Snapshot del catalogo listo: {len(tabla.productos)} productos (version {tabla.version})")
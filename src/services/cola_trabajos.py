@@ -0,0 +1,369 @@
+"""
+Cola persistente de trabajos de generación de propuestas.
+
+Los trabajos se guardan en SQLite y los procesa un pool acotado de hilos,
+de modo que el endpoint HTTP responde de inmediato con un id de trabajo.
+Cada trabajo en proceso tiene un dueño (la instancia de la cola) y un lease
+que el dueño renueva; solo los leases vencidos vuelven a la cola, así que
+varios procesos pueden compartir la base sin ejecutar un trabajo dos veces.
+El PDF no se guarda en la base: el resultado trae su `pdf_id` del almacén
+de PDF (almacen_pdf).
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Callable, Tuple
+
+
+RUTA_DB_DEFAULT = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "trabajos.sqlite3"
+)
+
+ESTADO_PENDIENTE = "pendiente"
+ESTADO_EN_PROCESO = "en_proceso"
+ESTADO_COMPLETADO = "completado"
+ESTADO_ERROR = "error"
+
+# Función que procesa un trabajo: recibe los datos y retorna el resultado
+# (con el "pdf_id" del PDF guardado en el almacén, si lo hay)
+Ejecutor = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    clave TEXT UNIQUE NOT NULL,
+    estado TEXT NOT NULL,
+    datos TEXT NOT NULL,
+    resultado TEXT,
+    pdf_id TEXT,
+    error TEXT,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    propietario TEXT,
+    vence_en REAL,
+    creado_en REAL NOT NULL,
+    actualizado_en REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado_en);
+"""
+
+# Columnas agregadas a bases creadas con versiones anteriores
+_COLUMNAS_NUEVAS = {
+    "pdf_id": "TEXT",
+    "propietario": "TEXT",
+    "vence_en": "REAL",
+}
+
+
+class ColaLlenaError(Exception):
+    """Se alcanzó el máximo de trabajos pendientes."""
+
+
+def clave_idempotencia(datos: Dict[str, Any]) -> str:
+    """Hash SHA-256 del payload canónico (mismo payload → mismo trabajo)."""
+    canonico = json.dumps(datos, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonico.encode("utf-8")).hexdigest()
+
+
+class ColaTrabajos:
+    """
+    Cola de trabajos respaldada por SQLite con un pool fijo de workers.
+
+    - Los reintentos del cliente con el mismo payload (o la misma clave de
+      idempotencia) retornan el trabajo existente en lugar de duplicarlo.
+    - Un trabajo en proceso se retoma solo si su lease venció (su dueño
+      se detuvo sin terminarlo), aunque la base la compartan varios procesos.
+    - Los trabajos terminados se eliminan después del período de retención.
+    """
+
+    def __init__(
+        self,
+        ejecutor: Ejecutor,
+        ruta_db: Optional[str] = None,
+        max_workers: Optional[int] = None,
+        max_pendientes: Optional[int] = None,
+        retencion_segundos: Optional[int] = None,
+        lease_segundos: Optional[int] = None,
+        max_intentos: Optional[int] = None
+    ):
+        """
+        Args:
+            ejecutor: Función que procesa los datos de un trabajo
+            ruta_db: Archivo SQLite (SPU_JOBS_DB)
+            max_workers: Trabajos procesados en paralelo (SPU_JOBS_WORKERS, 4 por defecto)
+            max_pendientes: Máximo de trabajos en cola (SPU_JOBS_MAX_PENDIENTES, 100 por defecto)
+            retencion_segundos: Vigencia de los trabajos terminados (SPU_JOBS_RETENCION, 86400 por defecto)
+            lease_segundos: Vigencia del lease de un trabajo en proceso sin renovarlo
+                (SPU_JOBS_LEASE, 60 por defecto); se renueva cada tercio de ese tiempo
+            max_intentos: Veces que se toma un trabajo antes de marcarlo como error
+                si se sigue interrumpiendo (SPU_JOBS_MAX_INTENTOS, 3 por defecto)
+        """
+        self._ejecutor = ejecutor
+        self._ruta_db = ruta_db or os.environ.get("SPU_JOBS_DB", RUTA_DB_DEFAULT)
+        self._max_workers = max_workers or int(os.environ.get("SPU_JOBS_WORKERS", 4))
+        self._max_pendientes = max_pendientes or int(os.environ.get("SPU_JOBS_MAX_PENDIENTES", 100))
+        self._retencion = (
+            retencion_segundos if retencion_segundos is not None
+            else int(os.environ.get("SPU_JOBS_RETENCION", 86400))
+        )
+        self._lease = lease_segundos or int(os.environ.get("SPU_JOBS_LEASE", 60))
+        self._max_intentos = max_intentos or int(os.environ.get("SPU_JOBS_MAX_INTENTOS", 3))
+        # Dueño de los leases tomados por esta instancia
+        self._propietario = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._local = threading.local()
+        self._hay_trabajo = threading.Condition()
+
+        os.makedirs(os.path.dirname(self._ruta_db) or ".", exist_ok=True)
+        conexion = self._conexion()
+        conexion.executescript(_ESQUEMA)
+        existentes = {fila["name"] for fila in conexion.execute("PRAGMA table_info(trabajos)")}
+        for columna, tipo in _COLUMNAS_NUEVAS.items():
+            if columna not in existentes:
+                conexion.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {tipo}")
+
+        # Trabajos interrumpidos (lease vencido, o sin lease en bases anteriores) vuelven a la cola,
+        # salvo los que ya agotaron sus intentos
+        self._descartar_agotados(conexion, time.time())
+        retomados = conexion.execute(
+            "UPDATE trabajos SET estado = ?, propietario = NULL, vence_en = NULL, actualizado_en = ? "
+            "WHERE estado = ? AND (vence_en IS NULL OR vence_en < ?)",
+            (ESTADO_PENDIENTE, time.time(), ESTADO_EN_PROCESO, time.time())
+        ).rowcount
+        if retomados:
+            print(f"[INFO] {retomados} trabajos interrumpidos vuelven a la cola")
+
+        for i in range(self._max_workers):
+            threading.Thread(target=self._worker, name=f"cola-trabajos-{i}", daemon=True).start()
+        threading.Thread(target=self._renovar_leases, name="cola-trabajos-lease", daemon=True).start()
+
+        print(f"[OK] ColaTrabajos inicializada: {self._max_workers} workers ({self._ruta_db})")
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Conexión SQLite propia de cada hilo (autocommit, WAL)."""
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(self._ruta_db, timeout=30, isolation_level=None)
+            conexion.row_factory = sqlite3.Row
+            conexion.execute("PRAGMA journal_mode=WAL")
+            self._local.conexion = conexion
+        return conexion
+
+    def encolar(self, datos: Dict[str, Any], clave: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Encola un trabajo, o retorna el existente si ya se recibió el mismo payload.
+
+        Args:
+            datos: Datos del formulario
+            clave: Clave de idempotencia (por defecto, el hash del payload)
+
+        Returns:
+            Tupla (trabajo, creado). creado es False si el trabajo ya existía.
+
+        Raises:
+            ColaLlenaError: Si se alcanzó el máximo de trabajos pendientes
+        """
+        clave = clave or clave_idempotencia(datos)
+        conexion = self._conexion()
+        ahora = time.time()
+
+        self._purgar(ahora)
+
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            existente = conexion.execute("SELECT * FROM trabajos WHERE clave = ?", (clave,)).fetchone()
+            if existente is not None and existente["estado"] != ESTADO_ERROR:
+                conexion.execute("COMMIT")
+                return self._a_dict(existente), False
+
+            pendientes = conexion.execute(
+                "SELECT COUNT(*) FROM trabajos WHERE estado = ?", (ESTADO_PENDIENTE,)
+            ).fetchone()[0]
+            if pendientes >= self._max_pendientes:
+                raise ColaLlenaError(f"Hay {pendientes} trabajos pendientes")
+
+            datos_json = json.dumps(datos, ensure_ascii=False, default=str)
+            if existente is not None:
+                # Un trabajo fallido se reintenta con el mismo id
+                trabajo_id = existente["id"]
+                conexion.execute(
+                    "UPDATE trabajos SET estado = ?, datos = ?, resultado = NULL, pdf_id = NULL, "
+                    "error = NULL, intentos = 0, actualizado_en = ? WHERE id = ?",
+                    (ESTADO_PENDIENTE, datos_json, ahora, trabajo_id)
+                )
+            else:
+                trabajo_id = uuid.uuid4().hex
+                conexion.execute(
+                    "INSERT INTO trabajos (id, clave, estado, datos, creado_en, actualizado_en) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (trabajo_id, clave, ESTADO_PENDIENTE, datos_json, ahora, ahora)
+                )
+            conexion.execute("COMMIT")
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+
+        with self._hay_trabajo:
+            self._hay_trabajo.notify()
+
+        return self.obtener(trabajo_id), True
+
+    def obtener(self, trabajo_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Obtiene el estado y el resultado de un trabajo.
+
+        Returns:
+            Trabajo, o None si no existe
+        """
+        fila = self._conexion().execute(
+            "SELECT id, estado, resultado, pdf_id, error, intentos, creado_en, actualizado_en "
+            "FROM trabajos WHERE id = ?",
+            (trabajo_id,)
+        ).fetchone()
+        return self._a_dict(fila) if fila is not None else None
+
+    def obtener_pdf_id(self, trabajo_id: str) -> Optional[str]:
+        """Id en el almacén de PDF del PDF de un trabajo completado, si existe."""
+        fila = self._conexion().execute(
+            "SELECT pdf_id FROM trabajos WHERE id = ? AND estado = ?", (trabajo_id, ESTADO_COMPLETADO)
+        ).fetchone()
+        return fila["pdf_id"] if fila is not None else None
+
+    @staticmethod
+    def _a_dict(fila: sqlite3.Row) -> Dict[str, Any]:
+        trabajo = {
+            "job_id": fila["id"],
+            "estado": fila["estado"],
+            "intentos": fila["intentos"],
+            "creado_en": fila["creado_en"],
+            "actualizado_en": fila["actualizado_en"],
+        }
+        trabajo["pdf_disponible"] = fila["pdf_id"] is not None
+        if fila["resultado"]:
+            trabajo["resultado"] = json.loads(fila["resultado"])
+        if fila["error"]:
+            trabajo["error"] = fila["error"]
+        return trabajo
+
+    def _tomar_siguiente(self) -> Optional[sqlite3.Row]:
+        """
+        Reserva el trabajo pendiente (o con el lease vencido) más antiguo con
+        un lease de esta instancia (seguro entre procesos).
+        """
+        conexion = self._conexion()
+        ahora = time.time()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            self._descartar_agotados(conexion, ahora)
+            fila = conexion.execute(
+                "SELECT id, datos, estado FROM trabajos "
+                "WHERE estado = ? OR (estado = ? AND (vence_en IS NULL OR vence_en < ?)) "
+                "ORDER BY creado_en LIMIT 1",
+                (ESTADO_PENDIENTE, ESTADO_EN_PROCESO, ahora)
+            ).fetchone()
+            if fila is not None:
+                if fila["estado"] == ESTADO_EN_PROCESO:
+                    print(f"[WARN] Lease vencido del trabajo {fila['id']}: se retoma")
+                conexion.execute(
+                    "UPDATE trabajos SET estado = ?, intentos = intentos + 1, propietario = ?, "
+                    "vence_en = ?, actualizado_en = ? WHERE id = ?",
+                    (ESTADO_EN_PROCESO, self._propietario, ahora + self._lease, ahora, fila["id"])
+                )
+            conexion.execute("COMMIT")
+            return fila
+        except Exception:
+            conexion.execute("ROLLBACK")
+            raise
+
+    def _descartar_agotados(self, conexion: sqlite3.Connection, ahora: float):
+        """
+        Marca como error los trabajos con el lease vencido que ya se tomaron
+        max_intentos veces (p. ej. los que tumban el proceso en cada intento).
+        """
+        agotados = conexion.execute(
+            "SELECT id FROM trabajos WHERE estado = ? AND (vence_en IS NULL OR vence_en < ?) AND intentos >= ?",
+            (ESTADO_EN_PROCESO, ahora, self._max_intentos)
+        ).fetchall()
+        for fila in agotados:
+            print(f"[ERROR] Trabajo {fila['id']} interrumpido {self._max_intentos} veces: se marca como error")
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, error = ?, propietario = NULL, vence_en = NULL, "
+                "actualizado_en = ? WHERE id = ?",
+                (
+                    ESTADO_ERROR,
+                    f"Se superó el máximo de intentos ({self._max_intentos}): el trabajo se interrumpió en cada intento",
+                    ahora,
+                    fila["id"]
+                )
+            )
+
+    def _worker(self):
+        """Procesa trabajos pendientes; espera una notificación cuando la cola está vacía."""
+        while True:
+            try:
+                fila = self._tomar_siguiente()
+            except Exception as e:
+                print(f"[ERROR] Error leyendo la cola de trabajos: {e}")
+                fila = None
+
+            if fila is None:
+                with self._hay_trabajo:
+                    # El timeout cubre trabajos encolados por otros procesos
+                    self._hay_trabajo.wait(timeout=5)
+                continue
+
+            self._procesar(fila["id"], json.loads(fila["datos"]))
+
+    def _renovar_leases(self):
+        """Renueva periódicamente los leases de los trabajos que procesa esta instancia."""
+        while True:
+            time.sleep(self._lease / 3)
+            try:
+                self._conexion().execute(
+                    "UPDATE trabajos SET vence_en = ? WHERE propietario = ? AND estado = ?",
+                    (time.time() + self._lease, self._propietario, ESTADO_EN_PROCESO)
+                )
+            except Exception as e:
+                print(f"[WARN] No se pudieron renovar los leases de la cola de trabajos: {e}")
+
+    def _procesar(self, trabajo_id: str, datos: Dict[str, Any]):
+        print(f"[INFO] Procesando trabajo {trabajo_id}")
+        try:
+            resultado = self._ejecutor(datos)
+            estado, error = ESTADO_COMPLETADO, None
+        except Exception as e:
+            print(f"[ERROR] Error procesando trabajo {trabajo_id}: {e}")
+            resultado = None
+            estado, error = ESTADO_ERROR, str(e)
+
+        actualizados = self._conexion().execute(
+            "UPDATE trabajos SET estado = ?, resultado = ?, pdf_id = ?, error = ?, propietario = NULL, "
+            "vence_en = NULL, actualizado_en = ? WHERE id = ? AND propietario = ?",
+            (
+                estado,
+                json.dumps(resultado, ensure_ascii=False, default=str) if resultado is not None else None,
+                resultado.get("pdf_id") if resultado is not None else None,
+                error,
+                time.time(),
+                trabajo_id,
+                self._propietario
+            )
+        ).rowcount
+        if not actualizados:
+            # Otro proceso retomó el trabajo tras vencer el lease; su resultado prevalece
+            print(f"[WARN] Trabajo {trabajo_id} terminado sin lease vigente: se descarta el resultado")
+            return
+        print(f"[OK] Trabajo {trabajo_id} terminado: {estado}")
+
+    def _purgar(self, ahora: float):
+        """Elimina los trabajos terminados que superaron el período de retención."""
+        if self._retencion <= 0:
+            return
+        self._conexion().execute(
+            "DELETE FROM trabajos WHERE estado IN (?, ?) AND actualizado_en < ?",
+            (ESTADO_COMPLETADO, ESTADO_ERROR, ahora - self._retencion)
+        )
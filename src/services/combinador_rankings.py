@@ -0,0 +1,83 @@
+"""
+Combinación de los rankings de los sub-agentes del selector de productos.
+
+Cada sub-agente rankea solo sus categorías; el optimizador de presupuesto
+recorta cada sección a MAX_PRODUCTOS_POR_SECCION y asigna las horas mínimas
+en orden. Para que un sub-agente con muchos productos (p. ej. DIFERENCIAL)
+no desplace a los demás, las secciones se intercalan por posición relativa
+en cada ranking y algunos sub-agentes tienen cupos reservados antes del tope.
+"""
+from typing import Any, Dict, List, Optional
+
+from .optimizador_presupuesto import LIMITES_HORAS, MAX_PRODUCTOS_POR_SECCION
+
+
+# Productos de cada sub-agente que siempre entran en una sección con tope
+CUPOS_RESERVADOS = {
+    "profesionales": 4,
+}
+
+
+def combinar_rankings(
+    parciales: Dict[str, Dict[str, List[Dict[str, Any]]]],
+    secciones: tuple,
+    cupos_reservados: Optional[Dict[str, int]] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Merge determinístico de los rankings de los sub-agentes.
+
+    Un producto aparece una sola vez (por su "id"), en la primera sección
+    de los sub-agentes en su orden. Cada sección intercala los rankings por
+    posición relativa ((posición + 1) / (largo + 1)), desempatando por el
+    orden de los sub-agentes. Las secciones que el optimizador recorta
+    (LIMITES_HORAS) se limitan a MAX_PRODUCTOS_POR_SECCION, conservando los
+    primeros `cupos_reservados` productos de cada sub-agente.
+
+    Args:
+        parciales: Secciones hidratadas de cada sub-agente, en el orden de combinación
+        secciones: Secciones del resultado
+        cupos_reservados: Cupos por sub-agente (por defecto, CUPOS_RESERVADOS)
+
+    Returns:
+        Productos rankeados por sección
+    """
+    cupos_reservados = CUPOS_RESERVADOS if cupos_reservados is None else cupos_reservados
+
+    # (posición relativa, orden del sub-agente, posición, sub-agente, producto) por sección
+    entradas: Dict[str, List[tuple]] = {seccion: [] for seccion in secciones}
+    vistos = set()
+    for orden, (subagente, parcial) in enumerate(parciales.items()):
+        for seccion, productos in parcial.items():
+            unicos = []
+            for producto in productos:
+                if producto["id"] not in vistos:
+                    vistos.add(producto["id"])
+                    unicos.append(producto)
+            for posicion, producto in enumerate(unicos):
+                relativa = (posicion + 1) / (len(unicos) + 1)
+                entradas[seccion].append((relativa, orden, posicion, subagente, producto))
+
+    resultado = {}
+    for seccion, filas in entradas.items():
+        filas.sort(key=lambda fila: fila[:3])
+        if seccion in LIMITES_HORAS and len(filas) > MAX_PRODUCTOS_POR_SECCION:
+            filas = _recortar(filas, cupos_reservados)
+        resultado[seccion] = [fila[-1] for fila in filas]
+    return resultado
+
+
+def _recortar(filas: List[tuple], cupos_reservados: Dict[str, int]) -> List[tuple]:
+    """Primeras MAX_PRODUCTOS_POR_SECCION filas, incluyendo las de los cupos reservados."""
+    reservadas = {
+        i for i, (_, _, posicion, subagente, _) in enumerate(filas)
+        if posicion < cupos_reservados.get(subagente, 0)
+    }
+    libres = MAX_PRODUCTOS_POR_SECCION - min(len(reservadas), MAX_PRODUCTOS_POR_SECCION)
+    elegidas = set(sorted(reservadas)[:MAX_PRODUCTOS_POR_SECCION])
+    for i in range(len(filas)):
+        if libres == 0:
+            break
+        if i not in elegidas:
+            elegidas.add(i)
+            libres -= 1
+    return [fila for i, fila in enumerate(filas) if i in elegidas]
@@ -0,0 +1,146 @@
+"""
+Ensamblador determinístico de la propuesta comercial final.
+Construye la misma estructura del agente documentador sin llamar al LLM.
+"""
+from datetime import datetime
+from typing import Optional, Dict, Any, List, Union
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+
+Numero = Union[int, float]
+
+VERSION_PROPUESTA = "1.0"
+
+
+class InformacionCliente(BaseModel):
+    nombre_empresa: str = ""
+    numero_empleados: Numero = 0
+    codigo_ciiu: str = ""
+    aportes_mensuales: Numero = 0
+    porcentaje_reinversion: Numero = 0
+    enfoque_prioritario: str = ""
+    correo_destinatario: str = ""
+
+    @field_validator("codigo_ciiu", mode="before")
+    @classmethod
+    def _a_str(cls, value: Any) -> Any:
+        return "" if value is None else str(value)
+
+
+class PerfilRiesgo(BaseModel):
+    clase_riesgo: str = ""
+    riesgos_generales: List[str] = Field(default_factory=list)
+    obligaciones_legales: List[str] = Field(default_factory=list)
+
+    @field_validator("clase_riesgo", mode="before")
+    @classmethod
+    def _a_str(cls, value: Any) -> Any:
+        return "" if value is None else str(value)
+
+
+class Presupuesto(BaseModel):
+    aportes_mensuales: Numero = 0
+    porcentaje_reinversion: Numero = 0
+    presupuesto_anual: Numero = 0
+    total_productos: Numero = 0
+    total_productos_obligatorios: Numero = 0
+    total_productos_prioritarios: Numero = 0
+    saldo_restante: Numero = 0
+    porcentaje_utilizado: Numero = 0
+
+
+class ProductoPropuesta(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    categoria_de_programas: Optional[str] = ""
+    descripcion_programas_de_prevencion: Optional[str] = ""
+    subcategoria: Optional[str] = ""
+    tema: Optional[str] = ""
+    tipo: Optional[str] = ""
+    tipo_tarifa_usada: Optional[str] = None
+    tarifa_hora: Numero = 0
+    horas_asignadas: Numero = 0
+    subtotal: Numero = 0
+
+
+class ValorAgregado(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    categoria_de_programas: Optional[str] = "VALOR AGREGADO"
+    descripcion_programas_de_prevencion: Optional[str] = ""
+    subcategoria: Optional[str] = ""
+    tema: Optional[str] = ""
+    tipo: Optional[str] = ""
+    tarifa_referencia: Numero = 0
+
+
+class PropuestaComercial(BaseModel):
+    informacion_cliente: InformacionCliente
+    perfil_riesgo: PerfilRiesgo
+    presupuesto: Presupuesto
+    productos_obligatorios: List[ProductoPropuesta] = Field(default_factory=list)
+    productos_prioritarios: List[ProductoPropuesta] = Field(default_factory=list)
+    valores_agregados: List[ValorAgregado] = Field(default_factory=list)
+
+
+class Metadatos(BaseModel):
+    fecha_generacion: str
+    version: str = VERSION_PROPUESTA
+    estado: str = "generada"
+
+
+class DocumentoPropuesta(BaseModel):
+    """Esquema del JSON final de la propuesta (mismo formato del documentador)."""
+    propuesta_comercial: PropuestaComercial
+    metadatos: Metadatos
+
+
+def ensamblar_propuesta(datos: Dict[str, Any], fecha_generacion: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Construye la propuesta comercial final a partir del estado del pipeline.
+
+    Args:
+        datos: Datos combinados del formulario, perfil de riesgo, productos y resumen
+        fecha_generacion: Fecha YYYY-MM-DD (por defecto, la fecha actual)
+
+    Returns:
+        Diccionario validado con propuesta_comercial y metadatos
+
+    Raises:
+        pydantic.ValidationError: Si los datos no cumplen el esquema
+    """
+    resumen = datos.get("resumen_presupuesto") or {}
+
+    documento = {
+        "propuesta_comercial": {
+            "informacion_cliente": {
+                campo: datos.get(campo)
+                for campo in InformacionCliente.model_fields
+                if datos.get(campo) is not None
+            },
+            "perfil_riesgo": {
+                "clase_riesgo": datos.get("clase_riesgo"),
+                "riesgos_generales": datos.get("riesgos_generales") or [],
+                "obligaciones_legales": datos.get("obligaciones_legales") or [],
+            },
+            "presupuesto": {
+                "aportes_mensuales": datos.get("aportes_mensuales", 0),
+                "porcentaje_reinversion": datos.get("porcentaje_reinversion", 0),
+                "presupuesto_anual": resumen.get("presupuesto_anual", datos.get("presupuesto_anual", 0)),
+                "total_productos": resumen.get("total_productos", 0),
+                "total_productos_obligatorios": resumen.get("total_productos_obligatorios", 0),
+                "total_productos_prioritarios": resumen.get("total_productos_prioritarios", 0),
+                "saldo_restante": resumen.get("saldo_restante", 0),
+                "porcentaje_utilizado": resumen.get("porcentaje_utilizado", 0),
+            },
+            "productos_obligatorios": datos.get("productos_obligatorios") or [],
+            "productos_prioritarios": datos.get("productos_prioritarios") or [],
+            "valores_agregados": datos.get("valores_agregados") or [],
+        },
+        "metadatos": {
+            "fecha_generacion": fecha_generacion or datetime.now().strftime("%Y-%m-%d"),
+        },
+    }
+
+    return DocumentoPropuesta.model_validate(documento).model_dump()
@@ -0,0 +1,111 @@
+"""
+Índice local CIIU → clase de riesgo (Decreto 768 de 2022).
+Evita la llamada al LLM del perfil de riesgo para códigos conocidos.
+"""
+import os
+import json
+import re
+from typing import Optional, Dict, Any, List, NamedTuple
+
+
+RUTA_INDICE_CIIU = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "data", "ciiu_decreto_768_2022.json"
+)
+
+
+class EntradaCIIU(NamedTuple):
+    """Registro del índice para un código CIIU de 4 cifras."""
+    codigo: str
+    clases: tuple
+    actividad: str
+    riesgos_generales: tuple
+
+    @property
+    def ambiguo(self) -> bool:
+        """True si el código agrupa actividades con distinta clase de riesgo."""
+        return len(self.clases) != 1
+
+    @property
+    def clase(self) -> Optional[int]:
+        """Clase de riesgo única del código, o None si es ambiguo."""
+        return self.clases[0] if not self.ambiguo else None
+
+
+class IndiceCIIU:
+    """Tabla versionada de clases de riesgo por código CIIU, cargada una sola vez."""
+
+    def __init__(self, ruta: str = RUTA_INDICE_CIIU):
+        with open(ruta, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        self.version = data.get("version", "")
+        perfiles = data.get("perfiles", {})
+
+        self._entradas: Dict[str, EntradaCIIU] = {}
+        for codigo, (clases, actividad, perfil) in data.get("codigos", {}).items():
+            if isinstance(clases, int):
+                clases = [clases]
+            self._entradas[codigo] = EntradaCIIU(
+                codigo=codigo,
+                clases=tuple(clases),
+                actividad=actividad,
+                riesgos_generales=tuple(perfiles.get(perfil, []))
+            )
+
+        print(f"[OK] Indice CIIU cargado: {len(self._entradas)} codigos (version {self.version})")
+
+    def __len__(self) -> int:
+        return len(self._entradas)
+
+    @staticmethod
+    def normalizar_codigo(codigo: Any) -> Optional[str]:
+        """
+        Obtiene las primeras 4 cifras del código CIIU.
+
+        Args:
+            codigo: Código CIIU (string o número, puede tener más de 4 dígitos)
+
+        Returns:
+            Código de 4 dígitos, o None si no se puede determinar
+        """
+        if codigo is None:
+            return None
+        digitos = re.sub(r"\D", "", str(codigo))
+        if len(digitos) < 4:
+            # Los códigos de clase < 1000 suelen llegar sin el cero inicial
+            digitos = digitos.zfill(4) if len(digitos) == 3 else ""
+        return digitos[:4] or None
+
+    def buscar(self, codigo: Any) -> Optional[EntradaCIIU]:
+        """
+        Busca un código CIIU en el índice.
+
+        Args:
+            codigo: Código CIIU tal como llega del formulario
+
+        Returns:
+            Entrada del índice, o None si el código no existe
+        """
+        normalizado = self.normalizar_codigo(codigo)
+        if not normalizado:
+            return None
+        return self._entradas.get(normalizado)
+
+
+def perfil_desde_indice(entrada: EntradaCIIU) -> Dict[str, Any]:
+    """
+    Construye la respuesta del agente de perfil de riesgo a partir del índice.
+
+    Args:
+        entrada: Entrada no ambigua del índice CIIU
+
+    Returns:
+        Diccionario con la misma estructura del agente de perfil de riesgo
+        (las obligaciones legales las agrega el motor de obligaciones)
+    """
+    riesgos: List[str] = list(entrada.riesgos_generales)
+    return {
+        "clase_riesgo": f"Clase de Riesgo {entrada.clase}, la Actividad Economica es {entrada.actividad}",
+        "riesgos_generales": riesgos,
+        "proximo_paso": "seleccion_productos"
+    }
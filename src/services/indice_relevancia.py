@@ -0,0 +1,160 @@
+"""
+Índice de relevancia BM25 sobre el catálogo de productos.
+Permite enviar al selector solo los candidatos más relevantes de cada categoría.
+"""
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, List, Iterable, Optional
+
+import numpy as np
+
+
+CAMPOS_INDEXADOS = ("descripcion_programas_de_prevencion", "subcategoria", "tema")
+
+_STOPWORDS = frozenset("""
+a al algo ante con contra como cual cuando de del desde donde durante e el ella ellas ellos en entre
+es esta este esto estos esa ese eso hacia hasta la las le les lo los mas mediante muy no o para pero
+por que se segun sin sobre su sus tambien tanto un una uno unos unas y ya
+""".split())
+
+
+def normalizar_texto(texto: Any) -> str:
+    """Minúsculas y sin tildes."""
+    texto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+def normalizar_categoria(categoria: Any) -> str:
+    """Normaliza el nombre de una categoría para compararla (mayúsculas, sin tildes)."""
+    return " ".join(normalizar_texto(categoria).upper().split())
+
+
+def tokenizar(texto: Any) -> List[str]:
+    """
+    Tokeniza un texto en español: sin tildes, sin stopwords y con un
+    stemming ligero de plurales (riesgos → riesgo, evaluaciones → evaluacion).
+    """
+    tokens = []
+    for token in re.findall(r"[a-z0-9ñ]+", normalizar_texto(texto)):
+        if len(token) < 3 or token in _STOPWORDS:
+            continue
+        if len(token) > 5 and token.endswith("es") and token[-3] in "nlrd":
+            token = token[:-2]
+        elif len(token) > 4 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class IndiceRelevancia:
+    """
+    Índice BM25 en memoria con postings en formato CSR (NumPy).
+
+    Los pesos BM25 de cada (término, producto) se precalculan al construir el
+    índice; una consulta solo suma las filas de sus términos.
+    """
+
+    def __init__(self, productos: List[Dict[str, Any]], k1: float = 1.2, b: float = 0.75):
+        self._n = len(productos)
+        self._categorias = np.array(
+            [normalizar_categoria(p.get("categoria_de_programas")) for p in productos],
+            dtype=object
+        )
+
+        documentos = [
+            Counter(tokenizar(" ".join(str(p.get(campo) or "") for campo in CAMPOS_INDEXADOS)))
+            for p in productos
+        ]
+        longitudes = np.array([sum(doc.values()) for doc in documentos], dtype=np.float64)
+        promedio = longitudes.mean() if self._n and longitudes.mean() > 0 else 1.0
+
+        postings: Dict[str, List[tuple]] = {}
+        for i, doc in enumerate(documentos):
+            for termino, tf in doc.items():
+                postings.setdefault(termino, []).append((i, tf))
+
+        self._vocabulario: Dict[str, int] = {}
+        indptr = [0]
+        indices: List[int] = []
+        pesos: List[float] = []
+        for termino, lista in postings.items():
+            df = len(lista)
+            idf = np.log(1 + (self._n - df + 0.5) / (df + 0.5))
+            for i, tf in lista:
+                norma = tf + k1 * (1 - b + b * longitudes[i] / promedio)
+                indices.append(i)
+                pesos.append(idf * tf * (k1 + 1) / norma)
+            self._vocabulario[termino] = len(indptr) - 1
+            indptr.append(len(indices))
+
+        self._indptr = np.array(indptr, dtype=np.int64)
+        self._indices = np.array(indices, dtype=np.int64)
+        self._pesos = np.array(pesos, dtype=np.float64)
+
+        print(f"[OK] Indice de relevancia construido: {self._n} productos, {len(self._vocabulario)} terminos")
+
+    def __len__(self) -> int:
+        return self._n
+
+    def puntajes(self, consulta: Iterable[str]) -> np.ndarray:
+        """
+        Calcula el puntaje BM25 de todos los productos para una consulta.
+
+        Args:
+            consulta: Textos de la consulta (se tokenizan y se suman)
+
+        Returns:
+            Arreglo de puntajes, uno por producto del catálogo
+        """
+        terminos = Counter()
+        for texto in consulta:
+            terminos.update(tokenizar(texto))
+
+        scores = np.zeros(self._n, dtype=np.float64)
+        for termino, qtf in terminos.items():
+            t = self._vocabulario.get(termino)
+            if t is None:
+                continue
+            inicio, fin = self._indptr[t], self._indptr[t + 1]
+            # Los índices de un mismo término no se repiten: la suma vectorizada es segura
+            scores[self._indices[inicio:fin]] += qtf * self._pesos[inicio:fin]
+        return scores
+
+    def buscar(
+        self,
+        consulta: Iterable[str],
+        categorias: Optional[Iterable[str]] = None,
+        k: int = 10,
+        filas: Optional[np.ndarray] = None
+    ) -> List[int]:
+        """
+        Retorna las posiciones de los k productos más relevantes.
+
+        Args:
+            consulta: Textos de la consulta
+            categorias: Si se indica, restringe la búsqueda a esas categorías
+            k: Número máximo de resultados
+            filas: Posiciones candidatas ya calculadas (p. ej. el índice de
+                categorías de TablaCatalogo); tiene prioridad sobre `categorias`
+
+        Returns:
+            Posiciones en el catálogo, de mayor a menor relevancia
+            (los empates se resuelven por orden del catálogo)
+        """
+        if self._n == 0 or k <= 0:
+            return []
+
+        if filas is not None:
+            candidatos = np.asarray(filas, dtype=np.int64)
+        elif categorias is not None:
+            permitidas = {normalizar_categoria(c) for c in categorias}
+            candidatos = np.flatnonzero(np.isin(self._categorias, list(permitidas)))
+        else:
+            candidatos = np.arange(self._n)
+        if candidatos.size == 0:
+            return []
+
+        scores = self.puntajes(consulta)[candidatos]
+        orden = np.argsort(-scores, kind="stable")[:k]
+        return candidatos[orden].tolist()
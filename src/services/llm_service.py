@@ -5,7 +5,8 @@ Basado en la implementación de ms-sd-prospector-multiagente.
 import os
 import json
 import re
-from typing import Optional, Dict, Any, List, Union
+import time
+from typing import Optional, Dict, Any, List, Union, Callable, Iterable
 
 try:
     from google import genai
@@ -16,6 +17,72 @@ except ImportError:
     genai = None
     types = None
 
+from .cache_llm import CacheLLM, clave_solicitud
+from .parser_json_incremental import ParserListasJSON
+from .metricas import registrar_llamada_llm
+from .rutas_llm import RutaLLM, cargar_rutas_llm
+from .resiliencia import Resiliencia
+
+
+# Caracteres relevantes para delimitar objetos JSON: llaves, comillas y escapes
+_TOKENS_JSON = re.compile(r'[{}"\\]')
+
+
+class RespuestaJSONInvalidaError(ValueError):
+    """La respuesta del modelo no contiene un objeto JSON válido."""
+
+
+def extraer_objeto_json(texto: str) -> Optional[Dict[str, Any]]:
+    """
+    Extrae el primer objeto JSON válido de un texto en una sola pasada.
+    
+    Recorre solo llaves, comillas y escapes (ignora llaves dentro de strings)
+    y parsea cada objeto de nivel superior una única vez, así que el costo
+    es lineal en el tamaño del texto.
+    
+    Args:
+        texto: Texto que contiene un objeto JSON (posiblemente con texto alrededor)
+        
+    Returns:
+        Primer objeto JSON parseable, o None si no hay ninguno
+    """
+    profundidad = 0
+    inicio = -1
+    en_string = False
+    saltar = -1
+    
+    for match in _TOKENS_JSON.finditer(texto):
+        i = match.start()
+        if i < saltar:
+            continue
+        c = texto[i]
+        
+        if en_string:
+            if c == "\\":
+                saltar = i + 2
+            elif c == '"':
+                en_string = False
+            continue
+        
+        if c == '"':
+            # Fuera de un objeto las comillas son texto libre
+            en_string = profundidad > 0
+        elif c == "{":
+            if profundidad == 0:
+                inicio = i
+            profundidad += 1
+        elif c == "}" and profundidad > 0:
+            profundidad -= 1
+            if profundidad == 0:
+                try:
+                    valor = json.loads(texto[inicio:i + 1])
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(valor, dict):
+                    return valor
+    
+    return None
+
 
 class LLMService:
     """Servicio para interactuar con modelos Gemini via Google GenAI."""
@@ -26,6 +93,9 @@ class LLMService:
         temperature: float = 0.3,
         project_id: Optional[str] = None,
         location: Optional[str] = None,
+        cache: Optional[CacheLLM] = None,
+        rutas: Optional[Dict[str, RutaLLM]] = None,
+        resiliencia: Optional[Resiliencia] = None,
     ):
         if not GENAI_AVAILABLE:
             raise ImportError("google-genai no está instalado. Ejecuta: pip install google-genai")
@@ -65,13 +135,54 @@ class LLMService:
             )
         
         print(f"   Modelo: {self._model_name}")
+        
+        # Cache de respuestas JSON (por defecto según SPU_LLM_CACHE*)
+        self._cache = cache if cache is not None else CacheLLM.desde_entorno()
+        
+        # Modelo, tokens, temperatura, timeout y thinking por paso (por defecto según SPU_LLM_RUTAS)
+        self._rutas = rutas if rutas is not None else cargar_rutas_llm()
+        
+        # Reintentos, cobertura y circuit breaker (por defecto según SPU_LLM_REINTENTOS/COBERTURA/CIRCUITO_*)
+        self._resiliencia = resiliencia if resiliencia is not None else Resiliencia.desde_entorno()
+    
+    @property
+    def cache(self) -> Optional[CacheLLM]:
+        """Cache de respuestas del servicio (None si está desactivada)."""
+        return self._cache
+    
+    @property
+    def resiliencia(self) -> Resiliencia:
+        """Política de reintentos y circuit breakers del servicio."""
+        return self._resiliencia
+    
+    @property
+    def rutas(self) -> Dict[str, RutaLLM]:
+        """Tabla de ruteo por paso del flujo."""
+        return self._rutas
+    
+    def _ruta(self, paso: Optional[str]) -> RutaLLM:
+        """Ruta del paso (sin paso o sin ruta: modelo y parámetros por defecto)."""
+        ruta = self._rutas.get(paso) if paso else None
+        return ruta if ruta is not None else RutaLLM(modelo=self._model_name)
+    
+    def _modelo(self, ruta: RutaLLM) -> str:
+        return ruta.modelo or self._model_name
+    
+    @staticmethod
+    def _temperatura_json(temperature: Optional[float], ruta: RutaLLM) -> float:
+        """Temperatura explícita, o la de la ruta, o 0.2 (más bajo para JSON)."""
+        if temperature is not None:
+            return temperature
+        return ruta.temperature if ruta.temperature is not None else 0.2
     
     def generar_respuesta(
         self,
         system_prompt: str,
         user_prompt: str,
         temperature: Optional[float] = None,
-        max_tokens: int = 8192
+        max_tokens: int = 8192,
+        response_schema: Optional[Dict[str, Any]] = None,
+        paso: Optional[str] = None
     ) -> str:
         """
         Genera una respuesta usando el modelo LLM.
@@ -81,40 +192,117 @@ class LLMService:
             user_prompt: Mensaje del usuario
             temperature: Creatividad (0.0 - 1.0)
             max_tokens: Máximo de tokens en la respuesta
+            response_schema: Esquema de la respuesta; activa la salida JSON estructurada
+            paso: Paso del flujo que hace la llamada (define la ruta y etiqueta las métricas)
             
         Returns:
             Respuesta del modelo como string
         """
+        ruta = self._ruta(paso)
+        modelo = self._modelo(ruta)
+        contents = self._combinar_prompts(system_prompt, user_prompt)
+        config = self._config_generacion(temperature, max_tokens, response_schema, ruta)
+        
+        def intento() -> str:
+            inicio = time.perf_counter()
+            try:
+                response = self._client.models.generate_content(model=modelo, contents=contents, config=config)
+            except Exception:
+                registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), error=True)
+                raise
+            registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), response.usage_metadata)
+            return response.text
+        
         try:
-            # Combinar prompts
-            full_prompt = f"{system_prompt}\n\n{user_prompt}"
-            
-            # Configuración de generación
-            config = types.GenerateContentConfig(
-                temperature=temperature or self._temperature,
-                max_output_tokens=max_tokens,
-                top_p=0.95,
-            )
-            
-            # Generar respuesta
-            response = self._client.models.generate_content(
-                model=self._model_name,
-                contents=full_prompt,
-                config=config
-            )
+            return self._resiliencia.ejecutar(intento, paso, modelo)
+        except Exception as e:
+            print(f"[ERROR] Error generando respuesta LLM: {e}")
+            raise
+    
+    async def generar_respuesta_async(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: Optional[float] = None,
+        max_tokens: int = 8192,
+        response_schema: Optional[Dict[str, Any]] = None,
+        paso: Optional[str] = None
+    ) -> str:
+        """
+        Versión asíncrona de generar_respuesta (cliente aio de google-genai).
+        
+        Args:
+            system_prompt: Instrucciones del sistema
+            user_prompt: Mensaje del usuario
+            temperature: Creatividad (0.0 - 1.0)
+            max_tokens: Máximo de tokens en la respuesta
+            response_schema: Esquema de la respuesta; activa la salida JSON estructurada
+            paso: Paso del flujo que hace la llamada (define la ruta y etiqueta las métricas)
             
+        Returns:
+            Respuesta del modelo como string
+        """
+        ruta = self._ruta(paso)
+        modelo = self._modelo(ruta)
+        contents = self._combinar_prompts(system_prompt, user_prompt)
+        config = self._config_generacion(temperature, max_tokens, response_schema, ruta)
+        
+        async def intento() -> str:
+            inicio = time.perf_counter()
+            try:
+                response = await self._client.aio.models.generate_content(model=modelo, contents=contents, config=config)
+            except Exception:
+                registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), error=True)
+                raise
+            registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), response.usage_metadata)
             return response.text
-            
+        
+        try:
+            return await self._resiliencia.ejecutar_async(intento, paso, modelo)
         except Exception as e:
             print(f"[ERROR] Error generando respuesta LLM: {e}")
             raise
     
+    @staticmethod
+    def _combinar_prompts(system_prompt: str, user_prompt: str) -> str:
+        """Combina el prompt del sistema y el del usuario."""
+        return f"{system_prompt}\n\n{user_prompt}"
+    
+    def _config_generacion(
+        self,
+        temperature: Optional[float],
+        max_tokens: int,
+        response_schema: Optional[Dict[str, Any]] = None,
+        ruta: Optional[RutaLLM] = None
+    ):
+        """
+        Configuración de generación: salida JSON estructurada si hay esquema,
+        y timeout y presupuesto de thinking según la ruta del paso.
+        """
+        opciones = {}
+        if response_schema is not None:
+            opciones["response_mime_type"] = "application/json"
+            opciones["response_schema"] = response_schema
+        if ruta is not None and ruta.timeout_segundos:
+            opciones["http_options"] = types.HttpOptions(timeout=int(ruta.timeout_segundos * 1000))
+        if ruta is not None and ruta.thinking_budget is not None:
+            opciones["thinking_config"] = types.ThinkingConfig(thinking_budget=ruta.thinking_budget)
+        return types.GenerateContentConfig(
+            temperature=temperature if temperature is not None else self._temperature,
+            max_output_tokens=max_tokens,
+            top_p=0.95,
+            **opciones
+        )
+    
     def generar_json(
         self,
         system_prompt: str,
         user_prompt: str,
         temperature: Optional[float] = None,
-        debug: bool = False
+        debug: bool = False,
+        paso: Optional[str] = None,
+        usar_cache: bool = True,
+        response_schema: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Genera una respuesta JSON estructurada.
@@ -122,39 +310,323 @@ class LLMService:
         Args:
             system_prompt: Instrucciones del sistema
             user_prompt: Mensaje del usuario
-            temperature: Creatividad (menor para respuestas más determinísticas)
+            temperature: Creatividad (None: la de la ruta del paso)
             debug: Si True, imprime la respuesta cruda
+            paso: Paso del flujo que hace la llamada (define la ruta y el TTL de la cache)
+            usar_cache: Si es False, siempre se consulta al modelo
+            response_schema: Esquema de la respuesta (salida JSON estructurada de Gemini)
             
         Returns:
             Diccionario parseado desde JSON
+            
+        Raises:
+            RespuestaJSONInvalidaError: Si la respuesta no contiene un objeto JSON
         """
         try:
+            ruta = self._ruta(paso)
+            temperature = self._temperatura_json(temperature, ruta)
+            clave = self._clave_cache(system_prompt, user_prompt, temperature, paso, usar_cache, response_schema)
+            if clave:
+                cacheada = self._cache.obtener(clave)
+                if cacheada is not None:
+                    print(f"   [INFO] Respuesta LLM desde cache ({paso or 'sin paso'})")
+                    registrar_llamada_llm(paso, 0.0, len(system_prompt) + len(user_prompt), cache=True)
+                    return cacheada
+            
             respuesta_raw = self.generar_respuesta(
                 system_prompt=system_prompt,
                 user_prompt=user_prompt,
-                temperature=temperature or 0.2,  # Más bajo para JSON
-                max_tokens=65536  # Máximo tokens para respuestas grandes
+                temperature=temperature,
+                max_tokens=ruta.max_tokens,
+                response_schema=response_schema,
+                paso=paso
             )
             
-            if debug:
-                print(f"\n[DEBUG] Respuesta LLM ({len(respuesta_raw)} chars):")
-                print(respuesta_raw[:500] + "..." if len(respuesta_raw) > 500 else respuesta_raw)
+            resultado = self._procesar_respuesta_json(respuesta_raw, debug)
+            if clave:
+                self._cache.guardar(clave, resultado, paso)
+            return resultado
             
-            resultado = self._limpiar_y_parsear_json(respuesta_raw)
+        except Exception as e:
+            print(f"[ERROR] Error en generar_json: {e}")
+            raise
+    
+    async def generar_json_async(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: Optional[float] = None,
+        debug: bool = False,
+        paso: Optional[str] = None,
+        usar_cache: bool = True,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de generar_json.
+        
+        Args:
+            system_prompt: Instrucciones del sistema
+            user_prompt: Mensaje del usuario
+            temperature: Creatividad (None: la de la ruta del paso)
+            debug: Si True, imprime la respuesta cruda
+            paso: Paso del flujo que hace la llamada (define la ruta y el TTL de la cache)
+            usar_cache: Si es False, siempre se consulta al modelo
+            response_schema: Esquema de la respuesta (salida JSON estructurada de Gemini)
+            
+        Returns:
+            Diccionario parseado desde JSON
             
-            if debug:
-                print(f"\n[DEBUG] JSON parseado: {len(resultado)} keys")
+        Raises:
+            RespuestaJSONInvalidaError: Si la respuesta no contiene un objeto JSON
+        """
+        try:
+            ruta = self._ruta(paso)
+            temperature = self._temperatura_json(temperature, ruta)
+            clave = self._clave_cache(system_prompt, user_prompt, temperature, paso, usar_cache, response_schema)
+            if clave:
+                cacheada = self._cache.obtener(clave)
+                if cacheada is not None:
+                    print(f"   [INFO] Respuesta LLM desde cache ({paso or 'sin paso'})")
+                    registrar_llamada_llm(paso, 0.0, len(system_prompt) + len(user_prompt), cache=True)
+                    return cacheada
             
+            respuesta_raw = await self.generar_respuesta_async(
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                temperature=temperature,
+                max_tokens=ruta.max_tokens,
+                response_schema=response_schema,
+                paso=paso
+            )
+            
+            resultado = self._procesar_respuesta_json(respuesta_raw, debug)
+            if clave:
+                self._cache.guardar(clave, resultado, paso)
             return resultado
             
         except Exception as e:
-            print(f"[ERROR] Error en generar_json: {e}")
+            print(f"[ERROR] Error en generar_json_async: {e}")
+            raise
+    
+    def generar_json_stream(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        claves_listas: Iterable[str],
+        al_elemento: Optional[Callable[[str, Union[Dict[str, Any], str]], None]] = None,
+        temperature: Optional[float] = None,
+        paso: Optional[str] = None,
+        usar_cache: bool = True,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Genera una respuesta JSON en streaming (generate_content_stream).
+        
+        Cada elemento de las listas indicadas se entrega a `al_elemento` apenas
+        el modelo lo termina de escribir, antes de que llegue el resto de la respuesta.
+        
+        Args:
+            system_prompt: Instrucciones del sistema
+            user_prompt: Mensaje del usuario
+            claves_listas: Claves de primer nivel cuyas listas se entregan por elemento
+            al_elemento: Callback al_elemento(clave, elemento)
+            temperature: Creatividad (None: la de la ruta del paso)
+            paso: Paso del flujo que hace la llamada (define la ruta y el TTL de la cache)
+            usar_cache: Si es False, siempre se consulta al modelo
+            response_schema: Esquema de la respuesta (salida JSON estructurada de Gemini)
+            
+        Returns:
+            Diccionario completo parseado desde JSON
+            
+        Raises:
+            RespuestaJSONInvalidaError: Si la respuesta no contiene un objeto JSON
+        """
+        try:
+            ruta = self._ruta(paso)
+            temperature = self._temperatura_json(temperature, ruta)
+            clave = self._clave_cache(system_prompt, user_prompt, temperature, paso, usar_cache, response_schema)
+            if clave:
+                cacheada = self._cache.obtener(clave)
+                if cacheada is not None:
+                    print(f"   [INFO] Respuesta LLM desde cache ({paso or 'sin paso'})")
+                    registrar_llamada_llm(paso, 0.0, len(system_prompt) + len(user_prompt), cache=True)
+                    self._entregar_elementos(cacheada, claves_listas, al_elemento)
+                    return cacheada
+            
+            modelo = self._modelo(ruta)
+            contents = self._combinar_prompts(system_prompt, user_prompt)
+            config = self._config_generacion(temperature, ruta.max_tokens, response_schema, ruta)
+            entregados = 0
+            
+            def intento() -> str:
+                nonlocal entregados
+                parser = ParserListasJSON(claves_listas)
+                inicio = time.perf_counter()
+                uso = None
+                try:
+                    stream = self._client.models.generate_content_stream(model=modelo, contents=contents, config=config)
+                    for chunk in stream:
+                        uso = chunk.usage_metadata or uso
+                        for lista, elemento in parser.alimentar(chunk.text or ""):
+                            entregados += 1
+                            if al_elemento:
+                                al_elemento(lista, elemento)
+                except Exception:
+                    registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), uso, error=True)
+                    raise
+                registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), uso)
+                return parser.texto
+            
+            # Solo se reintenta si el stream falló antes de entregar elementos (evita duplicados)
+            texto = self._resiliencia.ejecutar(
+                intento, paso, modelo, cobertura=False, reintentable=lambda _: entregados == 0
+            )
+            resultado = self._procesar_respuesta_json(texto)
+            if clave:
+                self._cache.guardar(clave, resultado, paso)
+            return resultado
+            
+        except Exception as e:
+            print(f"[ERROR] Error en generar_json_stream: {e}")
             raise
     
+    async def generar_json_stream_async(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        claves_listas: Iterable[str],
+        al_elemento: Optional[Callable[[str, Union[Dict[str, Any], str]], None]] = None,
+        temperature: Optional[float] = None,
+        paso: Optional[str] = None,
+        usar_cache: bool = True,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de generar_json_stream.
+        
+        Args:
+            system_prompt: Instrucciones del sistema
+            user_prompt: Mensaje del usuario
+            claves_listas: Claves de primer nivel cuyas listas se entregan por elemento
+            al_elemento: Callback al_elemento(clave, elemento)
+            temperature: Creatividad (None: la de la ruta del paso)
+            paso: Paso del flujo que hace la llamada (define la ruta y el TTL de la cache)
+            usar_cache: Si es False, siempre se consulta al modelo
+            response_schema: Esquema de la respuesta (salida JSON estructurada de Gemini)
+            
+        Returns:
+            Diccionario completo parseado desde JSON
+        """
+        try:
+            ruta = self._ruta(paso)
+            temperature = self._temperatura_json(temperature, ruta)
+            clave = self._clave_cache(system_prompt, user_prompt, temperature, paso, usar_cache, response_schema)
+            if clave:
+                cacheada = self._cache.obtener(clave)
+                if cacheada is not None:
+                    print(f"   [INFO] Respuesta LLM desde cache ({paso or 'sin paso'})")
+                    registrar_llamada_llm(paso, 0.0, len(system_prompt) + len(user_prompt), cache=True)
+                    self._entregar_elementos(cacheada, claves_listas, al_elemento)
+                    return cacheada
+            
+            modelo = self._modelo(ruta)
+            contents = self._combinar_prompts(system_prompt, user_prompt)
+            config = self._config_generacion(temperature, ruta.max_tokens, response_schema, ruta)
+            entregados = 0
+            
+            async def intento() -> str:
+                nonlocal entregados
+                parser = ParserListasJSON(claves_listas)
+                inicio = time.perf_counter()
+                uso = None
+                try:
+                    stream = await self._client.aio.models.generate_content_stream(
+                        model=modelo, contents=contents, config=config
+                    )
+                    async for chunk in stream:
+                        uso = chunk.usage_metadata or uso
+                        for lista, elemento in parser.alimentar(chunk.text or ""):
+                            entregados += 1
+                            if al_elemento:
+                                al_elemento(lista, elemento)
+                except Exception:
+                    registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), uso, error=True)
+                    raise
+                registrar_llamada_llm(paso, time.perf_counter() - inicio, len(contents), uso)
+                return parser.texto
+            
+            texto = await self._resiliencia.ejecutar_async(
+                intento, paso, modelo, cobertura=False, reintentable=lambda _: entregados == 0
+            )
+            resultado = self._procesar_respuesta_json(texto)
+            if clave:
+                self._cache.guardar(clave, resultado, paso)
+            return resultado
+            
+        except Exception as e:
+            print(f"[ERROR] Error en generar_json_stream_async: {e}")
+            raise
+    
+    @staticmethod
+    def _entregar_elementos(
+        resultado: Dict[str, Any],
+        claves_listas: Iterable[str],
+        al_elemento: Optional[Callable[[str, Union[Dict[str, Any], str]], None]]
+    ):
+        """Entrega por elemento una respuesta completa (p. ej. tomada de la cache)."""
+        if not al_elemento:
+            return
+        for lista in claves_listas:
+            for elemento in resultado.get(lista) or []:
+                if isinstance(elemento, (dict, str)):
+                    al_elemento(lista, elemento)
+    
+    def _clave_cache(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        temperature: float,
+        paso: Optional[str],
+        usar_cache: bool,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Clave de cache de la solicitud, o None si no se debe usar la cache."""
+        if not usar_cache or self._cache is None or self._cache.ttl(paso) <= 0:
+            return None
+        ruta = self._ruta(paso)
+        return clave_solicitud(
+            modelo=self._modelo(ruta),
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            temperature=temperature,
+            max_tokens=ruta.max_tokens,
+            thinking_budget=ruta.thinking_budget,
+            top_p=0.95,
+            response_schema=response_schema
+        )
+    
+    def _procesar_respuesta_json(self, respuesta_raw: str, debug: bool = False) -> Dict[str, Any]:
+        """Parsea la respuesta cruda del modelo como JSON."""
+        if debug:
+            print(f"\n[DEBUG] Respuesta LLM ({len(respuesta_raw)} chars):")
+            print(respuesta_raw[:500] + "..." if len(respuesta_raw) > 500 else respuesta_raw)
+        
+        resultado = self._limpiar_y_parsear_json(respuesta_raw)
+        
+        if debug:
+            print(f"\n[DEBUG] JSON parseado: {len(resultado)} keys")
+        
+        return resultado
+    
     def _limpiar_y_parsear_json(self, text: str) -> Dict[str, Any]:
-        """Limpia y parsea JSON desde respuesta del LLM."""
-        if not text:
-            return {}
+        """
+        Limpia y parsea JSON desde respuesta del LLM.
+        
+        Raises:
+            RespuestaJSONInvalidaError: Si la respuesta está vacía o no contiene un objeto JSON
+        """
+        if not text or not text.strip():
+            raise RespuestaJSONInvalidaError("El modelo retornó una respuesta vacía")
         
         # Limpiar markdown (múltiples formatos)
         cleaned = text.strip()
@@ -173,51 +645,16 @@ class LLMService:
         
         # Intentar parsear directamente
         try:
-            return json.loads(cleaned)
+            resultado = json.loads(cleaned)
+            if isinstance(resultado, dict):
+                return resultado
         except json.JSONDecodeError:
             pass
         
-        # Buscar el primer JSON completo (el objeto raíz)
-        # Encontrar el primer '{' que NO esté dentro de un array
-        first_brace = cleaned.find('{')
-        if first_brace == -1:
-            print(f"[WARN] No se encontro JSON: {text[:200]}...")
-            return {}
-        
-        # Encontrar el cierre correspondiente
-        depth = 0
-        end_pos = -1
-        for j in range(first_brace, len(cleaned)):
-            c = cleaned[j]
-            if c == '{':
-                depth += 1
-            elif c == '}':
-                depth -= 1
-                if depth == 0:
-                    end_pos = j
-                    break
-        
-        if end_pos > first_brace:
-            candidate = cleaned[first_brace:end_pos+1]
-            try:
-                return json.loads(candidate)
-            except json.JSONDecodeError:
-                pass
-        
-        # Fallback: buscar cualquier JSON válido
-        for i, char in enumerate(cleaned):
-            if char == '{':
-                depth = 0
-                for j in range(i, len(cleaned)):
-                    if cleaned[j] == '{':
-                        depth += 1
-                    elif cleaned[j] == '}':
-                        depth -= 1
-                        if depth == 0:
-                            try:
-                                return json.loads(cleaned[i:j+1])
-                            except json.JSONDecodeError:
-                                break
-        
-        print(f"[WARN] No se pudo parsear JSON: {text[:200]}...")
-        return {}
+        # Fallback: primer objeto JSON completo dentro del texto
+        resultado = extraer_objeto_json(cleaned)
+        if resultado is None:
+            raise RespuestaJSONInvalidaError(
+                f"No se pudo parsear JSON ({len(text)} chars): {text[:200]}..."
+            )
+        return resultado
@@ -0,0 +1,74 @@
+"""
+Memo compartido (single-flight) para reutilizar trabajo repetido dentro de un lote.
+"""
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class MemoCompartido:
+    """
+    Memoriza resultados por clave y comparte los cálculos en curso.
+
+    Si varias ejecuciones piden la misma clave a la vez, solo la primera
+    calcula el valor; las demás esperan ese mismo resultado. Cada llamada
+    recibe una copia, de modo que los consumidores pueden modificarla.
+    Los errores no se memorizan: la siguiente llamada vuelve a intentar.
+    """
+
+    def __init__(self):
+        self._futuros: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.calculos = 0
+
+    def _reservar(self, clave: Hashable) -> Tuple[Future, bool]:
+        """Retorna (futuro, propietario). El propietario debe calcular el valor."""
+        with self._lock:
+            futuro = self._futuros.get(clave)
+            if futuro is not None:
+                self.aciertos += 1
+                return futuro, False
+            futuro = Future()
+            self._futuros[clave] = futuro
+            self.calculos += 1
+            return futuro, True
+
+    def _fallo(self, clave: Hashable, futuro: Future, error: BaseException):
+        with self._lock:
+            self._futuros.pop(clave, None)
+        futuro.set_exception(error)
+
+    def obtener(self, clave: Hashable, calcular: Callable[[], Any]) -> Any:
+        """
+        Obtiene el valor de una clave, calculándolo si es la primera vez.
+
+        Args:
+            clave: Clave del trabajo compartido
+            calcular: Función que calcula el valor
+
+        Returns:
+            Copia del valor memorizado
+        """
+        futuro, propietario = self._reservar(clave)
+        if propietario:
+            try:
+                futuro.set_result(calcular())
+            except BaseException as e:
+                self._fallo(clave, futuro, e)
+                raise
+        return copy.deepcopy(futuro.result())
+
+    async def obtener_async(self, clave: Hashable, calcular: Callable[[], Awaitable[Any]]) -> Any:
+        """Versión asíncrona de obtener (espera sin bloquear el event loop)."""
+        futuro, propietario = self._reservar(clave)
+        if propietario:
+            try:
+                futuro.set_result(await calcular())
+            except BaseException as e:
+                self._fallo(clave, futuro, e)
+                raise
+            return copy.deepcopy(futuro.result())
+        return copy.deepcopy(await asyncio.wrap_future(futuro))
@@ -0,0 +1,216 @@
+"""
+Instrumentación de latencia y tokens por paso del flujo.
+
+Las métricas se exponen en formato Prometheus (/metrics) cuando
+prometheus_client está instalado, y se acumulan por ejecución para
+adjuntarlas a la respuesta de /run.
+"""
+import os
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, List, Iterator
+
+try:
+    from prometheus_client import (
+        CollectorRegistry, Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+_BUCKETS_SEGUNDOS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+_BUCKETS_TOKENS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+_BUCKETS_CARACTERES = (500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+if PROMETHEUS_AVAILABLE:
+    DURACION_PASO = Histogram(
+        "spu_paso_duracion_segundos", "Duración de cada paso del flujo",
+        ["paso"], buckets=_BUCKETS_SEGUNDOS
+    )
+    DURACION_LLM = Histogram(
+        "spu_llm_duracion_segundos", "Duración de las llamadas al LLM",
+        ["paso"], buckets=_BUCKETS_SEGUNDOS
+    )
+    TOKENS_LLM = Counter(
+        "spu_llm_tokens", "Tokens consumidos por el LLM",
+        ["paso", "tipo"]
+    )
+    TOKENS_SALIDA_LLM = Histogram(
+        "spu_llm_tokens_salida", "Tokens de salida por llamada al LLM",
+        ["paso"], buckets=_BUCKETS_TOKENS
+    )
+    CARACTERES_PROMPT = Histogram(
+        "spu_llm_prompt_caracteres", "Tamaño del prompt en caracteres",
+        ["paso"], buckets=_BUCKETS_CARACTERES
+    )
+    LLAMADAS_LLM = Counter(
+        "spu_llm_llamadas", "Llamadas al LLM por resultado (ok, error, cache)",
+        ["paso", "resultado"]
+    )
+    REINTENTOS_LLM = Counter(
+        "spu_llm_reintentos", "Reintentos de llamadas al LLM",
+        ["paso"]
+    )
+    COBERTURAS_LLM = Counter(
+        "spu_llm_coberturas", "Solicitudes duplicadas (hedging) por superar el p95 del paso",
+        ["paso"]
+    )
+
+
+class MetricasEjecucion:
+    """Métricas de una ejecución del flujo (se adjuntan a la respuesta de /run)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.llamadas_llm: List[Dict[str, Any]] = []
+        self.reintentos: Dict[str, int] = {}
+
+    def agregar_llamada(self, llamada: Dict[str, Any]):
+        with self._lock:
+            self.llamadas_llm.append(llamada)
+
+    def agregar_reintento(self, paso: str):
+        with self._lock:
+            self.reintentos[paso] = self.reintentos.get(paso, 0) + 1
+
+    def resumen(self) -> Dict[str, Any]:
+        """Llamadas al LLM y totales de tokens por paso."""
+        with self._lock:
+            llamadas = list(self.llamadas_llm)
+            reintentos = dict(self.reintentos)
+
+        por_paso: Dict[str, Dict[str, Any]] = {}
+        for llamada in llamadas:
+            total = por_paso.setdefault(llamada["paso"], {
+                "llamadas": 0, "aciertos_cache": 0, "segundos": 0.0,
+                "tokens_prompt": 0, "tokens_salida": 0, "tokens_total": 0,
+                "caracteres_prompt": 0, "reintentos": reintentos.get(llamada["paso"], 0),
+            })
+            total["llamadas"] += 1
+            total["aciertos_cache"] += int(llamada["cache"])
+            total["segundos"] = round(total["segundos"] + llamada["segundos"], 4)
+            for campo in ("tokens_prompt", "tokens_salida", "tokens_total", "caracteres_prompt"):
+                total[campo] += llamada[campo]
+
+        return {
+            "llm_por_paso": por_paso,
+            "tokens_total": sum(t["tokens_total"] for t in por_paso.values()),
+        }
+
+
+_metricas_actuales: contextvars.ContextVar[Optional[MetricasEjecucion]] = contextvars.ContextVar(
+    "metricas_ejecucion", default=None
+)
+
+
+@contextmanager
+def medir_ejecucion() -> Iterator[MetricasEjecucion]:
+    """
+    Activa un colector de métricas para la ejecución en curso.
+    Se propaga a las tareas asyncio y a asyncio.to_thread (contextvars).
+    """
+    metricas = MetricasEjecucion()
+    token = _metricas_actuales.set(metricas)
+    try:
+        yield metricas
+    finally:
+        _metricas_actuales.reset(token)
+
+
+def _paso(paso: Optional[str]) -> str:
+    return paso or "sin_paso"
+
+
+def registrar_paso(paso: str, segundos: float):
+    """Registra la duración de un paso del flujo (catálogo, PDF, agentes)."""
+    if PROMETHEUS_AVAILABLE:
+        DURACION_PASO.labels(paso=paso).observe(segundos)
+
+
+def _valor_uso(uso: Any, campo: str) -> int:
+    valor = getattr(uso, campo, None) if uso is not None else None
+    return int(valor or 0)
+
+
+def registrar_llamada_llm(
+    paso: Optional[str],
+    segundos: float,
+    caracteres_prompt: int,
+    uso: Any = None,
+    cache: bool = False,
+    error: bool = False
+):
+    """
+    Registra una llamada al LLM.
+
+    Args:
+        paso: Paso del flujo que hizo la llamada
+        segundos: Duración de la llamada
+        caracteres_prompt: Tamaño del prompt enviado
+        uso: usage_metadata de la respuesta de Gemini (None si no hubo llamada)
+        cache: True si la respuesta salió de la cache
+        error: True si la llamada falló
+    """
+    paso = _paso(paso)
+    tokens_prompt = _valor_uso(uso, "prompt_token_count")
+    tokens_salida = _valor_uso(uso, "candidates_token_count")
+    tokens_total = _valor_uso(uso, "total_token_count") or tokens_prompt + tokens_salida
+    resultado = "cache" if cache else "error" if error else "ok"
+
+    if PROMETHEUS_AVAILABLE:
+        LLAMADAS_LLM.labels(paso=paso, resultado=resultado).inc()
+        if not cache:
+            DURACION_LLM.labels(paso=paso).observe(segundos)
+            CARACTERES_PROMPT.labels(paso=paso).observe(caracteres_prompt)
+        if uso is not None:
+            TOKENS_LLM.labels(paso=paso, tipo="prompt").inc(tokens_prompt)
+            TOKENS_LLM.labels(paso=paso, tipo="salida").inc(tokens_salida)
+            TOKENS_LLM.labels(paso=paso, tipo="total").inc(tokens_total)
+            TOKENS_SALIDA_LLM.labels(paso=paso).observe(tokens_salida)
+
+    metricas = _metricas_actuales.get()
+    if metricas is not None:
+        metricas.agregar_llamada({
+            "paso": paso,
+            "segundos": round(segundos, 4),
+            "caracteres_prompt": caracteres_prompt,
+            "tokens_prompt": tokens_prompt,
+            "tokens_salida": tokens_salida,
+            "tokens_total": tokens_total,
+            "cache": cache,
+            "error": error,
+        })
+
+
+def registrar_reintento(paso: Optional[str]):
+    """Registra un reintento de llamada al LLM."""
+    paso = _paso(paso)
+    if PROMETHEUS_AVAILABLE:
+        REINTENTOS_LLM.labels(paso=paso).inc()
+    metricas = _metricas_actuales.get()
+    if metricas is not None:
+        metricas.agregar_reintento(paso)
+
+
+def registrar_cobertura(paso: Optional[str]):
+    """Registra una solicitud de cobertura (duplicada) al LLM."""
+    if PROMETHEUS_AVAILABLE:
+        COBERTURAS_LLM.labels(paso=_paso(paso)).inc()
+
+
+def exportar_prometheus() -> Optional[bytes]:
+    """
+    Métricas en formato de texto de Prometheus, o None si prometheus_client
+    no está instalado. Con PROMETHEUS_MULTIPROC_DIR agrega las métricas de
+    todos los workers de gunicorn.
+    """
+    if not PROMETHEUS_AVAILABLE:
+        return None
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+        return generate_latest(registro)
+    return generate_latest()
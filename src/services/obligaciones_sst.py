@@ -0,0 +1,178 @@
+"""
+Motor de reglas de obligaciones legales SST (Resolución 0312 de 2019).
+Las obligaciones dependen solo de la clase de riesgo y del tramo de trabajadores.
+"""
+import re
+from typing import Optional, Dict, Any, List, Tuple, NamedTuple
+
+
+# Tramos de número de trabajadores definidos por la Resolución 0312
+TRAMO_HASTA_10 = "hasta_10"
+TRAMO_11_A_50 = "11_a_50"
+TRAMO_MAS_50 = "mas_50"
+TRAMOS = (TRAMO_HASTA_10, TRAMO_11_A_50, TRAMO_MAS_50)
+
+CLASES_RIESGO = (1, 2, 3, 4, 5)
+
+
+class ReglaObligacion(NamedTuple):
+    """Obligación aplicable a un conjunto de niveles de estándares y tramos."""
+    obligacion: str
+    niveles: Tuple[int, ...]
+    tramos: Tuple[str, ...] = TRAMOS
+
+
+# Niveles de estándares mínimos: 7 (Cap. I), 21 (Cap. II) y 60 (Cap. III)
+TODOS = (7, 21, 60)
+DESDE_21 = (21, 60)
+SOLO_60 = (60,)
+
+REGLAS_OBLIGACIONES = (
+    ReglaObligacion("Asignar una persona que diseñe e implemente el Sistema de Gestión de SST", TODOS),
+    ReglaObligacion("Afiliar a todos los trabajadores al Sistema de Seguridad Social Integral", TODOS),
+    ReglaObligacion("Asignar recursos para el Sistema de Gestión de SST", DESDE_21),
+    ReglaObligacion("Designar un Vigía de Seguridad y Salud en el Trabajo", TODOS, (TRAMO_HASTA_10,)),
+    ReglaObligacion("Conformar y garantizar el funcionamiento del Comité Paritario de SST (COPASST)", TODOS, (TRAMO_11_A_50, TRAMO_MAS_50)),
+    ReglaObligacion("Conformar y garantizar el funcionamiento del Comité de Convivencia Laboral", DESDE_21),
+    ReglaObligacion("Definir y divulgar la Política de Seguridad y Salud en el Trabajo", DESDE_21),
+    ReglaObligacion("Establecer objetivos, metas e indicadores de estructura, proceso y resultado del SG-SST", SOLO_60),
+    ReglaObligacion("Realizar la evaluación inicial del SG-SST y la rendición de cuentas anual", SOLO_60),
+    ReglaObligacion("Elaborar y ejecutar el Plan Anual de Trabajo del SG-SST", TODOS),
+    ReglaObligacion("Diseñar e implementar un plan de capacitación en SST", TODOS),
+    ReglaObligacion("Conservar y archivar los documentos del SG-SST", DESDE_21),
+    ReglaObligacion("Implementar la gestión del cambio y la evaluación de proveedores y contratistas en SST", SOLO_60),
+    ReglaObligacion("Realizar evaluaciones médicas ocupacionales", TODOS),
+    ReglaObligacion("Elaborar la descripción sociodemográfica y el diagnóstico de condiciones de salud de los trabajadores", DESDE_21),
+    ReglaObligacion("Desarrollar actividades de medicina del trabajo y de promoción y prevención de la salud", DESDE_21),
+    ReglaObligacion("Reportar e investigar los incidentes, accidentes de trabajo y enfermedades laborales", DESDE_21),
+    ReglaObligacion("Medir la frecuencia, severidad y mortalidad de accidentes y la prevalencia e incidencia de enfermedad laboral", SOLO_60),
+    ReglaObligacion("Identificar peligros y evaluar y valorar los riesgos", TODOS),
+    ReglaObligacion("Realizar mediciones ambientales de los riesgos químicos, físicos y biológicos", SOLO_60),
+    ReglaObligacion("Implementar medidas de prevención y control frente a los peligros y riesgos identificados", TODOS),
+    ReglaObligacion("Diseñar e implementar programas de vigilancia epidemiológica para los riesgos prioritarios", SOLO_60),
+    ReglaObligacion("Realizar inspecciones sistemáticas a instalaciones, maquinaria y equipos con participación del COPASST", SOLO_60),
+    ReglaObligacion("Realizar mantenimiento periódico de instalaciones, equipos, máquinas y herramientas", DESDE_21),
+    ReglaObligacion("Entregar elementos de protección personal y capacitar en su uso", DESDE_21),
+    ReglaObligacion("Elaborar el plan de prevención, preparación y respuesta ante emergencias", DESDE_21),
+    ReglaObligacion("Conformar, capacitar y dotar la brigada de prevención, preparación y respuesta ante emergencias", DESDE_21),
+    ReglaObligacion("Realizar la revisión anual del SG-SST por la alta dirección", DESDE_21),
+    ReglaObligacion("Realizar la auditoría anual del SG-SST y definir acciones preventivas y correctivas", SOLO_60),
+    ReglaObligacion("Reportar anualmente la autoevaluación de estándares mínimos", TODOS),
+)
+
+
+def tramo_trabajadores(numero_empleados: Any) -> Optional[str]:
+    """
+    Clasifica el número de trabajadores en el tramo de la Resolución 0312.
+
+    Args:
+        numero_empleados: Número de trabajadores (int o string)
+
+    Returns:
+        Tramo de trabajadores, o None si el valor no es un número válido
+    """
+    try:
+        n = int(float(numero_empleados))
+    except (ValueError, TypeError):
+        return None
+    if n <= 0:
+        return None
+    if n <= 10:
+        return TRAMO_HASTA_10
+    if n <= 50:
+        return TRAMO_11_A_50
+    return TRAMO_MAS_50
+
+
+def extraer_clase_riesgo(clase_riesgo: Any) -> Optional[int]:
+    """
+    Extrae la clase de riesgo (1 a 5) de un entero o de un texto como
+    "Clase de Riesgo 3, la Actividad Economica es Manufactura".
+
+    Args:
+        clase_riesgo: Clase de riesgo tal como la retorna el perfilamiento
+
+    Returns:
+        Clase de riesgo, o None si no se puede determinar
+    """
+    if isinstance(clase_riesgo, int) and not isinstance(clase_riesgo, bool):
+        return clase_riesgo if clase_riesgo in CLASES_RIESGO else None
+    if not clase_riesgo:
+        return None
+
+    texto = str(clase_riesgo).upper()
+    match = re.search(r"\b([1-5])\b", texto)
+    if match:
+        return int(match.group(1))
+    match = re.search(r"\b(V|IV|III|II|I)\b", texto)
+    if match:
+        return {"I": 1, "II": 2, "III": 3, "IV": 4, "V": 5}[match.group(1)]
+    return None
+
+
+def nivel_estandares(clase: int, tramo: str) -> int:
+    """
+    Determina el capítulo de estándares mínimos aplicable.
+    Las clases IV y V y las empresas de más de 50 trabajadores aplican los 60 estándares.
+    """
+    if clase >= 4 or tramo == TRAMO_MAS_50:
+        return 60
+    if tramo == TRAMO_11_A_50:
+        return 21
+    return 7
+
+
+def evaluar_reglas(clase: int, tramo: str) -> List[str]:
+    """
+    Evalúa la tabla de reglas para una clase de riesgo y un tramo.
+
+    Args:
+        clase: Clase de riesgo (1 a 5)
+        tramo: Tramo de número de trabajadores
+
+    Returns:
+        Lista de obligaciones legales en el orden de la tabla
+    """
+    nivel = nivel_estandares(clase, tramo)
+    return [
+        regla.obligacion for regla in REGLAS_OBLIGACIONES
+        if nivel in regla.niveles and tramo in regla.tramos
+    ]
+
+
+class MotorObligaciones:
+    """Obligaciones legales precalculadas para cada par (clase de riesgo, tramo)."""
+
+    def __init__(self):
+        self._tabla: Dict[Tuple[int, str], Tuple[str, ...]] = {
+            (clase, tramo): tuple(evaluar_reglas(clase, tramo))
+            for clase in CLASES_RIESGO
+            for tramo in TRAMOS
+        }
+        # Obligaciones comunes a todas las combinaciones (respaldo si faltan la clase o el tramo)
+        self._base = tuple(o for o in self._tabla[(1, TRAMO_HASTA_10)] if all(o in t for t in self._tabla.values()))
+        print(f"[OK] MotorObligaciones inicializado: {len(self._tabla)} combinaciones precalculadas")
+
+    def obtener(self, clase_riesgo: Any, numero_empleados: Any) -> Optional[List[str]]:
+        """
+        Obtiene las obligaciones legales para un cliente.
+
+        Args:
+            clase_riesgo: Clase de riesgo (entero o texto del perfilamiento)
+            numero_empleados: Número de trabajadores
+
+        Returns:
+            Lista de obligaciones, o None si la clase o el tramo no son válidos
+        """
+        clase = extraer_clase_riesgo(clase_riesgo)
+        tramo = tramo_trabajadores(numero_empleados)
+        if clase is None or tramo is None:
+            return None
+        return list(self._tabla[(clase, tramo)])
+
+    def base(self) -> List[str]:
+        """
+        Obligaciones que aplican a cualquier clase de riesgo y tramo de
+        trabajadores (el subconjunto común de los estándares mínimos).
+        """
+        return list(self._base)
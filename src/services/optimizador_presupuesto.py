@@ -0,0 +1,327 @@
+"""
+Optimizador de presupuesto: asigna tarifas y horas a los productos seleccionados.
+Reemplaza la aritmética que antes hacía el LLM en el selector de productos.
+"""
+from math import gcd
+from typing import Optional, Dict, Any, List, Tuple, Callable
+
+import numpy as np
+
+
+CAMPOS_TARIFA = (
+    "valor_de_la_hora_equipos",
+    "valor_hora_aliado_basico",
+    "valor_hora_aliado_especializado",
+)
+
+# Límites de horas por producto (mínimo, máximo) según la sección
+LIMITES_HORAS = {
+    "productos_obligatorios": (4, 160),
+    "productos_prioritarios": (2, 80),
+}
+
+MAX_PRODUCTOS_POR_SECCION = 30
+
+# Tamaño máximo (en bits) del bitset usado para el ajuste exacto del saldo
+_LIMITE_BITS_AJUSTE = 1 << 16
+
+
+def a_numero(valor: Any) -> float:
+    """Convierte una tarifa del catálogo (número, string o null) a float."""
+    if valor is None or isinstance(valor, bool):
+        return 0.0
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    texto = str(valor).strip().replace("$", "").replace(" ", "")
+    if not texto:
+        return 0.0
+    # Formato colombiano: 95.000,50 → 95000.50
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    elif texto.count(".") > 1 or (texto.count(".") == 1 and len(texto.split(".")[1]) == 3):
+        texto = texto.replace(".", "")
+    try:
+        return float(texto)
+    except ValueError:
+        return 0.0
+
+
+def matriz_tarifas(productos: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Tarifas de los productos como matriz (n, len(CAMPOS_TARIFA)) de enteros
+    en pesos; los valores vacíos o inválidos quedan en 0.
+    """
+    return np.array(
+        [[round(a_numero(p.get(campo))) for campo in CAMPOS_TARIFA] for p in productos],
+        dtype=np.int64
+    ).reshape(len(productos), len(CAMPOS_TARIFA))
+
+
+def seleccionar_tarifas(
+    productos: List[Dict[str, Any]],
+    tarifas: Optional[np.ndarray] = None
+) -> List[Tuple[Optional[str], int]]:
+    """
+    Determina la tarifa aplicable a cada producto.
+    Respeta "tipo_tarifa_usada" si viene con un campo válido; si no, usa la
+    menor tarifa disponible para maximizar las horas cubiertas por el presupuesto.
+
+    Args:
+        productos: Productos del catálogo
+        tarifas: Matriz de tarifas alineada con `productos` (ver matriz_tarifas);
+            si no se indica, se calcula desde los productos
+
+    Returns:
+        Lista de tuplas (campo de tarifa usado, tarifa por hora en pesos);
+        (None, 0) para los productos sin tarifa
+    """
+    if tarifas is None:
+        tarifas = matriz_tarifas(productos)
+    # Menor tarifa positiva por fila; en empate gana el primer campo de CAMPOS_TARIFA
+    positivas = np.where(tarifas > 0, tarifas, np.iinfo(np.int64).max)
+    columnas = positivas.argmin(axis=1)
+    minimas = tarifas[np.arange(len(productos)), columnas]
+
+    seleccion = []
+    for i, producto in enumerate(productos):
+        sugerido = producto.get("tipo_tarifa_usada")
+        if sugerido in CAMPOS_TARIFA and tarifas[i, CAMPOS_TARIFA.index(sugerido)] > 0:
+            seleccion.append((sugerido, int(tarifas[i, CAMPOS_TARIFA.index(sugerido)])))
+        elif minimas[i] > 0:
+            seleccion.append((CAMPOS_TARIFA[columnas[i]], int(minimas[i])))
+        else:
+            seleccion.append((None, 0))
+    return seleccion
+
+
+def seleccionar_tarifa(producto: Dict[str, Any]) -> Tuple[Optional[str], int]:
+    """
+    Determina la tarifa aplicable a un producto (ver seleccionar_tarifas).
+
+    Args:
+        producto: Producto del catálogo
+
+    Returns:
+        Tupla (campo de tarifa usado, tarifa por hora en pesos)
+    """
+    return seleccionar_tarifas([producto])[0]
+
+
+class _Asignacion:
+    """Estado mutable de un producto durante la optimización."""
+    __slots__ = ("seccion", "producto", "campo", "tarifa", "minimo", "maximo", "horas")
+
+    def __init__(self, seccion, producto, campo, tarifa, minimo, maximo):
+        self.seccion = seccion
+        self.producto = producto
+        self.campo = campo
+        self.tarifa = tarifa
+        self.minimo = minimo
+        self.maximo = maximo
+        self.horas = 0
+
+
+def _omitido(producto: Dict[str, Any], seccion: str, motivo: str) -> Dict[str, Any]:
+    """Registro de un producto rankeado que no entra en la propuesta."""
+    return {
+        "id": producto.get("id"),
+        "seccion": seccion,
+        "descripcion_programas_de_prevencion": producto.get("descripcion_programas_de_prevencion"),
+        "motivo": motivo,
+    }
+
+
+def _limites(producto: Dict[str, Any], seccion: str) -> Tuple[int, int]:
+    """Límites de horas del producto (permite sobrescribirlos con horas_min/horas_max)."""
+    minimo, maximo = LIMITES_HORAS[seccion]
+    try:
+        minimo = int(producto.get("horas_min", minimo))
+        maximo = int(producto.get("horas_max", maximo))
+    except (ValueError, TypeError):
+        pass
+    minimo = max(1, minimo)
+    return minimo, max(minimo, maximo)
+
+
+def _ajustar_saldo(asignaciones: List[_Asignacion], saldo: int) -> int:
+    """
+    Ajuste exacto del saldo restante (subset-sum acotado con bitset).
+
+    Libera algunas horas de los productos más baratos y resuelve cuántas horas
+    reasignar a cada producto para acercar el gasto al presupuesto sin excederlo.
+
+    Returns:
+        Nuevo saldo restante
+    """
+    if not asignaciones:
+        return saldo
+
+    g = 0
+    for a in asignaciones:
+        g = gcd(g, a.tarifa)
+
+    # Sin productos con horas por agregar no hay nada que reasignar; con un
+    # saldo mayor que el bitset el ajuste no cabe (y el paso 2 ya llenó los máximos)
+    if saldo // g >= _LIMITE_BITS_AJUSTE or all(a.horas >= a.maximo for a in asignaciones):
+        return saldo
+
+    # Liberar hasta 2 horas por producto (del más barato al más caro) sin exceder el bitset
+    liberadas = {}
+    ventana = saldo
+    for a in sorted(asignaciones, key=lambda x: x.tarifa):
+        horas = min(2, a.horas - a.minimo)
+        while horas > 0 and (ventana + horas * a.tarifa) // g >= _LIMITE_BITS_AJUSTE:
+            horas -= 1
+        if horas > 0:
+            liberadas[a] = horas
+            ventana += horas * a.tarifa
+
+    capacidad = ventana // g
+    if capacidad == 0:
+        return saldo
+    mascara = (1 << (capacidad + 1)) - 1
+
+    # Subset-sum acotado: cada producto se divide en piezas binarias de horas
+    piezas = []
+    alcanzable = 1
+    for a in asignaciones:
+        disponibles = liberadas.get(a, 0) + (a.maximo - a.horas)
+        disponibles = min(disponibles, ventana // a.tarifa)
+        k = 1
+        while disponibles > 0:
+            n = min(k, disponibles)
+            peso = n * a.tarifa // g
+            piezas.append((a, n, peso, alcanzable))
+            alcanzable |= (alcanzable << peso) & mascara
+            disponibles -= n
+            k *= 2
+
+    mejor = alcanzable.bit_length() - 1
+    if mejor * g <= ventana - saldo:
+        return saldo
+
+    tomadas = {}
+    objetivo = mejor
+    for a, n, peso, previo in reversed(piezas):
+        if not (previo >> objetivo) & 1:
+            tomadas[a] = tomadas.get(a, 0) + n
+            objetivo -= peso
+
+    for a in asignaciones:
+        a.horas += tomadas.get(a, 0) - liberadas.get(a, 0)
+
+    return ventana - mejor * g
+
+
+def asignar_presupuesto(
+    productos_obligatorios: List[Dict[str, Any]],
+    productos_prioritarios: List[Dict[str, Any]],
+    valores_agregados: List[Dict[str, Any]],
+    presupuesto_anual: float,
+    tarifas_de: Optional[Callable[[List[Dict[str, Any]]], np.ndarray]] = None
+) -> Dict[str, Any]:
+    """
+    Asigna tarifa y horas a los productos rankeados sin exceder el presupuesto.
+
+    1. Asigna las horas mínimas en orden de ranking (primero obligatorios).
+    2. Reparte horas por rondas entre todos los productos hasta agotar el presupuesto.
+    3. Ajusta el saldo final con un subset-sum acotado para dejarlo casi en cero.
+
+    Args:
+        productos_obligatorios: Productos obligatorios ordenados por relevancia
+        productos_prioritarios: Productos prioritarios ordenados por relevancia
+        valores_agregados: Valores agregados (no consumen presupuesto)
+        presupuesto_anual: Presupuesto anual disponible
+        tarifas_de: Función que retorna la matriz de tarifas de una lista de
+            productos (p. ej. CatalogoService.tarifas_de, con las tarifas ya
+            normalizadas); por defecto se convierten desde los productos
+
+    Returns:
+        Diccionario con los productos valorizados, el resumen_presupuesto y
+        los productos_omitidos (id, sección y motivo: "tope_de_seccion",
+        "sin_tarifa" o "presupuesto_insuficiente" para sus horas mínimas)
+    """
+    presupuesto = int(max(0, presupuesto_anual or 0))
+    saldo = presupuesto
+
+    tarifas_de = tarifas_de or matriz_tarifas
+
+    asignaciones: List[_Asignacion] = []
+    omitidos: List[Dict[str, Any]] = []
+    for seccion, productos in (
+        ("productos_obligatorios", productos_obligatorios),
+        ("productos_prioritarios", productos_prioritarios),
+    ):
+        productos = productos or []
+        omitidos.extend(_omitido(p, seccion, "tope_de_seccion") for p in productos[MAX_PRODUCTOS_POR_SECCION:])
+        productos = productos[:MAX_PRODUCTOS_POR_SECCION]
+        tarifas = seleccionar_tarifas(productos, tarifas_de(productos))
+        for producto, (campo, tarifa) in zip(productos, tarifas):
+            if not tarifa:
+                descripcion = str(producto.get("descripcion_programas_de_prevencion") or "")
+                print(f"   [INFO] Producto sin tarifa omitido: {descripcion[:60]}")
+                omitidos.append(_omitido(producto, seccion, "sin_tarifa"))
+                continue
+            minimo, maximo = _limites(producto, seccion)
+            asignacion = _Asignacion(seccion, producto, campo, tarifa, minimo, maximo)
+            # Paso 1: horas mínimas en orden de ranking
+            if minimo * tarifa <= saldo:
+                asignacion.horas = minimo
+                saldo -= minimo * tarifa
+                asignaciones.append(asignacion)
+            else:
+                omitidos.append(_omitido(producto, seccion, "presupuesto_insuficiente"))
+
+    sin_presupuesto = sum(1 for o in omitidos if o["motivo"] == "presupuesto_insuficiente")
+    if sin_presupuesto:
+        print(f"   [INFO] {sin_presupuesto} productos omitidos: el presupuesto no alcanza para sus horas mínimas")
+
+    # Paso 2: rondas de una hora por producto respetando el ranking
+    activos = [a for a in asignaciones if a.horas < a.maximo]
+    while activos:
+        siguientes = []
+        for a in activos:
+            if a.tarifa <= saldo:
+                a.horas += 1
+                saldo -= a.tarifa
+                if a.horas < a.maximo:
+                    siguientes.append(a)
+        activos = siguientes
+
+    # Paso 3: ajuste exacto del saldo
+    saldo = _ajustar_saldo(asignaciones, saldo)
+
+    resultado: Dict[str, Any] = {
+        "productos_obligatorios": [],
+        "productos_prioritarios": [],
+    }
+    totales = {"productos_obligatorios": 0, "productos_prioritarios": 0}
+    for a in asignaciones:
+        subtotal = a.tarifa * a.horas
+        totales[a.seccion] += subtotal
+        resultado[a.seccion].append({
+            **a.producto,
+            "tipo_tarifa_usada": a.campo,
+            "tarifa_hora": a.tarifa,
+            "horas_asignadas": a.horas,
+            "subtotal": subtotal,
+        })
+
+    valores_agregados = valores_agregados or []
+    resultado["valores_agregados"] = [
+        {**valor, "tarifa_referencia": tarifa}
+        for valor, (_, tarifa) in zip(valores_agregados, seleccionar_tarifas(valores_agregados, tarifas_de(valores_agregados)))
+    ]
+
+    resultado["productos_omitidos"] = omitidos
+
+    total_productos = totales["productos_obligatorios"] + totales["productos_prioritarios"]
+    resultado["resumen_presupuesto"] = {
+        "presupuesto_anual": presupuesto,
+        "total_productos_obligatorios": totales["productos_obligatorios"],
+        "total_productos_prioritarios": totales["productos_prioritarios"],
+        "total_productos": total_productos,
+        "saldo_restante": presupuesto - total_productos,
+        "porcentaje_utilizado": round(total_productos / presupuesto * 100, 2) if presupuesto else 0,
+    }
+    return resultado
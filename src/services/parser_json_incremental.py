@@ -0,0 +1,109 @@
+"""
+Parser JSON incremental para respuestas del LLM en streaming.
+Entrega cada elemento de las listas de productos apenas se cierra.
+"""
+import json
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
+
+
+class ParserListasJSON:
+    """
+    Recibe fragmentos de texto de un objeto JSON y entrega, en cuanto se
+    completan, los elementos (objetos o strings) de sus listas de primer nivel.
+
+    Ejemplo: con claves=("productos_obligatorios",), el texto
+    '{"productos_obligatorios": [{"a": 1}, {"a": 2}]}' entrega
+    ("productos_obligatorios", {"a": 1}) y luego ("productos_obligatorios", {"a": 2});
+    '{"productos_obligatorios": ["x1", "x2"]}' entrega "x1" y luego "x2".
+    Cada elemento (y cada clave) se decodifica con json.loads sobre su texto
+    original, así que las secuencias de escape se respetan.
+
+    Cada carácter se procesa una sola vez; el texto completo se conserva
+    para parsear la respuesta final.
+    """
+
+    def __init__(self, claves: Iterable[str]):
+        self._claves = frozenset(claves)
+        self._partes: List[str] = []
+        self._captura: List[str] = []   # Texto del valor abierto en fragmentos anteriores
+        self._capturando = False
+        self._profundidad = 0
+        self._en_string = False
+        self._escape = False
+        self._cadena = ""               # Última cadena de primer nivel (posible clave)
+        self._clave_actual = None       # Clave de primer nivel cuyo valor se está leyendo
+        self._lista_actual = None       # Clave de la lista objetivo abierta
+
+    @property
+    def texto(self) -> str:
+        """Texto completo recibido hasta ahora."""
+        return "".join(self._partes)
+
+    def _cerrar_captura(self, fragmento: str, inicio: int, fin: int) -> Any:
+        """Decodifica el valor capturado (None si no es JSON válido)."""
+        self._captura.append(fragmento[inicio:fin])
+        texto_valor = "".join(self._captura)
+        self._captura = []
+        self._capturando = False
+        try:
+            return json.loads(texto_valor)
+        except json.JSONDecodeError:
+            return None
+
+    def alimentar(self, fragmento: str) -> Iterator[Tuple[str, Union[Dict[str, Any], str]]]:
+        """
+        Procesa un fragmento de la respuesta.
+
+        Args:
+            fragmento: Texto recibido del modelo
+
+        Yields:
+            Tuplas (clave de la lista, elemento) por cada elemento completado
+        """
+        if not fragmento:
+            return
+        self._partes.append(fragmento)
+        inicio = 0  # Inicio del valor capturado dentro de este fragmento
+
+        for i, c in enumerate(fragmento):
+            if self._en_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._en_string = False
+                    if self._capturando and self._profundidad <= 2:
+                        valor = self._cerrar_captura(fragmento, inicio, i + 1)
+                        if self._profundidad == 1:
+                            self._cadena = valor if isinstance(valor, str) else ""
+                        elif isinstance(valor, str):
+                            yield self._lista_actual, valor
+                continue
+
+            if c == '"':
+                self._en_string = True
+                if self._profundidad == 1 or (self._profundidad == 2 and self._lista_actual is not None):
+                    self._capturando = True
+                    inicio = i
+            elif c == ":" and self._profundidad == 1:
+                self._clave_actual = self._cadena
+            elif c == "{" or c == "[":
+                self._profundidad += 1
+                if self._profundidad == 2 and c == "[" and self._clave_actual in self._claves:
+                    self._lista_actual = self._clave_actual
+                elif self._profundidad == 3 and c == "{" and self._lista_actual is not None:
+                    self._capturando = True
+                    inicio = i
+            elif c == "}" or c == "]":
+                self._profundidad -= 1
+                if self._profundidad == 2 and self._capturando:
+                    elemento = self._cerrar_captura(fragmento, inicio, i + 1)
+                    if isinstance(elemento, dict):
+                        yield self._lista_actual, elemento
+                elif self._profundidad == 1:
+                    self._lista_actual = None
+                    self._clave_actual = None
+
+        if self._capturando:
+            self._captura.append(fragmento[inicio:])
@@ -1,17 +1,133 @@
 """
 Servicio para generar PDFs usando WeasyPrint.
 Usa el template HTML similar al de Prospektor-pdf.
+
+El HTML se renderiza con Jinja en el hilo que llama; el PDF (CPU intensivo)
+se genera en un pool de procesos precalentados que reutilizan la hoja de
+estilos parseada y la configuración de fuentes entre renders.
 """
 import os
-from typing import Dict, Any
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, Optional, Tuple
 from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
+from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
+
+
+TEMPLATE_PDF = "propuesta_comercial.html"
+CSS_PDF = "propuesta_comercial.css"
+
+_HTML_CALENTAMIENTO = (
+    "<html><body><h1>Propuesta</h1><table><tr><td>Calentamiento</td>"
+    "<td><strong>$0</strong></td></tr></table></body></html>"
+)
+
+
+class _Renderizador:
+    """Convierte HTML en PDF reutilizando la hoja de estilos y las fuentes."""
+
+    def __init__(self, template_dir: str):
+        self._template_dir = template_dir
+        self._font_config = FontConfiguration()
+        self._css = CSS(filename=os.path.join(template_dir, CSS_PDF), font_config=self._font_config)
+
+    def renderizar(self, html_string: str) -> bytes:
+        return HTML(string=html_string, base_url=self._template_dir).write_pdf(
+            stylesheets=[self._css], font_config=self._font_config
+        )
+
+    def calentar(self):
+        """Renderiza un documento mínimo para cargar fuentes y layout antes del primer PDF real."""
+        self.renderizar(_HTML_CALENTAMIENTO)
+
+
+# Renderizador del proceso worker (se crea en el initializer del pool)
+_renderizador_worker: Optional[_Renderizador] = None
+
+
+def _iniciar_worker(template_dir: str):
+    global _renderizador_worker
+    _renderizador_worker = _Renderizador(template_dir)
+    _renderizador_worker.calentar()
+
+
+def _renderizar_en_worker(html_string: str) -> bytes:
+    return _renderizador_worker.renderizar(html_string)
+
+
+def _pid_worker() -> int:
+    return os.getpid()
+
+
+# Pools compartidos por directorio de templates: crear un PDFGenerator no lanza
+# procesos nuevos. None = pool desactivado tras romperse (ver _desactivar_pool)
+_pools: Dict[Tuple[str, int], Optional[ProcessPoolExecutor]] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool_compartido(template_dir: str, procesos: int) -> Optional[ProcessPoolExecutor]:
+    """
+    Pool de procesos para un directorio de templates, creado y precalentado
+    en el primer uso, o None si se desactivó.
+    """
+    clave = (template_dir, procesos)
+    with _pools_lock:
+        if clave in _pools:
+            return _pools[clave]
+
+        # fork: los workers no reimportan la aplicación (spawn y forkserver
+        # re-ejecutarían main.py). Se crea una sola vez, al iniciar el servicio
+        pool = ProcessPoolExecutor(
+            max_workers=procesos,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_iniciar_worker,
+            initargs=(template_dir,)
+        )
+        # Una tarea por worker fuerza a iniciar (y calentar) todos los procesos ahora
+        for _ in range(procesos):
+            pool.submit(_pid_worker)
+        _pools[clave] = pool
+        print(f"[OK] Pool de PDF iniciado ({procesos} procesos)")
+        return pool
+
+
+def _desactivar_pool(template_dir: str, procesos: int):
+    """
+    Apaga un pool roto; desde entonces sus PDF se generan en el hilo que
+    llama. No se crea otro: hacer fork con los hilos de la aplicación ya
+    activos puede heredar locks tomados y bloquear a los procesos hijos.
+    """
+    with _pools_lock:
+        pool = _pools.get((template_dir, procesos))
+        _pools[(template_dir, procesos)] = None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        print("[WARN] Pool de PDF caído; los PDF se generan en el hilo que llama")
+
+
+def _procesos_default() -> int:
+    """SPU_PDF_PROCESOS (por defecto, hasta 2 según las CPUs; 0 renderiza en el hilo que llama)."""
+    valor = os.environ.get("SPU_PDF_PROCESOS")
+    if valor is not None:
+        return max(0, int(valor))
+    return min(2, os.cpu_count() or 1)
 
 
 class PDFGenerator:
     """Generador de PDFs para propuestas comerciales."""
     
-    def __init__(self, template_dir: str = None):
+    def __init__(self, template_dir: str = None, procesos: Optional[int] = None):
+        """
+        Args:
+            template_dir: Directorio del template HTML y su hoja de estilos
+            procesos: Procesos del pool de render (por defecto SPU_PDF_PROCESOS;
+                0 genera el PDF en el hilo que llama)
+        """
         if template_dir is None:
             # Buscar directorio de templates
             base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
@@ -24,7 +140,26 @@ class PDFGenerator:
         self._env.filters['format_currency'] = self._format_currency
         self._env.filters['safe_value'] = self._safe_value
         
-        print(f"[OK] PDFGenerator inicializado (templates: {template_dir})")
+        self._version_template = self._calcular_version_template()
+        
+        self._procesos = procesos if procesos is not None else _procesos_default()
+        self._local = threading.local()
+        if self._procesos > 0:
+            _pool_compartido(self._template_dir, self._procesos)
+        
+        print(f"[OK] PDFGenerator inicializado (templates: {template_dir}, procesos: {self._procesos})")
+    
+    @property
+    def version_template(self) -> str:
+        """Hash del template y su hoja de estilos (cambia si cambia el diseño del PDF)."""
+        return self._version_template
+    
+    def _calcular_version_template(self) -> str:
+        digest = hashlib.sha256()
+        for nombre in (TEMPLATE_PDF, CSS_PDF):
+            with open(os.path.join(self._template_dir, nombre), "rb") as f:
+                digest.update(f.read())
+        return digest.hexdigest()[:16]
     
     @staticmethod
     def _format_currency(value, default='$0'):
@@ -42,10 +177,22 @@ class PDFGenerator:
             return default
         return str(value)
     
+    def _renderizar_html(self, data: Dict[str, Any]) -> str:
+        """Renderiza el template HTML con los datos de la propuesta."""
+        template = self._env.get_template(TEMPLATE_PDF)
+        return template.render(self._preparar_datos_template(data))
+    
+    def _renderizar_local(self, html_string: str) -> bytes:
+        """Genera el PDF en el hilo actual (un renderizador por hilo)."""
+        renderizador = getattr(self._local, "renderizador", None)
+        if renderizador is None:
+            renderizador = self._local.renderizador = _Renderizador(self._template_dir)
+        return renderizador.renderizar(html_string)
+    
     def generar_pdf(self, data: Dict[str, Any]) -> bytes:
         """
         Genera un PDF a partir de los datos de la propuesta.
-        
+            
         Args:
             data: Diccionario con datos de la propuesta comercial
             
@@ -53,24 +200,51 @@ class PDFGenerator:
             Bytes del PDF generado
         """
         try:
-            # Cargar template
-            template = self._env.get_template("propuesta_comercial.html")
+            html_string = self._renderizar_html(data)
             
-            # Preparar datos para el template
-            template_data = self._preparar_datos_template(data)
+            pool = _pool_compartido(self._template_dir, self._procesos) if self._procesos > 0 else None
+            if pool is None:
+                pdf_bytes = self._renderizar_local(html_string)
+            else:
+                try:
+                    pdf_bytes = pool.submit(_renderizar_en_worker, html_string).result()
+                except BrokenProcessPool:
+                    _desactivar_pool(self._template_dir, self._procesos)
+                    pdf_bytes = self._renderizar_local(html_string)
             
-            # Renderizar HTML
-            html_string = template.render(template_data)
+            print(f"[OK] PDF generado ({len(pdf_bytes)} bytes)")
+            return pdf_bytes
+        
+        except Exception as e:
+            print(f"[ERROR] Error generando PDF: {e}")
+            raise
+    
+    async def generar_pdf_async(self, data: Dict[str, Any]) -> bytes:
+        """
+        Versión asíncrona de generar_pdf: el event loop queda libre mientras
+        el pool genera el PDF.
+            
+        Args:
+            data: Diccionario con datos de la propuesta comercial
             
-            # Generar PDF
-            pdf_bytes = HTML(
-                string=html_string,
-                base_url=self._template_dir
-            ).write_pdf()
+        Returns:
+            Bytes del PDF generado
+        """
+        pool = _pool_compartido(self._template_dir, self._procesos) if self._procesos > 0 else None
+        if pool is None:
+            return await asyncio.to_thread(self.generar_pdf, data)
+        
+        try:
+            html_string = self._renderizar_html(data)
+            try:
+                pdf_bytes = await asyncio.wrap_future(pool.submit(_renderizar_en_worker, html_string))
+            except BrokenProcessPool:
+                _desactivar_pool(self._template_dir, self._procesos)
+                pdf_bytes = await asyncio.to_thread(self._renderizar_local, html_string)
             
             print(f"[OK] PDF generado ({len(pdf_bytes)} bytes)")
             return pdf_bytes
-            
+        
         except Exception as e:
             print(f"[ERROR] Error generando PDF: {e}")
             raise
@@ -101,7 +275,7 @@ class PDFGenerator:
     def guardar_pdf(self, data: Dict[str, Any], output_path: str) -> str:
         """
         Genera y guarda un PDF en disco.
-        
+            
         Args:
             data: Diccionario con datos de la propuesta
             output_path: Ruta donde guardar el PDF
@@ -116,4 +290,3 @@ class PDFGenerator:
         
         print(f"[OK] PDF guardado en: {output_path}")
         return output_path
-
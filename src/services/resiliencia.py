@@ -0,0 +1,363 @@
+"""
+Resiliencia de las llamadas al LLM: reintentos con backoff exponencial y
+jitter para errores transitorios, solicitudes de cobertura (hedging) cuando
+una llamada supera su p95, y circuit breaker por modelo.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, Dict, Any, Callable, Awaitable, TypeVar, NamedTuple, Deque
+
+from .metricas import registrar_reintento, registrar_cobertura
+
+try:
+    import httpx
+    _ERRORES_RED = (httpx.TimeoutException, httpx.NetworkError)
+except ImportError:
+    _ERRORES_RED = ()
+
+T = TypeVar("T")
+
+# Códigos HTTP que vale la pena reintentar (límite de cuota y fallas del backend)
+CODIGOS_TRANSITORIOS = frozenset({408, 429, 500, 502, 503, 504})
+
+CIRCUITO_CERRADO = "cerrado"
+CIRCUITO_ABIERTO = "abierto"
+CIRCUITO_SEMIABIERTO = "semiabierto"
+
+
+class CircuitoAbiertoError(RuntimeError):
+    """El backend del modelo está degradado; la llamada se rechaza sin intentarla."""
+
+
+def es_error_transitorio(error: BaseException) -> bool:
+    """
+    Clasifica un error de una llamada al LLM.
+
+    Returns:
+        True para cuota agotada (429), errores 5xx, timeouts y fallas de red;
+        False para errores de la solicitud (400, 403, 404...) y de parseo
+    """
+    codigo = getattr(error, "code", None)  # google.genai.errors.APIError
+    if isinstance(codigo, int):
+        return codigo in CODIGOS_TRANSITORIOS
+    return isinstance(error, (TimeoutError, ConnectionError, asyncio.TimeoutError) + _ERRORES_RED)
+
+
+class PoliticaReintentos(NamedTuple):
+    """Reintentos con backoff exponencial y jitter completo."""
+    intentos: int = 3            # Intentos totales (1 = sin reintentos)
+    espera_base: float = 0.5     # Segundos
+    espera_max: float = 8.0
+
+    def espera(self, intento: int) -> float:
+        """Espera antes del reintento número `intento` (desde 1)."""
+        return random.uniform(0, min(self.espera_max, self.espera_base * 2 ** (intento - 1)))
+
+
+class Circuito:
+    """
+    Circuit breaker: se abre tras `umbral` fallos transitorios consecutivos,
+    rechaza llamadas durante `enfriamiento` segundos y luego deja pasar una
+    llamada de prueba (semiabierto) que lo cierra o lo vuelve a abrir.
+    """
+
+    def __init__(self, umbral: int = 5, enfriamiento: float = 30.0):
+        self._umbral = umbral
+        self._enfriamiento = enfriamiento
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_en: Optional[float] = None
+        self._prueba_en_curso = False
+
+    @property
+    def estado(self) -> str:
+        with self._lock:
+            return self._estado()
+
+    def _estado(self) -> str:
+        if self._abierto_en is None:
+            return CIRCUITO_CERRADO
+        if time.monotonic() - self._abierto_en < self._enfriamiento:
+            return CIRCUITO_ABIERTO
+        return CIRCUITO_SEMIABIERTO
+
+    def permitir(self):
+        """
+        Raises:
+            CircuitoAbiertoError: Si el circuito está abierto o ya hay una llamada de prueba
+        """
+        with self._lock:
+            estado = self._estado()
+            if estado == CIRCUITO_CERRADO:
+                return
+            if estado == CIRCUITO_SEMIABIERTO and not self._prueba_en_curso:
+                self._prueba_en_curso = True
+                return
+            restante = max(0.0, self._enfriamiento - (time.monotonic() - self._abierto_en))
+        raise CircuitoAbiertoError(f"Circuito abierto tras {self._fallos} fallos (reintento en {restante:.0f}s)")
+
+    def registrar_exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_en = None
+            self._prueba_en_curso = False
+
+    def registrar_fallo(self):
+        with self._lock:
+            self._fallos += 1
+            if self._prueba_en_curso or (self._abierto_en is None and self._fallos >= self._umbral):
+                self._abierto_en = time.monotonic()
+                print(f"[WARN] Circuito LLM abierto por {self._enfriamiento:.0f}s ({self._fallos} fallos)")
+            self._prueba_en_curso = False
+
+
+class _Latencias:
+    """Ventana de latencias exitosas por paso para estimar el p95."""
+
+    def __init__(self, ventana: int = 200, minimo: int = 20):
+        self._ventana = ventana
+        self._minimo = minimo
+        self._lock = threading.Lock()
+        self._por_paso: Dict[str, Deque[float]] = {}
+
+    def agregar(self, paso: str, segundos: float):
+        with self._lock:
+            self._por_paso.setdefault(paso, deque(maxlen=self._ventana)).append(segundos)
+
+    def p95(self, paso: str) -> Optional[float]:
+        """p95 del paso, o None si aún no hay suficientes muestras."""
+        with self._lock:
+            muestras = sorted(self._por_paso.get(paso, ()))
+        if len(muestras) < self._minimo:
+            return None
+        return muestras[int(0.95 * (len(muestras) - 1))]
+
+
+class Resiliencia:
+    """
+    Ejecuta llamadas al LLM con reintentos, cobertura y circuit breaker.
+
+    Solo se reintentan (y cuentan para el circuito) los errores transitorios;
+    un 400 o una respuesta mal formada se propagan de inmediato.
+    """
+
+    def __init__(
+        self,
+        politica: Optional[PoliticaReintentos] = None,
+        cobertura: bool = False,
+        umbral_circuito: int = 5,
+        enfriamiento_circuito: float = 30.0,
+        max_hilos_cobertura: int = 16
+    ):
+        """
+        Args:
+            politica: Reintentos y backoff
+            cobertura: Si True, lanza una solicitud duplicada cuando la llamada supera el p95 del paso
+            umbral_circuito: Fallos transitorios consecutivos que abren el circuito (0 lo desactiva)
+            enfriamiento_circuito: Segundos que el circuito permanece abierto
+            max_hilos_cobertura: Hilos para las llamadas síncronas con cobertura
+        """
+        self._politica = politica or PoliticaReintentos()
+        self._cobertura = cobertura
+        self._umbral_circuito = umbral_circuito
+        self._enfriamiento_circuito = enfriamiento_circuito
+        self._max_hilos = max_hilos_cobertura
+
+        self._circuitos: Dict[str, Circuito] = {}
+        self._latencias = _Latencias()
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def desde_entorno(cls) -> "Resiliencia":
+        """
+        SPU_LLM_REINTENTOS (intentos totales, 3 por defecto), SPU_LLM_COBERTURA
+        (false por defecto), SPU_LLM_CIRCUITO_UMBRAL (5) y
+        SPU_LLM_CIRCUITO_ENFRIAMIENTO (30 segundos).
+        """
+        return cls(
+            politica=PoliticaReintentos(intentos=max(1, int(os.environ.get("SPU_LLM_REINTENTOS", 3)))),
+            cobertura=os.environ.get("SPU_LLM_COBERTURA", "false").strip().lower() in ("1", "true", "yes", "si", "sí"),
+            umbral_circuito=int(os.environ.get("SPU_LLM_CIRCUITO_UMBRAL", 5)),
+            enfriamiento_circuito=float(os.environ.get("SPU_LLM_CIRCUITO_ENFRIAMIENTO", 30))
+        )
+
+    def circuito(self, modelo: str) -> Circuito:
+        """Circuit breaker del modelo (cada modelo tiene su propia cuota y capacidad)."""
+        with self._lock:
+            circuito = self._circuitos.get(modelo)
+            if circuito is None:
+                circuito = self._circuitos[modelo] = Circuito(self._umbral_circuito, self._enfriamiento_circuito)
+            return circuito
+
+    def estado(self) -> Dict[str, Any]:
+        """Estado de los circuitos por modelo (para /health)."""
+        with self._lock:
+            circuitos = dict(self._circuitos)
+        return {modelo: circuito.estado for modelo, circuito in circuitos.items()}
+
+    def _permitir(self, modelo: str):
+        if self._umbral_circuito > 0:
+            self.circuito(modelo).permitir()
+
+    def _registrar(self, modelo: str, error: Optional[BaseException]):
+        if self._umbral_circuito <= 0:
+            return
+        if error is None or not es_error_transitorio(error):
+            self.circuito(modelo).registrar_exito()
+        else:
+            self.circuito(modelo).registrar_fallo()
+
+    def _debe_reintentar(
+        self,
+        error: BaseException,
+        intento: int,
+        reintentable: Optional[Callable[[BaseException], bool]]
+    ) -> bool:
+        if intento >= self._politica.intentos or not es_error_transitorio(error):
+            return False
+        return reintentable is None or reintentable(error)
+
+    def ejecutar(
+        self,
+        llamada: Callable[[], T],
+        paso: Optional[str],
+        modelo: str,
+        cobertura: bool = True,
+        reintentable: Optional[Callable[[BaseException], bool]] = None
+    ) -> T:
+        """
+        Ejecuta una llamada síncrona.
+
+        Args:
+            llamada: Un intento de la llamada
+            paso: Paso del flujo (p95 y métricas)
+            modelo: Modelo llamado (circuit breaker)
+            cobertura: False para llamadas no duplicables (p. ej. streaming)
+            reintentable: Condición adicional para reintentar un error transitorio
+
+        Raises:
+            CircuitoAbiertoError: Si el circuito del modelo está abierto
+        """
+        paso = paso or "sin_paso"
+        intento = 1
+        while True:
+            self._permitir(modelo)
+            inicio = time.perf_counter()
+            try:
+                if cobertura and self._cobertura:
+                    resultado = self._con_cobertura(llamada, paso)
+                else:
+                    resultado = llamada()
+            except Exception as e:
+                self._registrar(modelo, e)
+                if not self._debe_reintentar(e, intento, reintentable):
+                    raise
+                espera = self._politica.espera(intento)
+                print(f"[WARN] Error transitorio en LLM ({paso}), reintento {intento} en {espera:.2f}s: {e}")
+                registrar_reintento(paso)
+                time.sleep(espera)
+                intento += 1
+                continue
+            self._registrar(modelo, None)
+            self._latencias.agregar(paso, time.perf_counter() - inicio)
+            return resultado
+
+    async def ejecutar_async(
+        self,
+        llamada: Callable[[], Awaitable[T]],
+        paso: Optional[str],
+        modelo: str,
+        cobertura: bool = True,
+        reintentable: Optional[Callable[[BaseException], bool]] = None
+    ) -> T:
+        """Versión asíncrona de ejecutar (la solicitud perdedora de la cobertura se cancela)."""
+        paso = paso or "sin_paso"
+        intento = 1
+        while True:
+            self._permitir(modelo)
+            inicio = time.perf_counter()
+            try:
+                if cobertura and self._cobertura:
+                    resultado = await self._con_cobertura_async(llamada, paso)
+                else:
+                    resultado = await llamada()
+            except Exception as e:
+                self._registrar(modelo, e)
+                if not self._debe_reintentar(e, intento, reintentable):
+                    raise
+                espera = self._politica.espera(intento)
+                print(f"[WARN] Error transitorio en LLM ({paso}), reintento {intento} en {espera:.2f}s: {e}")
+                registrar_reintento(paso)
+                await asyncio.sleep(espera)
+                intento += 1
+                continue
+            self._registrar(modelo, None)
+            self._latencias.agregar(paso, time.perf_counter() - inicio)
+            return resultado
+
+    def _pool_cobertura(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self._max_hilos, thread_name_prefix="llm-cobertura")
+            return self._pool
+
+    def _con_cobertura(self, llamada: Callable[[], T], paso: str) -> T:
+        """
+        Lanza la llamada y, si no termina dentro del p95 del paso, una duplicada;
+        gana la primera respuesta exitosa. La perdedora no se puede interrumpir
+        (hilo) y su resultado se descarta.
+        """
+        p95 = self._latencias.p95(paso)
+        if p95 is None:
+            return llamada()
+
+        pool = self._pool_cobertura()
+        # Cada hilo corre con una copia del contexto (colector de métricas de la ejecución)
+        original = pool.submit(contextvars.copy_context().run, llamada)
+        listos, _ = wait([original], timeout=p95)
+        if listos:
+            return original.result()
+
+        registrar_cobertura(paso)
+        pendientes = {original, pool.submit(contextvars.copy_context().run, llamada)}
+        error: Optional[BaseException] = None
+        while pendientes:
+            listos, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                if futuro.exception() is None:
+                    return futuro.result()
+                error = futuro.exception()
+        raise error
+
+    async def _con_cobertura_async(self, llamada: Callable[[], Awaitable[T]], paso: str) -> T:
+        """Versión asíncrona de _con_cobertura."""
+        p95 = self._latencias.p95(paso)
+        if p95 is None:
+            return await llamada()
+
+        original = asyncio.ensure_future(llamada())
+        listos, _ = await asyncio.wait({original}, timeout=p95)
+        if listos:
+            return original.result()
+
+        registrar_cobertura(paso)
+        pendientes = {original, asyncio.ensure_future(llamada())}
+        error: Optional[BaseException] = None
+        try:
+            while pendientes:
+                listos, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+                for tarea in listos:
+                    if tarea.exception() is None:
+                        return tarea.result()
+                    error = tarea.exception()
+            raise error
+        finally:
+            for tarea in pendientes:
+                tarea.cancel()
@@ -0,0 +1,71 @@
+"""
+Tabla de ruteo del LLM por paso del flujo: modelo, tokens, temperatura,
+timeout y presupuesto de razonamiento (thinking).
+"""
+import os
+import json
+from typing import Optional, Dict, Any, NamedTuple
+
+
+class RutaLLM(NamedTuple):
+    """Configuración de las llamadas al LLM de un paso."""
+    modelo: Optional[str] = None             # None: modelo por defecto del servicio
+    max_tokens: int = 65536
+    temperature: Optional[float] = None      # None: 0.2 para respuestas JSON
+    timeout_segundos: Optional[float] = None  # None: sin timeout por llamada
+    thinking_budget: Optional[int] = None    # None: valor por defecto del modelo; 0 lo desactiva
+
+
+# Pasos livianos (respuestas de menos de 200 tokens) usan un modelo lite sin razonamiento
+RUTAS_POR_PASO: Dict[str, RutaLLM] = {
+    "recolector": RutaLLM(
+        modelo="gemini-2.5-flash-lite", max_tokens=1024, temperature=0.2,
+        timeout_segundos=20, thinking_budget=0
+    ),
+    "perfil_riesgo": RutaLLM(
+        modelo="gemini-2.5-flash-lite", max_tokens=2048, temperature=0.2,
+        timeout_segundos=30, thinking_budget=0
+    ),
+    "selector_productos": RutaLLM(
+        modelo="gemini-2.5-flash", max_tokens=16384, temperature=0.5,
+        timeout_segundos=120, thinking_budget=1024
+    ),
+    "documentador": RutaLLM(
+        modelo="gemini-2.5-flash", max_tokens=32768, temperature=0.2,
+        timeout_segundos=120, thinking_budget=0
+    ),
+}
+
+
+def cargar_rutas_llm(configuracion: Optional[str] = None) -> Dict[str, RutaLLM]:
+    """
+    Construye la tabla de ruteo combinando RUTAS_POR_PASO con la configuración
+    de SPU_LLM_RUTAS (JSON por paso; solo se sobrescriben los campos indicados).
+
+    Ejemplo: {"selector_productos": {"modelo": "gemini-2.5-pro", "timeout_segundos": 180}}
+
+    Args:
+        configuracion: JSON de configuración (por defecto, SPU_LLM_RUTAS)
+
+    Returns:
+        Ruta por paso
+    """
+    rutas = dict(RUTAS_POR_PASO)
+    configuracion = configuracion if configuracion is not None else os.environ.get("SPU_LLM_RUTAS", "")
+    if not configuracion.strip():
+        return rutas
+
+    try:
+        cambios: Dict[str, Dict[str, Any]] = json.loads(configuracion)
+        for paso, campos in cambios.items():
+            desconocidos = set(campos) - set(RutaLLM._fields)
+            if desconocidos:
+                print(f"[WARN] SPU_LLM_RUTAS: campos desconocidos en '{paso}': {sorted(desconocidos)}")
+            rutas[paso] = rutas.get(paso, RutaLLM())._replace(
+                **{campo: valor for campo, valor in campos.items() if campo in RutaLLM._fields}
+            )
+    except (ValueError, AttributeError, TypeError) as e:
+        print(f"[WARN] SPU_LLM_RUTAS inválido, se usa la tabla por defecto: {e}")
+        return dict(RUTAS_POR_PASO)
+
+    return rutas
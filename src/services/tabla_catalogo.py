@@ -0,0 +1,235 @@
+"""
+Catálogo materializado en memoria: columnas tipadas e índices precalculados.
+
+Se construye una sola vez por versión del catálogo. Las consultas por id,
+por clave de fila, por categoría y por subcategoría son O(1), y las tarifas normalizadas están en una matriz NumPy para hacer la
+aritmética de precios de forma vectorizada.
+"""
+import base64
+import hashlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .indice_relevancia import IndiceRelevancia, normalizar_categoria
+from .optimizador_presupuesto import CAMPOS_TARIFA, matriz_tarifas
+
+
+def _normalizar(valor: Any) -> str:
+    return " ".join(str(valor or "").upper().split())
+
+
+def clave_producto(producto: Dict[str, Any]) -> Tuple[str, str]:
+    """Clave de búsqueda de un producto: (categoría, descripción) normalizadas."""
+    return (
+        _normalizar(producto.get("categoria_de_programas")),
+        _normalizar(producto.get("descripcion_programas_de_prevencion"))
+    )
+
+
+def clave_fila(producto: Dict[str, Any]) -> Tuple[str, ...]:
+    """
+    Clave de una fila del catálogo: categoría, descripción, subcategoría,
+    tema y tipo normalizados. Varias filas pueden compartir la descripción.
+    """
+    return clave_producto(producto) + tuple(
+        _normalizar(producto.get(campo)) for campo in ("subcategoria", "tema", "tipo")
+    )
+
+
+def id_producto(producto: Dict[str, Any], ordinal: int = 0) -> str:
+    """
+    Id corto y estable de una fila: 8 caracteres base32 del hash de su clave
+    de fila. Las filas repetidas exactamente se distinguen por su ordinal (0
+    para la primera aparición). No depende de la posición en el catálogo, así
+    que se conserva entre recargas.
+    """
+    clave = "|".join(clave_fila(producto))
+    if ordinal:
+        clave += f"#{ordinal}"
+    return base64.b32encode(hashlib.sha1(clave.encode("utf-8")).digest()).decode("ascii")[:8].lower()
+
+
+class TablaCatalogo:
+    """
+    Una versión del catálogo en formato columnar.
+
+    Las filas conservan los registros originales de Automy (`productos`);
+    las columnas `ids`, `categorias`, `subcategorias` y `tarifas` están
+    alineadas con ellas.
+    """
+
+    __slots__ = (
+        "version", "productos", "ids", "categorias", "subcategorias", "tarifas", "indice",
+        "_nombres_categoria", "_nombres_subcategoria", "_fila_por_id", "_fila_por_objeto",
+        "_fila_por_clave_fila", "_fila_por_clave", "_filas_por_categoria", "_filas_por_subcategoria",
+    )
+
+    def __init__(self, productos: List[Dict[str, Any]], version: str = ""):
+        """
+        Args:
+            productos: Registros del catálogo
+            version: Versión del catálogo (hash del contenido)
+        """
+        self.version = version
+        self.productos = list(productos)
+
+        self._nombres_categoria: List[str] = []
+        self._nombres_subcategoria: List[str] = []
+        codigos_categoria: Dict[str, int] = {}
+        codigos_subcategoria: Dict[str, int] = {}
+        categorias = []
+        subcategorias = []
+        for p in self.productos:
+            categoria = str(p.get("categoria_de_programas") or "")
+            codigo = codigos_categoria.setdefault(normalizar_categoria(categoria), len(codigos_categoria))
+            if codigo == len(self._nombres_categoria):
+                self._nombres_categoria.append(categoria)
+            categorias.append(codigo)
+
+            subcategoria = str(p.get("subcategoria") or "")
+            codigo = codigos_subcategoria.setdefault(normalizar_categoria(subcategoria), len(codigos_subcategoria))
+            if codigo == len(self._nombres_subcategoria):
+                self._nombres_subcategoria.append(subcategoria)
+            subcategorias.append(codigo)
+
+        # Códigos enteros por fila (ver nombres_categorias / nombres_subcategorias)
+        self.categorias = np.array(categorias, dtype=np.int32)
+        self.subcategorias = np.array(subcategorias, dtype=np.int32)
+        self._filas_por_categoria = {
+            nombre: np.flatnonzero(self.categorias == codigo)
+            for nombre, codigo in codigos_categoria.items()
+        }
+        self._filas_por_subcategoria = {
+            nombre: np.flatnonzero(self.subcategorias == codigo)
+            for nombre, codigo in codigos_subcategoria.items()
+        }
+
+        self.tarifas = matriz_tarifas(self.productos)
+
+        # Ids únicos por fila; ante filas repetidas (o una colisión del hash) se usa el siguiente ordinal
+        self.ids: List[str] = []
+        self._fila_por_id: Dict[str, int] = {}
+        self._fila_por_objeto: Dict[int, int] = {}
+        self._fila_por_clave_fila: Dict[Tuple[str, ...], int] = {}
+        self._fila_por_clave: Dict[Tuple[str, str], int] = {}
+        ordinales: Dict[Tuple[str, ...], int] = {}
+        compartidas = 0
+        for fila, p in enumerate(self.productos):
+            clave = clave_fila(p)
+            ordinal = ordinales.get(clave, 0)
+            id_ = id_producto(p, ordinal)
+            while id_ in self._fila_por_id:
+                ordinal += 1
+                id_ = id_producto(p, ordinal)
+            ordinales[clave] = ordinal + 1
+            self.ids.append(id_)
+            self._fila_por_id[id_] = fila
+            self._fila_por_objeto[id(p)] = fila
+            # La primera fila gana, igual que el id sin ordinal
+            self._fila_por_clave_fila.setdefault(clave, fila)
+            if self._fila_por_clave.setdefault(clave[:2], fila) != fila:
+                compartidas += 1
+        if compartidas:
+            print(
+                f"[INFO] {compartidas} productos repiten categoría y descripción de otro; "
+                "se distinguen por subcategoría, tema, tipo y su id"
+            )
+
+        self.indice = IndiceRelevancia(self.productos) if self.productos else None
+
+    def __len__(self) -> int:
+        return len(self.productos)
+
+    def nombres_categorias(self) -> Dict[str, int]:
+        """Categorías del catálogo y su cantidad de productos."""
+        conteos = np.bincount(self.categorias, minlength=len(self._nombres_categoria))
+        return dict(zip(self._nombres_categoria, conteos.tolist()))
+
+    def nombres_subcategorias(self) -> List[str]:
+        """Subcategorías del catálogo, en orden de aparición."""
+        return list(self._nombres_subcategoria)
+
+    def fila_por_id(self, id_: str) -> Optional[int]:
+        return self._fila_por_id.get(str(id_).strip().lower())
+
+    def por_id(self, id_: str) -> Optional[Dict[str, Any]]:
+        """Producto con ese id corto, o None."""
+        fila = self.fila_por_id(id_)
+        return self.productos[fila] if fila is not None else None
+
+    def fila_por_clave(self, producto: Dict[str, Any]) -> Optional[int]:
+        """
+        Primera fila con la misma clave de fila; si el producto no trae
+        subcategoría, tema o tipo que coincidan, la primera con su categoría
+        y descripción.
+        """
+        fila = self._fila_por_clave_fila.get(clave_fila(producto))
+        return fila if fila is not None else self._fila_por_clave.get(clave_producto(producto))
+
+    def por_clave(self, producto: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Registro del catálogo con la misma clave (ver fila_por_clave), o None."""
+        fila = self.fila_por_clave(producto)
+        return self.productos[fila] if fila is not None else None
+
+    def fila_de(self, producto: Dict[str, Any]) -> Optional[int]:
+        """
+        Fila de un producto: la del propio registro si es de esta tabla, la
+        de su "id" (registros hidratados) o, en último caso, la de su clave.
+        """
+        fila = self._fila_por_objeto.get(id(producto))
+        if fila is not None and self.productos[fila] is producto:
+            return fila
+        if producto.get("id"):
+            fila = self.fila_por_id(producto["id"])
+            if fila is not None:
+                return fila
+        return self.fila_por_clave(producto)
+
+    def id_de(self, producto: Dict[str, Any]) -> Optional[str]:
+        """Id de la fila de un producto (ver fila_de), o None si no está en el catálogo."""
+        fila = self.fila_de(producto)
+        return self.ids[fila] if fila is not None else None
+
+    def filas_categorias(self, categorias: Iterable[str]) -> np.ndarray:
+        """Filas (ordenadas) de los productos de esas categorías."""
+        filas = [self._filas_por_categoria.get(normalizar_categoria(c)) for c in categorias]
+        filas = [f for f in filas if f is not None]
+        if not filas:
+            return np.empty(0, dtype=np.int64)
+        return filas[0] if len(filas) == 1 else np.sort(np.concatenate(filas))
+
+    def por_categoria(self, categoria: str) -> List[Dict[str, Any]]:
+        """Productos de una categoría, en el orden del catálogo."""
+        return [self.productos[i] for i in self.filas_categorias([categoria]).tolist()]
+
+    def por_subcategoria(self, subcategoria: str) -> List[Dict[str, Any]]:
+        """Productos de una subcategoría, en el orden del catálogo."""
+        filas = self._filas_por_subcategoria.get(normalizar_categoria(subcategoria))
+        return [] if filas is None else [self.productos[i] for i in filas.tolist()]
+
+    def tarifas_de(self, productos: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Tarifas de una lista de productos como matriz (n, len(CAMPOS_TARIFA)).
+        Los productos del catálogo toman la fila precalculada de la misma fila
+        con la que se hidrataron (ver fila_de); los demás se convierten.
+        """
+        filas = [self.fila_de(p) for p in productos]
+        if all(f is not None for f in filas):
+            return self.tarifas[np.array(filas, dtype=np.int64)].reshape(len(productos), len(CAMPOS_TARIFA))
+        matriz = np.zeros((len(productos), len(CAMPOS_TARIFA)), dtype=np.int64)
+        for i, (fila, producto) in enumerate(zip(filas, productos)):
+            matriz[i] = self.tarifas[fila] if fila is not None else matriz_tarifas([producto])[0]
+        return matriz
+
+    def buscar_relevantes(
+        self,
+        consulta: Iterable[str],
+        categorias: Optional[Iterable[str]] = None,
+        k: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Productos más relevantes (BM25), restringidos a las categorías indicadas."""
+        if self.indice is None:
+            return []
+        filas = self.filas_categorias(categorias) if categorias is not None else None
+        return [self.productos[i] for i in self.indice.buscar(consulta, k=k, filas=filas)]
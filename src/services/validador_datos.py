@@ -0,0 +1,122 @@
+"""
+Validador determinístico de los datos del formulario de propuesta.
+Reemplaza la llamada al LLM del agente recolector con un esquema pydantic.
+"""
+import re
+from typing import Dict, Any, List
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+
+# Nombres descriptivos usados en el mensaje al usuario (mismo orden del formulario)
+NOMBRES_CAMPOS = {
+    "nombre_empresa": "Nombre de la Empresa",
+    "numero_empleados": "Número de Empleados",
+    "codigo_ciiu": "Código CIIU",
+    "aportes_mensuales": "Aportes Mensuales",
+    "porcentaje_reinversion": "Porcentaje de Reinversión",
+    "enfoque_prioritario": "Enfoque Prioritario",
+    "correo_destinatario": "Correo Destinatario",
+}
+
+
+def _es_vacio(value: Any) -> bool:
+    """Strings vacíos, 'null' y 'undefined' cuentan como valores ausentes."""
+    return isinstance(value, str) and value.strip().lower() in ("", "null", "none", "undefined")
+
+
+class DatosFormulario(BaseModel):
+    """Esquema de los campos obligatorios del formulario inicial."""
+
+    model_config = ConfigDict(extra="ignore", str_strip_whitespace=True)
+
+    nombre_empresa: str = Field(min_length=1)
+    numero_empleados: int = Field(gt=0)
+    codigo_ciiu: str = Field(min_length=1)
+    aportes_mensuales: float = Field(gt=0)
+    porcentaje_reinversion: float = Field(gt=0, le=100)
+    enfoque_prioritario: str = Field(min_length=1)
+    correo_destinatario: str = Field(min_length=1)
+
+    @field_validator("*", mode="before")
+    @classmethod
+    def _vacio_a_none(cls, value: Any) -> Any:
+        """Trata strings vacíos, 'null' y 'undefined' como valores ausentes."""
+        return None if _es_vacio(value) else value
+
+    @field_validator("numero_empleados", mode="before")
+    @classmethod
+    def _entero(cls, value: Any) -> Any:
+        """
+        Acepta enteros, floats enteros (150.0) y strings de solo dígitos.
+        Rechaza separadores de miles ("1.000") en lugar de leerlos como decimales.
+        """
+        if isinstance(value, float) and value.is_integer():
+            return int(value)
+        if isinstance(value, str) and not _es_vacio(value) and not re.fullmatch(r"[0-9]+", value.strip()):
+            raise ValueError("debe ser un número entero sin separadores de miles")
+        return value
+
+    @field_validator("codigo_ciiu", mode="before")
+    @classmethod
+    def _ciiu_a_str(cls, value: Any) -> Any:
+        """Acepta el código CIIU como número (entero o float entero, 4530.0) o string."""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        if isinstance(value, int) and not isinstance(value, bool):
+            return str(value)
+        return value
+
+
+def validar_datos_entrada(datos: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida los datos del formulario sin llamar al LLM.
+
+    Args:
+        datos: Datos del formulario inicial
+
+    Returns:
+        Diccionario con la misma estructura del agente recolector:
+        datos_faltantes, proximo_paso y mensaje, más datos_invalidos
+        (campos con un valor que no cumple el esquema)
+    """
+    faltantes = set()
+    invalidos = set()
+    try:
+        DatosFormulario.model_validate(datos or {})
+    except ValidationError as e:
+        for error in e.errors():
+            if not error.get("loc"):
+                # Error sin campo: el payload no es un objeto, faltan todos los campos
+                faltantes.update(NOMBRES_CAMPOS)
+            elif error["type"] == "missing" or error.get("input") is None:
+                faltantes.add(str(error["loc"][0]))
+            else:
+                invalidos.add(str(error["loc"][0]))
+
+    datos_faltantes: List[str] = [campo for campo in NOMBRES_CAMPOS if campo in faltantes]
+    datos_invalidos: List[str] = [campo for campo in NOMBRES_CAMPOS if campo in invalidos]
+
+    if datos_faltantes or datos_invalidos:
+        partes = []
+        if datos_faltantes:
+            nombres = ", ".join(NOMBRES_CAMPOS[campo] for campo in datos_faltantes)
+            partes.append(f"Faltan los siguientes datos obligatorios: {nombres}.")
+        if datos_invalidos:
+            nombres = ", ".join(NOMBRES_CAMPOS[campo] for campo in datos_invalidos)
+            partes.append(f"Los siguientes datos no son válidos: {nombres}.")
+        return {
+            "datos_faltantes": datos_faltantes,
+            "datos_invalidos": datos_invalidos,
+            "proximo_paso": "solicitar_datos_faltantes",
+            "mensaje": " ".join(partes) + (
+                " Por favor completa el formulario." if datos_faltantes else " Por favor corrige el formulario."
+            )
+        }
+
+    return {
+        "datos_faltantes": [],
+        "datos_invalidos": [],
+        "proximo_paso": "perfilamiento_cliente",
+        "mensaje": ""
+    }
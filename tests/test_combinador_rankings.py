@@ -0,0 +1,89 @@
+from src.services.combinador_rankings import combinar_rankings
+from src.services.optimizador_presupuesto import MAX_PRODUCTOS_POR_SECCION, asignar_presupuesto
+
+
+SECCIONES = ("productos_obligatorios", "productos_prioritarios", "valores_agregados")
+
+
+def _productos(prefijo, n, categoria="DIFERENCIAL"):
+    return [
+        {
+            "id": f"{prefijo}{i}",
+            "categoria_de_programas": categoria,
+            "descripcion_programas_de_prevencion": f"{prefijo} {i}",
+            "valor_hora_aliado_basico": 100000,
+        }
+        for i in range(n)
+    ]
+
+
+def _ids(productos):
+    return [p["id"] for p in productos]
+
+
+def test_profesionales_entran_aunque_diferencial_llene_la_seccion():
+    parciales = {
+        "obligatorios": {"productos_obligatorios": _productos("d", 30)},
+        "prioritarios": {"productos_prioritarios": _productos("p", 5)},
+        "valores_agregados": {"valores_agregados": _productos("v", 3, "VALOR AGREGADO")},
+        "profesionales": {
+            "productos_obligatorios": _productos("pro", 2, "Profesionales"),
+            "productos_prioritarios": [],
+        },
+    }
+
+    secciones = combinar_rankings(parciales, SECCIONES)
+
+    obligatorios = _ids(secciones["productos_obligatorios"])
+    assert len(obligatorios) == MAX_PRODUCTOS_POR_SECCION
+    assert {"pro0", "pro1"} <= set(obligatorios)
+    # Intercalados por posición relativa, no al final de la sección
+    assert obligatorios.index("pro0") < obligatorios.index("d15")
+    assert obligatorios[-1] != "pro1"
+    # Los descartados son los últimos de DIFERENCIAL
+    assert "d29" not in obligatorios and "d28" not in obligatorios
+
+
+def test_profesionales_reciben_horas_minimas_con_presupuesto_escaso():
+    parciales = {
+        "obligatorios": {"productos_obligatorios": _productos("d", 30)},
+        "profesionales": {"productos_obligatorios": _productos("pro", 1, "Profesionales")},
+    }
+
+    secciones = combinar_rankings(parciales, SECCIONES)
+    # Alcanza para las horas mínimas (4 h) de 16 de los 31 productos
+    resultado = asignar_presupuesto(
+        productos_obligatorios=secciones["productos_obligatorios"],
+        productos_prioritarios=secciones["productos_prioritarios"],
+        valores_agregados=[],
+        presupuesto_anual=16 * 4 * 100000,
+    )
+
+    assert "pro0" in _ids(resultado["productos_obligatorios"])
+
+
+def test_sin_duplicados_entre_secciones_y_orden_estable():
+    repetido = _productos("x", 1)[0]
+    parciales = {
+        "obligatorios": {"productos_obligatorios": [repetido, *_productos("d", 2)]},
+        "prioritarios": {"productos_prioritarios": [repetido, *_productos("p", 2)]},
+    }
+
+    secciones = combinar_rankings(parciales, SECCIONES)
+
+    assert _ids(secciones["productos_obligatorios"]) == ["x0", "d0", "d1"]
+    assert _ids(secciones["productos_prioritarios"]) == ["p0", "p1"]
+    assert secciones["valores_agregados"] == []
+    assert combinar_rankings(parciales, SECCIONES) == secciones
+
+
+def test_cupos_reservados_no_superan_el_tope():
+    parciales = {
+        "obligatorios": {"productos_obligatorios": _productos("d", 40)},
+        "profesionales": {"productos_obligatorios": _productos("pro", 10, "Profesionales")},
+    }
+
+    obligatorios = _ids(combinar_rankings(parciales, SECCIONES, {"profesionales": 50})["productos_obligatorios"])
+
+    assert len(obligatorios) == MAX_PRODUCTOS_POR_SECCION
+    assert all(f"pro{i}" in obligatorios for i in range(10))
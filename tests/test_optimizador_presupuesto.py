@@ -0,0 +1,52 @@
+from src.services.optimizador_presupuesto import (
+    _LIMITE_BITS_AJUSTE, _ajustar_saldo, _Asignacion, asignar_presupuesto
+)
+
+
+def _productos(n, tarifa):
+    return [
+        {
+            "id": f"d{i}",
+            "categoria_de_programas": "DIFERENCIAL",
+            "descripcion_programas_de_prevencion": f"Programa {i}",
+            "valor_hora_aliado_basico": tarifa,
+        }
+        for i in range(n)
+    ]
+
+
+def test_saldo_mayor_que_los_maximos_no_recorre_el_bitset():
+    resultado = asignar_presupuesto(_productos(30, 1), [], [], presupuesto_anual=1_000_000_000)
+
+    assert all(p["horas_asignadas"] == 160 for p in resultado["productos_obligatorios"])
+    assert resultado["resumen_presupuesto"]["saldo_restante"] == 1_000_000_000 - 30 * 160
+
+
+def test_saldo_fuera_del_bitset_no_se_ajusta():
+    asignacion = _Asignacion("productos_obligatorios", {}, "valor_hora_aliado_basico", 1, 4, 160)
+    asignacion.horas = 4
+    saldo = _LIMITE_BITS_AJUSTE
+
+    # Con saldo // mcd >= _LIMITE_BITS_AJUSTE el ajuste retorna sin construir el bitset
+    assert _ajustar_saldo([asignacion], saldo) == saldo
+    assert asignacion.horas == 4
+
+
+def test_ajuste_exacto_no_excede_el_presupuesto():
+    resultado = asignar_presupuesto(_productos(3, 70_000), [], [], presupuesto_anual=1_000_000)
+
+    resumen = resultado["resumen_presupuesto"]
+    assert 0 <= resumen["saldo_restante"] < 70_000
+
+
+def test_productos_sin_presupuesto_para_el_minimo_se_reportan():
+    # Alcanza para las horas mínimas (4 h) de 2 de los 3 productos
+    resultado = asignar_presupuesto(_productos(3, 100_000), [], [], presupuesto_anual=2 * 4 * 100_000)
+
+    assert [p["id"] for p in resultado["productos_obligatorios"]] == ["d0", "d1"]
+    assert resultado["productos_omitidos"] == [{
+        "id": "d2",
+        "seccion": "productos_obligatorios",
+        "descripcion_programas_de_prevencion": "Programa 2",
+        "motivo": "presupuesto_insuficiente",
+    }]
@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from src.services.parser_json_incremental import ParserListasJSON
+
+
+RESPUESTA = {
+    "productos_obligatorios": [
+        {"id": "a1", "nota": "línea 1\nlínea 2 \"citada\" \\ fin"},
+        {"id": "a2", "anidado": {"lista": [1, 2, {"x": "}]"}]}},
+    ],
+    "valores_agregados": ["v\"1", "v\\u00e9", "é\t2"],
+    "clave\"rara": ["no se entrega"],
+    "proximo_paso": "generar_propuesta_final",
+}
+
+
+def _alimentar(texto, tamano):
+    parser = ParserListasJSON(("productos_obligatorios", "valores_agregados"))
+    elementos = []
+    for i in range(0, len(texto), tamano):
+        elementos.extend(parser.alimentar(texto[i:i + tamano]))
+    return parser, elementos
+
+
+@pytest.mark.parametrize("tamano", [1, 3, 7, 1000])
+def test_elementos_decodificados_con_escapes_en_cualquier_particion(tamano):
+    texto = json.dumps(RESPUESTA, ensure_ascii=True)
+
+    parser, elementos = _alimentar(texto, tamano)
+
+    assert elementos == [
+        ("productos_obligatorios", RESPUESTA["productos_obligatorios"][0]),
+        ("productos_obligatorios", RESPUESTA["productos_obligatorios"][1]),
+        ("valores_agregados", "v\"1"),
+        ("valores_agregados", "v\\u00e9"),
+        ("valores_agregados", "é\t2"),
+    ]
+    assert json.loads(parser.texto) == RESPUESTA
+
+
+def test_clave_con_escape_unicode_se_reconoce():
+    texto = '{"valores_\\u0061gregados": ["x"]}'
+
+    _, elementos = _alimentar(texto, 4)
+
+    assert elementos == [("valores_agregados", "x")]
@@ -0,0 +1,49 @@
+import pytest
+
+from src.services.validador_datos import NOMBRES_CAMPOS, validar_datos_entrada
+
+
+@pytest.mark.parametrize("datos", [[1], "x", 7])
+def test_payload_que_no_es_objeto_no_es_valido(datos):
+    resultado = validar_datos_entrada(datos)
+
+    assert resultado["proximo_paso"] == "solicitar_datos_faltantes"
+    assert resultado["datos_faltantes"] == list(NOMBRES_CAMPOS)
+
+
+DATOS = {
+    "nombre_empresa": "EMPRESA",
+    "numero_empleados": 150,
+    "codigo_ciiu": "4530",
+    "aportes_mensuales": 8000000,
+    "porcentaje_reinversion": 20,
+    "enfoque_prioritario": "Seguridad Industrial",
+    "correo_destinatario": "a@b.c",
+}
+
+
+@pytest.mark.parametrize("campo, valor", [
+    ("numero_empleados", 150.0),
+    ("numero_empleados", " 150 "),
+    ("codigo_ciiu", 4530.0),
+])
+def test_acepta_numeros_enteros_como_float_o_string(campo, valor):
+    resultado = validar_datos_entrada({**DATOS, campo: valor})
+
+    assert resultado["proximo_paso"] == "perfilamiento_cliente"
+
+
+@pytest.mark.parametrize("valor", ["1.000", "1,000", 1.5])
+def test_separadores_de_miles_son_invalidos_no_faltantes(valor):
+    resultado = validar_datos_entrada({**DATOS, "numero_empleados": valor})
+
+    assert resultado["datos_faltantes"] == []
+    assert resultado["datos_invalidos"] == ["numero_empleados"]
+    assert "no son válidos: Número de Empleados" in resultado["mensaje"]
+
+
+def test_valor_vacio_se_reporta_como_faltante():
+    resultado = validar_datos_entrada({**DATOS, "numero_empleados": ""})
+
+    assert resultado["datos_faltantes"] == ["numero_empleados"]
+    assert resultado["datos_invalidos"] == []